@@ -0,0 +1,427 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from analysis_manager import load_compact_graph, GRAPH_JSON_PATH, GRAPH_CACHE_PATH, PARTITION_CACHE_PATH, LOG_FORMAT
+from pipeline_tools.cluster_analysis.cluster_identification import identify_clusters, ClusteringAlgorithm
+from pipeline_tools.cluster_analysis.partition_cache import PartitionCache
+from pipeline_tools.utils.utils import file_content_hash
+from results.cluster import ClustersInformation
+from results.compact_graph import CompactGraph
+from results.integration_index import IntegrationPointIndex
+from results.serializers import serialize_edge, serialize_integration_point
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+class RequestError(Exception):
+    '''Error of a query, answered with its HTTP status.'''
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+class ClusteringView:
+    '''
+    Clusters of one algorithm on the graph of a snapshot, with the indexes of the queries:
+    the cluster of every class, the clusters by id, the inter-cluster edges touching every cluster
+    and the integration point index of the clusters.
+    '''
+    def __init__(self, algorithm: ClusteringAlgorithm, algorithm_options: dict, clusters: ClustersInformation) -> None:
+        self.algorithm = algorithm
+        self.algorithm_options = algorithm_options
+        self.clusters = clusters
+        self.clusters_by_id = {cluster.id: cluster for cluster in clusters.clusters}
+        self.node_clusters = {node.name: cluster.id for cluster in clusters.clusters for node in cluster.nodes}
+        self.inter_cluster_edge_ids: dict[int, list[int]] = dict()
+        for edge_id, edge in enumerate(clusters.inter_cluster_edges):
+            self.inter_cluster_edge_ids.setdefault(self.node_clusters[edge.source.name], list()).append(edge_id)
+            self.inter_cluster_edge_ids.setdefault(self.node_clusters[edge.destination.name], list()).append(edge_id)
+        self.integration_index = IntegrationPointIndex.from_clusters(clusters)
+
+    def summary(self):
+        return {
+            'algorithm': self.algorithm.name,
+            'algorithm_options': self.algorithm_options,
+            'number_of_clusters': len(self.clusters.clusters),
+            'number_of_inter_cluster_edges': len(self.clusters.inter_cluster_edges),
+        }
+
+class GraphSnapshot:
+    '''
+    A graph.json loaded in memory: its compact graph, its Graph view, its neighbors and its clusterings.
+    The neighbors of every node are the collapsed edges in CSR form, outgoing and incoming.
+    '''
+    def __init__(self, compact_graph: CompactGraph, graph_hash: bytes, file_signature) -> None:
+        self.compact_graph = compact_graph
+        self.graph_hash = graph_hash
+        # Modification time and size of graph.json when it was read, to detect a change without hashing it
+        self.file_signature = file_signature
+        self.loaded_at = time.time()
+        self.graph_repr = compact_graph.graph_view()
+        self.clusterings: dict[ClusteringAlgorithm, ClusteringView] = dict()
+
+        collapsed_edges = compact_graph.collapsed_edges()
+        self.adjacency = dict()
+        for direction, nodes, neighbors in (('out', collapsed_edges.src, collapsed_edges.dst), ('in', collapsed_edges.dst, collapsed_edges.src)):
+            order = np.argsort(nodes, kind='stable')
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(nodes, minlength=compact_graph.num_nodes))))
+            self.adjacency[direction] = (offsets, neighbors[order], collapsed_edges.weight[order])
+
+    def neighbors(self, name: str, direction='out'):
+        '''Returns the neighbors of a node as (name, weight) pairs, the weight summing the calls between them.'''
+        node_id = self.compact_graph.node_ids[name]
+        offsets, neighbors, weights = self.adjacency[direction]
+        start, end = offsets[node_id], offsets[node_id + 1]
+        node_names = self.compact_graph.node_names
+        return [(node_names[neighbor], weight) for neighbor, weight in zip(neighbors[start:end].tolist(), weights[start:end].tolist())]
+
+class AnalysisDaemon:
+    '''
+    Resident analysis of one system: the graph and the clusters of the given algorithms are loaded once and queried
+    over HTTP, on a TCP port or a Unix socket. graph.json is polled, and once its content changed and it has kept
+    the same modification time and size for a poll interval, a new snapshot is loaded and clustered in a worker thread
+    while the current one keeps answering; it is then swapped in. The clusters are looked up in the partition cache
+    of the system, keyed on the graph, the algorithm and its options, so the analyses with the same options share them.
+    '''
+    def __init__(self, data_path: str, clustering_algorithms: list[ClusteringAlgorithm], poll_interval=1.0, use_partition_cache=True) -> None:
+        self.data_path = data_path
+        self.graph_path = os.path.join(data_path, GRAPH_JSON_PATH)
+        self.graph_cache_path = os.path.join(data_path, GRAPH_CACHE_PATH)
+        self.default_algorithm = clustering_algorithms[0]
+        # Options of every clustered algorithm, kept for the snapshots loaded on later changes of graph.json
+        self.algorithm_options: dict[ClusteringAlgorithm, dict] = {algorithm: dict() for algorithm in clustering_algorithms}
+        self.partition_cache = PartitionCache(os.path.join(data_path, PARTITION_CACHE_PATH)) if use_partition_cache else None
+        self.poll_interval = poll_interval
+        self.snapshot: GraphSnapshot = None
+        self.number_of_reloads = 0
+        # Signature of graph.json at the previous poll, a change is only loaded once it is the same for two polls
+        self._polled_signature = None
+        # Signature of the last graph.json that could not be loaded, not retried until it changes again
+        self._failed_signature = None
+        self.last_reload_error: str = None
+        # Reloads and reclusterings run one at a time
+        self._update_lock = asyncio.Lock()
+        self.routes = {
+            ('GET', '/status'): self.status,
+            ('GET', '/class'): self.query_class,
+            ('GET', '/cluster'): self.query_cluster,
+            ('GET', '/neighbors'): self.query_neighbors,
+            ('GET', '/inter_cluster_edges'): self.query_inter_cluster_edges,
+            ('POST', '/integration_points'): self.query_integration_points,
+            ('POST', '/recluster'): self.recluster,
+            ('POST', '/reload'): self.reload,
+        }
+
+    def _file_signature(self):
+        stat = os.stat(self.graph_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load_snapshot(self) -> GraphSnapshot:
+        '''Loads graph.json and the clusters of every algorithm. Blocking, run in a worker thread.'''
+        file_signature = self._file_signature()
+        compact_graph, graph_hash = load_compact_graph(self.graph_path, self.graph_cache_path)
+        snapshot = GraphSnapshot(compact_graph, graph_hash, file_signature)
+        for algorithm, algorithm_options in self.algorithm_options.items():
+            snapshot.clusterings[algorithm] = self.cluster(snapshot, algorithm, algorithm_options)
+        logging.info(f'Snapshot of {self.graph_path} loaded: {compact_graph}')
+        return snapshot
+
+    def cluster(self, snapshot: GraphSnapshot, algorithm: ClusteringAlgorithm, algorithm_options: dict) -> ClusteringView:
+        '''Clusters the graph of a snapshot. Blocking, run in a worker thread.'''
+        clusters = identify_clusters(snapshot.compact_graph, algorithm, cache=self.partition_cache, **algorithm_options)
+        return ClusteringView(algorithm, algorithm_options, clusters)
+
+    async def reload_if_changed(self, force=False):
+        '''
+        Loads a new snapshot if the content of graph.json changed, or always with force. Returns whether it did.
+        Without force, a change is only loaded once graph.json kept its modification time and size since the previous
+        poll. A graph.json that cannot be loaded completely, e.g. while it is being written, leaves the current snapshot
+        in place and is not retried before it changes again.
+        '''
+        async with self._update_lock:
+            file_signature = None
+            try:
+                file_signature = self._file_signature()
+                if not force:
+                    polled_signature, self._polled_signature = self._polled_signature, file_signature
+                    if file_signature == self.snapshot.file_signature or file_signature == self._failed_signature:
+                        return False
+                    if file_signature != polled_signature:
+                        # Changed since the previous poll, it may still be being written
+                        return False
+                graph_hash = await asyncio.to_thread(file_content_hash, self.graph_path)
+                if not force and graph_hash == self.snapshot.graph_hash:
+                    self.snapshot.file_signature = file_signature
+                    self.last_reload_error = None
+                    return False
+                logging.info(f'{self.graph_path} changed, loading a new snapshot.')
+                snapshot = await asyncio.to_thread(self.load_snapshot)
+                if snapshot.file_signature != self._file_signature():
+                    raise ValueError(f'{self.graph_path} changed while it was loaded.')
+                self.snapshot = snapshot
+                self.number_of_reloads += 1
+                self._failed_signature = None
+                self.last_reload_error = None
+                return True
+            except Exception as e:
+                self._failed_signature = file_signature
+                # A missing graph.json fails on every poll, logged once
+                if str(e) != self.last_reload_error:
+                    logging.error(f'Graph {self.graph_path} could not be reloaded, the current snapshot is kept. Error: {e}')
+                self.last_reload_error = str(e)
+                return False
+
+    async def watch_graph(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self.reload_if_changed()
+
+    def _clustering(self, params):
+        name = params.get('algorithm', self.default_algorithm.name)
+        try:
+            algorithm = ClusteringAlgorithm[name]
+        except KeyError:
+            raise RequestError(400, f'Unknown clustering algorithm {name}.')
+        clustering = self.snapshot.clusterings.get(algorithm)
+        if clustering is None:
+            raise RequestError(404, f'No clusters of {name}, POST /recluster with this algorithm first.')
+        return clustering
+
+    @staticmethod
+    def _required(params, name):
+        value = params.get(name)
+        if value is None:
+            raise RequestError(400, f'Missing parameter {name}.')
+        return value
+
+    @staticmethod
+    def _cluster_id(params, name):
+        try:
+            return int(AnalysisDaemon._required(params, name))
+        except (TypeError, ValueError):
+            raise RequestError(400, f'Parameter {name} must be a cluster id.')
+
+    def _node(self, params):
+        name = self._required(params, 'name')
+        if name not in self.snapshot.compact_graph.node_ids:
+            raise RequestError(404, f'No class {name} in the graph.')
+        return name
+
+    def status(self, params):
+        snapshot = self.snapshot
+        return {
+            'data_path': self.data_path,
+            'graph_hash': snapshot.graph_hash.hex() if snapshot.graph_hash is not None else None,
+            'loaded_at': snapshot.loaded_at,
+            'number_of_reloads': self.number_of_reloads,
+            'last_reload_error': self.last_reload_error,
+            'number_of_nodes': snapshot.compact_graph.num_nodes,
+            'number_of_edges': snapshot.compact_graph.num_edges,
+            'clusterings': [clustering.summary() for clustering in snapshot.clusterings.values()],
+        }
+
+    def query_class(self, params):
+        name = self._node(params)
+        clustering = self._clustering(params)
+        return {
+            'name': name,
+            'cluster': clustering.node_clusters[name],
+            'number_of_outgoing_neighbors': len(self.snapshot.neighbors(name, 'out')),
+            'number_of_incoming_neighbors': len(self.snapshot.neighbors(name, 'in')),
+        }
+
+    def query_cluster(self, params):
+        clustering = self._clustering(params)
+        cluster_id = self._cluster_id(params, 'id')
+        cluster = clustering.clusters_by_id.get(cluster_id)
+        if cluster is None:
+            raise RequestError(404, f'No cluster {cluster_id}.')
+        return {
+            'id': cluster.id,
+            'nodes': [node.name for node in cluster.nodes],
+            'number_of_intra_cluster_edges': len(cluster.intra_cluster_edges),
+            'number_of_inter_cluster_edges': len(clustering.inter_cluster_edge_ids.get(cluster.id, ())),
+        }
+
+    def query_neighbors(self, params):
+        name = self._node(params)
+        clustering = self._clustering(params)
+        direction = params.get('direction', 'both')
+        if direction not in ('out', 'in', 'both'):
+            raise RequestError(400, 'Parameter direction must be out, in or both.')
+        neighbors = dict()
+        for neighbor_direction in (('out', 'in') if direction == 'both' else (direction,)):
+            neighbors[neighbor_direction] = [{'name': neighbor, 'weight': weight, 'cluster': clustering.node_clusters[neighbor]}
+                                             for neighbor, weight in self.snapshot.neighbors(name, neighbor_direction)]
+        return {'name': name, 'cluster': clustering.node_clusters[name], **neighbors}
+
+    def query_inter_cluster_edges(self, params):
+        clustering = self._clustering(params)
+        cluster_id = self._cluster_id(params, 'cluster')
+        if cluster_id not in clustering.clusters_by_id:
+            raise RequestError(404, f'No cluster {cluster_id}.')
+        edges = clustering.clusters.inter_cluster_edges
+        return {
+            'cluster': cluster_id,
+            'inter_cluster_edges': [serialize_edge(edges[edge_id]) for edge_id in clustering.inter_cluster_edge_ids.get(cluster_id, ())],
+        }
+
+    def query_integration_points(self, params):
+        clustering = self._clustering(params)
+        points = clustering.integration_index.query(params.get('changed_files', ()), params.get('classes', ()), params.get('methods', ()),
+                                                    params.get('cluster_pair'), nested=not params.get('exact', False))
+        return {'integration_points': [serialize_integration_point(point) for point in points]}
+
+    async def recluster(self, params):
+        '''Clusters the current graph with an algorithm and options, which later snapshots keep using.'''
+        name = self._required(params, 'algorithm')
+        try:
+            algorithm = ClusteringAlgorithm[name]
+        except KeyError:
+            raise RequestError(400, f'Unknown clustering algorithm {name}.')
+        algorithm_options = params.get('options') or dict()
+        if not isinstance(algorithm_options, dict):
+            raise RequestError(400, 'Parameter options must be an object of algorithm options.')
+        async with self._update_lock:
+            snapshot = self.snapshot
+            try:
+                clustering = await asyncio.to_thread(self.cluster, snapshot, algorithm, algorithm_options)
+            except TypeError as e:
+                raise RequestError(400, f'Invalid options for {name}: {e}')
+            snapshot.clusterings[algorithm] = clustering
+            self.algorithm_options[algorithm] = algorithm_options
+        return clustering.summary()
+
+    async def reload(self, params):
+        reloaded = await self.reload_if_changed(force=bool(params.get('force', False)))
+        return {'reloaded': reloaded, 'graph_hash': self.snapshot.graph_hash.hex() if self.snapshot.graph_hash is not None else None}
+
+    async def dispatch(self, method: str, target: str, body: bytes):
+        '''Answers a request with its status and JSON payload. GET parameters are in the query string, POST ones in a JSON body.'''
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.routes):
+                return 405, {'error': f'{method} is not supported on {url.path}.'}
+            return 404, {'error': f'Unknown path {url.path}.'}
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if body:
+                try:
+                    body_params = json.loads(body)
+                except ValueError:
+                    raise RequestError(400, 'The body of the request must be JSON.')
+                if not isinstance(body_params, dict):
+                    raise RequestError(400, 'The body of the request must be a JSON object.')
+                params.update(body_params)
+            payload = handler(params)
+            if asyncio.iscoroutine(payload):
+                payload = await payload
+            return 200, payload
+        except RequestError as e:
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            logging.exception(f'Request {method} {target} failed.')
+            return 500, {'error': str(e)}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''Serves the HTTP/1.1 requests of a connection, kept alive until the client closes it or asks to.'''
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    body = await reader.readexactly(int(headers.get('content-length', 0)))
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Malformed request.'}, keep_alive=False)
+                    break
+                status, payload = await self.dispatch(method, target, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool):
+        body = json.dumps(payload).encode('utf-8')
+        head = (f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8765, socket_path=None):
+        '''Loads the first snapshot, then answers queries until SIGINT or SIGTERM.'''
+        self.snapshot = await asyncio.to_thread(self.load_snapshot)
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+            logging.info(f'Analysis daemon listening on {socket_path}.')
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            logging.info(f'Analysis daemon listening on http://{host}:{port}.')
+
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stopped.set)
+            except (NotImplementedError, RuntimeError):
+                # No signal handlers on the Windows event loop, KeyboardInterrupt stops the daemon there
+                pass
+        watcher = asyncio.create_task(self.watch_graph())
+        try:
+            async with server:
+                await stopped.wait()
+        finally:
+            watcher.cancel()
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+        logging.info('Analysis daemon stopped.')
+
+def main():
+    '''
+    This keeps the graph and the clusters of a system in memory and answers queries on them over HTTP,
+    reloading them when graph.json changes.
+    '''
+    parser = argparse.ArgumentParser(description='Serve the graph and clusters of a system to local queries.')
+    parser.add_argument('--data-path', required=True, help='Data directory of the system, e.g. ./thesis_code/data/joda_time.')
+    parser.add_argument('--algorithms', nargs='+', default=[ClusteringAlgorithm.LOUVAIN.name],
+                        choices=[algorithm.name for algorithm in ClusteringAlgorithm],
+                        help='Clustering algorithms loaded at start, the first one answers the queries without an algorithm.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on.')
+    parser.add_argument('--socket', help='Unix socket to listen on instead of a TCP port.')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between two checks of graph.json for changes.')
+    parser.add_argument('--no-partition-cache', action='store_true', help='Always run the clustering algorithms.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    daemon = AnalysisDaemon(args.data_path, [ClusteringAlgorithm[name] for name in args.algorithms],
+                            poll_interval=args.poll_interval, use_partition_cache=not args.no_partition_cache)
+    try:
+        asyncio.run(daemon.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -1,160 +1,444 @@
+import json
 import os
 import logging
-from pipeline_tools.graph_modeling.uml_parsing import graph_json_to_object
-from pipeline_tools.cluster_analysis.cluster_identification import identify_clusters, ClusteringAlgorithm
-from pipeline_tools.utils.utils import check_or_create_path
-from results.serializers import serialize_clusters_information, serialize_graph
-from plotting.plot_graph_pyvis import plot_graphs_pyvis
-from results.graph import Graph
+import struct
+from contextlib import contextmanager
+from pipeline_tools.graph_modeling.uml_parsing import graph_json_to_compact_graph
+from pipeline_tools.cluster_analysis.cluster_identification import identify_clusters, build_clusters_information, partition_modularity, ClusteringAlgorithm
+from pipeline_tools.cluster_analysis.clustering_sweep import ClusteringSweep
+from pipeline_tools.cluster_analysis.component_sharding import ComponentSharding
+from pipeline_tools.cluster_analysis.partition_cache import PartitionCache
+from pipeline_tools.cluster_analysis.incremental_clustering import diff_graphs, recluster_incrementally, clusters_delta, DEFAULT_SEEDS
+from pipeline_tools.cluster_analysis.hierarchical_clustering import identify_cluster_tree, clusters_information_at_level
+from pipeline_tools.utils.utils import check_or_create_path, file_content_hash
+from pipeline_tools.utils.profiling import StageProfiler, set_active_profiler, stage, cprofile_to
+from results.serializers import write_clusters_information, write_graph, serialize_clusters_delta, serialize_cluster_tree
 from results.cluster import ClustersInformation
+from results.compact_graph import CompactGraph
+from results.analysis_metrics import AnalysisMetrics
+from results.binary_cache import read_compact_graph, read_graph_hash, write_compact_graph, read_partition, write_partition, write_integration_index
+from results.integration_index import IntegrationPointIndex
 
+GRAPH_JSON_PATH = 'graph/graph.json'
+GRAPH_CACHE_PATH = 'graph/graph.bin'
+PARTITION_CACHE_PATH = 'clusters/partition_cache'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+CLUSTERS_DIRECTORIES = {
+    ClusteringAlgorithm.LOUVAIN: 'clusters/louvain',
+    ClusteringAlgorithm.GIRVAN_NEWMAN: 'clusters/girvan_newman',
+    ClusteringAlgorithm.LEIDEN: 'clusters/leiden',
+    ClusteringAlgorithm.PARALLEL_LOUVAIN: 'clusters/parallel_louvain',
+}
+
+def clusters_directory(data_path: str, clustering_algorithm: ClusteringAlgorithm):
+    '''Directory of the clusters report, caches and logs of a clustering algorithm.'''
+    directory = CLUSTERS_DIRECTORIES.get(clustering_algorithm)
+    if directory is None:
+        raise Exception('Unknown clustering algorithm.')
+    return os.path.join(data_path, directory)
+
+def load_compact_graph(graph_path: str, graph_cache_path: str):
+    '''
+    Load the compact graph of a graph.json, from the binary cache if it was built from the current content of graph.json.
+    Otherwise graph.json is parsed and the cache is refreshed. Returns the compact graph and the hash of graph.json.
+    Raises a ValueError (or an OSError) when graph.json cannot be parsed completely or changes while it is parsed,
+    e.g. while it is being written, so that a partial graph is neither cached nor clustered.
+    '''
+    graph_hash = file_content_hash(graph_path)
+    compact_graph = None
+    if graph_hash is not None:
+        try:
+            with stage('graph_cache'):
+                compact_graph = read_compact_graph(graph_cache_path, graph_hash)
+        except (OSError, ValueError, struct.error) as e:
+            logging.warning(f'Binary graph cache {graph_cache_path} could not be read. Error: {e}')
+
+    if compact_graph is not None:
+        logging.info('Graph loaded from the binary graph cache.')
+    else:
+        with stage('parsing'):
+            compact_graph = graph_json_to_compact_graph(graph_path, strict=True)
+        if file_content_hash(graph_path) != graph_hash:
+            raise ValueError(f'{graph_path} changed while it was parsed.')
+        if graph_hash is not None:
+            with stage('graph_cache'):
+                write_compact_graph(compact_graph, graph_cache_path, graph_hash)
+            logging.info('Binary graph cache saved.')
+
+    return compact_graph, graph_hash
 
 class AnalysisManager:
-    def __init__(self, data_path: str, clustering_algorithm : ClusteringAlgorithm = ClusteringAlgorithm.LOUVAIN):
+    def __init__(self, data_path: str, clustering_algorithm : ClusteringAlgorithm = ClusteringAlgorithm.LOUVAIN, algorithm_options: dict = None,
+                 sweep: ClusteringSweep = None, sharding: ComponentSharding = None, incremental=False, hierarchical=False,
+                 use_partition_cache=True, plot=True, trace_memory=False, profile_clustering=False):
         self.clustering_algorithm = clustering_algorithm
+        # Extra keyword arguments for the clustering algorithm (e.g. patience for Girvan-Newman)
+        self.algorithm_options = algorithm_options or dict()
+        # Optional sweep over seeds and resolutions, keeping the partition with the highest modularity
+        self.sweep = sweep
+        # Optional sharding: the weakly connected components are clustered separately on a process pool
+        self.sharding = sharding
+        # Incremental mode: re-optimise the previous partition around the changes of the graph
+        self.incremental = incremental
+        # Hierarchical mode: keep the clusters of every aggregation level of Louvain or Leiden in a cluster tree
+        self.hierarchical = hierarchical
+        if hierarchical and (sweep is not None or sharding is not None or incremental):
+            raise ValueError('The hierarchical mode cannot be combined with a sweep, the sharding or the incremental mode.')
+        if sweep is not None and sharding is not None:
+            raise ValueError('A clustering sweep cannot be combined with the sharding into connected components.')
+        # Partitions of earlier runs, shared by the algorithms of the system and reused for the same graph and options
+        self.partition_cache = PartitionCache(os.path.join(data_path, PARTITION_CACHE_PATH)) if use_partition_cache else None
+        # Without plotting, matplotlib and pyvis are never imported
+        self.plot = plot
+        # Profiling: tracemalloc peaks for every stage, and a cProfile dump of the clustering step
+        self.trace_memory = trace_memory
+        self.profile_clustering = profile_clustering
         # Paths (just for information potentially for debugging or documentation when writing the text)
         self.data_path = data_path
         self._setup_paths()
         self._setup_logging()
         # Results objects produced during analysis
-        self.graph_repr = None
+        self.graph_hash = None
+        self.compact_graph = None
         self.clusters = None
+        self.clusters_delta = None
+        self.cluster_tree = None
+        self.metrics = None
+        self.profiler = None
+        self.previous_graph_hash = None
 
     def _setup_logging(self):
         clusters_dir = os.path.dirname(self.clusters_path)
         check_or_create_path(clusters_dir)
         log_file_path = os.path.join(clusters_dir, 'analysis.log')
-        logging.basicConfig(level=logging.INFO,
-                            format='%(asctime)s - %(levelname)s - %(message)s',
-                            filename=log_file_path,
-                            filemode='w')
+        # The log file handler of a previous analysis in the same process is replaced rather than
+        # configured once with logging.basicConfig, so that every run writes to its own analysis.log.
+        root_logger = logging.getLogger()
+        for handler in list(root_logger.handlers):
+            if getattr(handler, 'is_analysis_log', False):
+                root_logger.removeHandler(handler)
+                handler.close()
+        self.log_handler = logging.FileHandler(log_file_path, mode='w')
+        self.log_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.log_handler.is_analysis_log = True
+        root_logger.addHandler(self.log_handler)
+        root_logger.setLevel(logging.INFO)
         logging.info('Logging setup complete. Logs will be saved to {}'.format(log_file_path))
 
     def _setup_paths(self):
-        self.graph_path = os.path.join(self.data_path, 'graph/graph.json')
-        if self.clustering_algorithm == ClusteringAlgorithm.LOUVAIN:
-            self.clusters_path = os.path.join(self.data_path, 'clusters/louvain/clusters.json')
-        elif self.clustering_algorithm == ClusteringAlgorithm.GIRVAN_NEWMAN:
-            self.clusters_path = os.path.join(self.data_path, 'clusters/girvan_newman/clusters.json')
-        elif self.clustering_algorithm == ClusteringAlgorithm.LEIDEN:
-            self.clusters_path = os.path.join(self.data_path, 'clusters/leiden/clusters.json')
-        else:
-            raise Exception('Unknown clustering algorithm.')
+        self.graph_path = os.path.join(self.data_path, GRAPH_JSON_PATH)
+        self.graph_cache_path = os.path.join(self.data_path, GRAPH_CACHE_PATH)
+        self.clusters_path = os.path.join(clusters_directory(self.data_path, self.clustering_algorithm), 'clusters.json')
+        self.clusters_cache_path = os.path.join(os.path.dirname(self.clusters_path), 'clusters.bin')
+        self.sweep_summary_path = os.path.join(os.path.dirname(self.clusters_path), 'sweep_summary.json')
+        # Snapshot of the graph the clusters cache was computed on, the previous graph of an incremental run
+        self.clustered_graph_cache_path = os.path.join(os.path.dirname(self.clusters_path), 'graph.bin')
+        self.clusters_delta_path = os.path.join(os.path.dirname(self.clusters_path), 'clusters_delta.json')
+        self.cluster_tree_path = os.path.join(os.path.dirname(self.clusters_path), 'cluster_tree.json')
+        self.metrics_path = os.path.join(os.path.dirname(self.clusters_path), 'metrics.json')
+        self.integration_index_path = os.path.join(os.path.dirname(self.clusters_path), 'integration_points.bin')
+        self.profile_path = os.path.join(os.path.dirname(self.clusters_path), 'profile.json')
+        self.clustering_cprofile_path = os.path.join(os.path.dirname(self.clusters_path), 'clustering.prof')
         clusters_dir = os.path.dirname(self.clusters_path)
         check_or_create_path(clusters_dir)
 
-    def save_graph_report(self):
-        '''Save detailed graph report to a file.'''
+    def load_graph(self):
+        '''Load the graph, from the binary cache if it was built from the current content of graph.json.'''
+        self.compact_graph, self.graph_hash = load_compact_graph(self.graph_path, self.graph_cache_path)
+
+    @property
+    def graph_repr(self):
+        '''
+        Object Graph view of the compact graph, shared by the clusters, the reports and the plots.
+        It is only built when one of them first needs it; the clustering algorithms run on the compact graph.
+        '''
+        if self.compact_graph is None:
+            return None
+        return self.compact_graph.graph_view()
+
+    def save_clusters_cache(self):
+        '''Save the partition of the graph into clusters to the binary clusters cache.'''
+        communities = [[self.compact_graph.node_ids[node.name] for node in cluster.nodes] for cluster in self.clusters.clusters]
+        write_partition(communities, self.clusters_cache_path, self.graph_hash)
+        logging.info('Binary clusters cache saved.')
+
+    def load_clusters(self):
+        '''Load the clusters from the binary clusters cache, if it was built from the current content of graph.json.'''
+        if self.compact_graph is None:
+            self.load_graph()
+        communities = None
+        if self.graph_hash is not None:
+            communities = read_partition(self.clusters_cache_path, self.graph_hash)
+        if communities is None:
+            raise Exception(f'No clusters cache for the current graph at {self.clusters_cache_path}, run the analysis first.')
+        node_names = self.compact_graph.node_names
+        self.clusters = build_clusters_information(self.graph_repr, [[node_names[node_id] for node_id in community] for community in communities])
+
+    def load_previous_clustering(self):
+        '''
+        Load the graph snapshot and the partition of the previous incremental run.
+        Returns the previous compact graph, its hash and its communities, or None if they are not available.
+        '''
+        previous_hash = read_graph_hash(self.clustered_graph_cache_path)
+        if previous_hash is None:
+            return None
+        try:
+            previous_graph = read_compact_graph(self.clustered_graph_cache_path, previous_hash)
+            communities = read_partition(self.clusters_cache_path, previous_hash)
+        except (OSError, ValueError, struct.error) as e:
+            logging.warning(f'Previous clustering could not be read. Error: {e}')
+            return None
+        if previous_graph is None or communities is None:
+            return None
+        node_names = previous_graph.node_names
+        return previous_graph, previous_hash, [[node_names[node_id] for node_id in community] for community in communities]
+
+    def identify_clusters_incrementally(self):
+        '''
+        Identify the clusters by re-optimising the partition of the previous run around the nodes that changed
+        since, and compute the delta of the clusters. Falls back to a full clustering when there is no previous run.
+        '''
+        previous = self.load_previous_clustering() if self.sweep is None else None
+        if previous is None or self.clustering_algorithm not in DEFAULT_SEEDS:
+            logging.info('No previous clustering to update, identifying the clusters from scratch.')
+            return identify_clusters(self.compact_graph, self.clustering_algorithm, sweep=self.sweep, cache=self.partition_cache,
+                                     sharding=self.sharding, **self.algorithm_options)
+
+        previous_graph, previous_hash, previous_communities = previous
+        diff = diff_graphs(previous_graph, self.compact_graph)
+        logging.info(str(diff))
+        if diff.is_empty():
+            communities_sets = previous_communities
+        else:
+            communities_sets = recluster_incrementally(self.compact_graph, self.clustering_algorithm, previous_communities, diff,
+                                                       seed=self.algorithm_options.get('seed'),
+                                                       resolution=self.algorithm_options.get('resolution'))
+        logging.info(f'Modularity of the clusters is: {partition_modularity(self.compact_graph, communities_sets)}')
+        clusters = build_clusters_information(self.graph_repr, communities_sets)
+
+        previous_clusters = build_clusters_information(previous_graph.to_graph(), previous_communities)
+        self.clusters_delta = clusters_delta(previous_clusters, clusters, diff)
+        self.previous_graph_hash = previous_hash
+        logging.info(str(self.clusters_delta))
+        return clusters
+
+    def save_clusters_delta(self):
+        '''Save the delta of the clusters of an incremental run, and the snapshot of the graph for the next one.'''
+        write_compact_graph(self.compact_graph, self.clustered_graph_cache_path, self.graph_hash)
+        if self.clusters_delta is None:
+            return
+        clusters_delta_info = serialize_clusters_delta(self.clusters_delta, self.previous_graph_hash.hex(), self.graph_hash.hex())
+        with open(self.clusters_delta_path, 'w') as clusters_delta_file:
+            clusters_delta_file.write(clusters_delta_info)
+        logging.info('Clusters delta saved.')
+
+    def identify_cluster_tree(self):
+        '''
+        Identify the clusters at every aggregation level of the clustering algorithm.
+        The clusters of the analysis are those of the final level.
+        '''
+        self.cluster_tree = identify_cluster_tree(self.compact_graph, self.clustering_algorithm, **self.algorithm_options)
+        with stage('edge_assignment'):
+            return clusters_information_at_level(self.compact_graph, self.cluster_tree, self.cluster_tree.number_of_levels)
+
+    def save_cluster_tree(self):
+        '''Save the clusters of every level of the hierarchical clustering and the level of every edge to a file.'''
+        with open(self.cluster_tree_path, 'w') as cluster_tree_file:
+            cluster_tree_file.write(serialize_cluster_tree(self.cluster_tree))
+        logging.info('Cluster tree saved.')
+
+    def level_clusters_path(self, level: int):
+        return os.path.join(os.path.dirname(self.clusters_path), f'clusters_level_{level}.json')
+
+    def save_level_clusters_report(self, level: int, indent=4, method_table=False):
+        '''
+        Save the clusters report of one level of the cluster tree, in the format of clusters.json, so the Java tools
+        can select the tests at a finer granularity than the final clusters. Requires a hierarchical analysis run in this process.
+        '''
+        if self.cluster_tree is None:
+            raise Exception('No cluster tree, run the analysis in hierarchical mode first.')
+        clusters = clusters_information_at_level(self.graph_repr, self.cluster_tree, level)
+        with open(self.level_clusters_path(level), 'w') as clusters_file:
+            write_clusters_information(clusters, clusters_file, indent, method_table)
+        logging.info(f'Clusters report of level {level} saved.')
+
+    def plot_clusters(self):
+        '''Save the pyvis plots of the clusters. The plotting libraries are only imported here.'''
+        from plotting.plot_graph_pyvis import plot_graphs_pyvis
+        logging.info('Saving Jupyter Notebooks for plotting the graph.')
+        with stage('plotting'):
+            plot_graphs_pyvis(os.path.dirname(self.clusters_path), self.clusters, self.graph_repr, single_node_cluster_color_black=True)
+
+    def save_graph_report(self, indent=4, method_table=False):
+        '''
+        Save detailed graph report to a file, streamed to the file. indent=None writes compact JSON, and
+        method_table writes every method once and references it by index from the edges.
+        '''
         directory = os.path.dirname(self.graph_path)
         check_or_create_path(directory)
-        graph_info = serialize_graph(self.graph_repr)
         with open(self.graph_path, 'w') as graph_file:
-            graph_file.write(graph_info)
+            write_graph(self.graph_repr, graph_file, indent, method_table)
         logging.info('Detailed graph report saved.')
 
-    def save_clusters_report(self):
-        '''Save detailed clusters report to a file.'''
-        directory = os.path.dirname(self.clusters_path)
-        check_or_create_path(directory)
-        clusters_info = serialize_clusters_information(self.clusters)
-        with open(self.clusters_path, 'w') as clusters_file:
-            clusters_file.write(clusters_info)
-        logging.info('Detailed clusters report saved.')
+    def save_clusters_report(self, indent=4, method_table=False):
+        '''
+        Save detailed clusters report to a file. This is the explicit export step producing the clusters.json
+        used by the Java TestReducer and MissingTestFinder; the clusters are read from the binary
+        clusters cache when the analysis was not run in this process.
+        The report is streamed to the file. indent=None writes compact JSON, and method_table writes every
+        method once and references it by index from the edges (not read by the Java tools).
+        '''
+        with self.profiling():
+            if self.clusters is None:
+                self.load_clusters()
+            directory = os.path.dirname(self.clusters_path)
+            check_or_create_path(directory)
+            with stage('serialization'), open(self.clusters_path, 'w') as clusters_file:
+                write_clusters_information(self.clusters, clusters_file, indent, method_table)
+            logging.info('Detailed clusters report saved.')
+            with stage('integration_index'):
+                self.save_integration_index()
+
+    def save_integration_index(self):
+        '''
+        Save the index of the inter-cluster edges on their classes, methods and cluster pairs next to the clusters report,
+        for the change impact queries of integration_points.py.
+        '''
+        index = IntegrationPointIndex.from_clusters(self.clusters)
+        write_integration_index(index, self.integration_index_path, self.graph_hash)
+        logging.info(str(index))
+        logging.info('Integration point index saved.')
+
+    def save_sweep_summary(self):
+        '''Save the consensus and stability summary of the clustering sweep to a file.'''
+        with open(self.sweep_summary_path, 'w') as summary_file:
+            json.dump(self.sweep.result.summary(), summary_file, indent=4)
+        logging.info('Clustering sweep summary saved.')
+
+    def compute_metrics(self):
+        '''Compute the statistics of the graph and of its clusters.'''
+        self.metrics = AnalysisMetrics(self.compact_graph, self.clusters)
+        return self.metrics
+
+    def save_metrics(self):
+        '''Save the statistics of the graph and of its clusters to a file.'''
+        with open(self.metrics_path, 'w') as metrics_file:
+            metrics_file.write(self.metrics.to_json())
+        logging.info('Analysis metrics saved.')
 
     def log_clusters_analysis(self):
         logging.info('Beginning of analysis logging.')
 
-        assert isinstance(self.graph_repr, Graph), 'Expected graph_repr to be an instance of Graph'
+        assert isinstance(self.compact_graph, CompactGraph), 'Expected compact_graph to be an instance of CompactGraph'
         assert isinstance(self.clusters, ClustersInformation), 'Expected clusters to be an instance of ClustersInformation'
+        graph_metrics = self.compute_metrics().graph
+        clusters_metrics = self.metrics.clusters
 
         # Log basic information about the graph
-        logging.info(f'Number of nodes in the graph: {len(self.graph_repr.nodes)}')
-        logging.info(f'Number of edges (with duplicates): {len(self.graph_repr.edges)}')
-        logging.info(f'Number of unique edges: {len(set(self.graph_repr.edges))}')
-
-        # Compute and log metrics for isolated nodes and average edges
-        isolated_nodes_count = self.graph_repr.count_isolated_nodes()
-        logging.info(f'Number of isolated nodes: {isolated_nodes_count}')
-        avg_incoming = self.graph_repr.average_edges()
-        logging.info(f'Average edges per node: {avg_incoming}')
-        median_incoming = self.graph_repr.median_incoming_edges_per_node()
-        logging.info(f'Median number of incoming edges per node: {median_incoming}')
-        median_outgoing = self.graph_repr.median_outgoing_edges_per_node()
-        logging.info(f'Median number of outgoing edges per node: {median_outgoing}')
+        logging.info(f'Number of nodes in the graph: {graph_metrics.number_of_nodes}')
+        logging.info(f'Number of edges (with duplicates): {graph_metrics.number_of_edges}')
+        logging.info(f'Number of unique edges: {graph_metrics.number_of_unique_edges}')
+
+        # Log metrics for isolated nodes and average edges
+        logging.info(f'Number of isolated nodes: {graph_metrics.number_of_isolated_nodes}')
+        logging.info(f'Average edges per node: {graph_metrics.average_edges_per_node}')
+        logging.info(f'Median number of incoming edges per node: {graph_metrics.in_degrees["median"]}')
+        logging.info(f'Median number of outgoing edges per node: {graph_metrics.out_degrees["median"]}')
         
         # Log basic information about clusters
-        logging.info(f'Number of clusters: {len(self.clusters.clusters)}')
-
-        # Analyse and log cluster details
-        nb_intra_cluster_edges = sum(len(cluster.intra_cluster_edges) for cluster in self.clusters.clusters)
-        nb_inter_cluster_edges = len(self.clusters.inter_cluster_edges)
-        total_edges = nb_intra_cluster_edges + nb_inter_cluster_edges
-        logging.info(f'Number of intra-cluster edges: {nb_intra_cluster_edges}')
-        logging.info(f'Number of inter-cluster edges: {nb_inter_cluster_edges}')
-        logging.info(f'Total number of edges (intra + inter-cluster): {total_edges}')
-
-        # Log additional metrics about the clusters
-        more_than_2_nodes = sum(len(cluster.nodes) > 2 for cluster in self.clusters.clusters)
-        more_than_5_nodes = sum(len(cluster.nodes) > 5 for cluster in self.clusters.clusters)
-        logging.info(f'Clusters with more than 2 nodes: {more_than_2_nodes}')
-        logging.info(f'Clusters with more than 5 nodes: {more_than_5_nodes}')
-
-        # Calculate and log the average number of nodes per cluster
-        total_nodes_all_clusters = sum(len(cluster.nodes) for cluster in self.clusters.clusters)
-        avg_nodes_all_clusters = total_nodes_all_clusters / len(self.clusters.clusters)
-        logging.info(f'Average number of nodes in all clusters: {avg_nodes_all_clusters}')
-
-        # Calculate and log the average number of nodes per cluster for clusters with more than 2 nodes
-        total_nodes_clusters_more_than_2 = sum(len(cluster.nodes) for cluster in self.clusters.clusters if len(cluster.nodes) > 2)
-        avg_nodes_clusters_more_than_2 = total_nodes_clusters_more_than_2 / more_than_2_nodes
-        logging.info(f'Average number of nodes in clusters with more than 2 nodes: {avg_nodes_clusters_more_than_2}')
-
-        # Calculate and log the average number of nodes per cluster for clusters with more than 5 nodes
-        total_nodes_clusters_more_than_5 = sum(len(cluster.nodes) for cluster in self.clusters.clusters if len(cluster.nodes) > 5)
-        avg_nodes_clusters_more_than_5 = total_nodes_clusters_more_than_5 / more_than_5_nodes
-        logging.info(f'Average number of nodes in clusters with more than 5 nodes: {avg_nodes_clusters_more_than_5}')
-
-        # Calculate and log the median number of nodes per cluster
-        nodes_per_cluster = sorted([len(cluster.nodes) for cluster in self.clusters.clusters])
-        median_all_clusters = nodes_per_cluster[len(nodes_per_cluster) // 2] if nodes_per_cluster else 0
-        logging.info(f'Median number of nodes in all clusters: {median_all_clusters}')
-
-        # Calculate and log the median number of nodes for clusters with more than 2 nodes
-        nodes_per_cluster_more_than_2 = sorted([len(cluster.nodes) for cluster in self.clusters.clusters if len(cluster.nodes) > 2])
-        median_clusters_more_than_2 = nodes_per_cluster_more_than_2[len(nodes_per_cluster_more_than_2) // 2] if nodes_per_cluster_more_than_2 else 0
-        logging.info(f'Median number of nodes in clusters with more than 2 nodes: {median_clusters_more_than_2}')
-
-        # Calculate and log the median number of nodes for clusters with more than 5 nodes
-        nodes_per_cluster_more_than_5 = sorted([len(cluster.nodes) for cluster in self.clusters.clusters if len(cluster.nodes) > 5])
-        median_clusters_more_than_5 = nodes_per_cluster_more_than_5[len(nodes_per_cluster_more_than_5) // 2] if nodes_per_cluster_more_than_5 else 0
-        logging.info(f'Median number of nodes in clusters with more than 5 nodes: {median_clusters_more_than_5}')
+        logging.info(f'Number of clusters: {clusters_metrics.number_of_clusters}')
+
+        # Log cluster details
+        logging.info(f'Number of intra-cluster edges: {clusters_metrics.number_of_intra_cluster_edges}')
+        logging.info(f'Number of inter-cluster edges: {clusters_metrics.number_of_inter_cluster_edges}')
+        logging.info(f'Total number of edges (intra + inter-cluster): {clusters_metrics.total_number_of_edges}')
+
+        # Log the number, average and median number of nodes of all clusters and of the clusters with more than 2 and 5 nodes
+        size_statistics = clusters_metrics.size_statistics
+        logging.info(f'Clusters with more than 2 nodes: {size_statistics["more_than_2_nodes"]["number_of_clusters"]}')
+        logging.info(f'Clusters with more than 5 nodes: {size_statistics["more_than_5_nodes"]["number_of_clusters"]}')
+        logging.info(f'Average number of nodes in all clusters: {size_statistics["all"]["average_number_of_nodes"]}')
+        logging.info(f'Average number of nodes in clusters with more than 2 nodes: {size_statistics["more_than_2_nodes"]["average_number_of_nodes"]}')
+        logging.info(f'Average number of nodes in clusters with more than 5 nodes: {size_statistics["more_than_5_nodes"]["average_number_of_nodes"]}')
+        logging.info(f'Median number of nodes in all clusters: {size_statistics["all"]["median_number_of_nodes"]}')
+        logging.info(f'Median number of nodes in clusters with more than 2 nodes: {size_statistics["more_than_2_nodes"]["median_number_of_nodes"]}')
+        logging.info(f'Median number of nodes in clusters with more than 5 nodes: {size_statistics["more_than_5_nodes"]["median_number_of_nodes"]}')
+
+        # Log the quality of the clusters
+        quality = self.metrics.quality
+        logging.info(f'Directed modularity of the clusters: {quality.modularity}')
+        logging.info(f'Undirected modularity of the clusters: {quality.undirected_modularity}')
+        logging.info(f'Mean conductance of the clusters: {quality.conductance.mean() if len(quality.conductance) else None}')
+        logging.info(f'Inter-cluster edge density: {quality.total_inter_cluster_edge_density}')
 
         # Log details of each cluster
         for cluster in self.clusters.clusters:
             logging.info(f'Cluster {cluster.id}: {len(cluster.nodes)} nodes, {len(cluster.intra_cluster_edges)} intra-cluster edges')
 
-        # If we have edges, calculate and log the percentage of inter-cluster edges
-        if total_edges > 0:
-            percentage_inter_cluster_edges = (nb_inter_cluster_edges / total_edges) * 100
-            logging.info(f'Percentage of inter-cluster edges: {percentage_inter_cluster_edges:.2f}%')
+        # If we have edges, log the percentage of inter-cluster edges
+        if clusters_metrics.total_number_of_edges > 0:
+            logging.info(f'Percentage of inter-cluster edges: {clusters_metrics.percentage_of_inter_cluster_edges:.2f}%')
 
         logging.info('End of analysis logging.')
 
+    @contextmanager
+    def profiling(self):
+        '''
+        Records the stages run in the block in the profiler of this analysis, and saves its metrics afterwards.
+        '''
+        if self.profiler is None:
+            self.profiler = StageProfiler(self.trace_memory)
+        previous_profiler = set_active_profiler(self.profiler)
+        try:
+            yield
+        finally:
+            set_active_profiler(previous_profiler)
+            self.profiler.stop()
+            self.save_profile()
+
+    def save_profile(self):
+        '''Save the wall time, CPU time and memory of the stages of the analysis to a file.'''
+        self.profiler.save(self.profile_path,
+                           algorithm=self.clustering_algorithm.name,
+                           data_path=self.data_path,
+                           graph_hash=self.graph_hash.hex() if self.graph_hash is not None else None,
+                           number_of_nodes=self.compact_graph.num_nodes if self.compact_graph is not None else None,
+                           number_of_edges=self.compact_graph.num_edges if self.compact_graph is not None else None)
+        logging.info('Analysis profile saved.')
+
     def run_analysis(self):
         logging.info('Begin of analysis.')
 
-        logging.info('BEGIN: Graph JSON to Graph Object.')
-        self.graph_repr = graph_json_to_object(self.graph_path)
-        logging.info('END: Graph JSON to Graph Object')
+        with self.profiling():
+            logging.info('BEGIN: Graph JSON to Graph Object.')
+            with stage('load_graph'):
+                self.load_graph()
+            logging.info('END: Graph JSON to Graph Object')
 
-        # Several possibilities for the clustering algorithm here
-        self.clusters = identify_clusters(self.graph_repr, self.clustering_algorithm)
+            # Several possibilities for the clustering algorithm here
+            cprofile_path = self.clustering_cprofile_path if self.profile_clustering else None
+            with stage('cluster_identification'), cprofile_to(cprofile_path):
+                if self.hierarchical:
+                    self.clusters = self.identify_cluster_tree()
+                elif self.incremental:
+                    self.clusters = self.identify_clusters_incrementally()
+                else:
+                    self.clusters = identify_clusters(self.compact_graph, self.clustering_algorithm, sweep=self.sweep,
+                                                      cache=self.partition_cache, sharding=self.sharding, **self.algorithm_options)
 
-        self.save_graph_report()
-        self.save_clusters_report()
-        self.log_clusters_analysis()
+            with stage('caches'):
+                self.save_clusters_cache()
+                if self.incremental and self.graph_hash is not None:
+                    self.save_clusters_delta()
+                if self.cluster_tree is not None:
+                    self.save_cluster_tree()
+            if self.sweep is not None:
+                self.save_sweep_summary()
+            with stage('metrics'):
+                self.log_clusters_analysis()
+                self.save_metrics()
 
-        logging.info('Saving Jupyter Notebooks for plotting the graph.')
-        plot_graphs_pyvis(os.path.dirname(self.clusters_path), self.clusters, self.graph_repr, single_node_cluster_color_black=True)
+            if self.plot:
+                self.plot_clusters()
 
         logging.info('End of analysis.')
@@ -0,0 +1,86 @@
+import argparse
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from analysis_manager import AnalysisManager, load_compact_graph, GRAPH_JSON_PATH, GRAPH_CACHE_PATH
+from pipeline_tools.cluster_analysis.cluster_identification import ClusteringAlgorithm
+
+DEFAULT_DATA_PATHS = ['./thesis_code/data/joda_time', './thesis_code/data/jfreechart', './thesis_code/data/commons_math']
+
+def prepare_graph(data_path: str):
+    '''
+    Parse the graph.json of a system once and store it in the binary graph cache,
+    from which every algorithm run on that system then loads the graph.
+    '''
+    graph_path = os.path.join(data_path, GRAPH_JSON_PATH)
+    graph_cache_path = os.path.join(data_path, GRAPH_CACHE_PATH)
+    compact_graph, _ = load_compact_graph(graph_path, graph_cache_path)
+    logging.info(f'{data_path}: {compact_graph}')
+
+def run_single_analysis(data_path: str, clustering_algorithm: ClusteringAlgorithm, export_clusters_report=True, plot=True):
+    '''
+    Run the analysis of one system with one clustering algorithm. Executed in a worker process,
+    it writes its outputs and its own analysis.log to the clusters/<algo>/ directory of the system.
+    '''
+    analysis_manager = AnalysisManager(data_path, clustering_algorithm, plot=plot)
+    analysis_manager.run_analysis()
+    if export_clusters_report:
+        analysis_manager.save_clusters_report()
+    return analysis_manager.clusters_path
+
+def run_batch_analysis(data_paths: list[str], clustering_algorithms: list[ClusteringAlgorithm], max_workers=None, export_clusters_report=True,
+                       plot=True):
+    '''
+    Run the analysis for every combination of data path and clustering algorithm on a process pool.
+    Each graph.json is parsed once up front; the runs share it through the binary graph cache.
+    Returns the clusters path of every successful run and the error of every failed one, keyed on (data path, algorithm).
+    '''
+    for data_path in data_paths:
+        prepare_graph(data_path)
+
+    results = dict()
+    failures = dict()
+    # Fresh interpreters for the workers, so no logging or library state is inherited from this process
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = {executor.submit(run_single_analysis, data_path, algorithm, export_clusters_report, plot): (data_path, algorithm)
+                   for data_path in data_paths for algorithm in clustering_algorithms}
+        for future in as_completed(futures):
+            data_path, algorithm = futures[future]
+            try:
+                results[(data_path, algorithm)] = future.result()
+                logging.info(f'Analysis of {data_path} with {algorithm.name} done: {results[(data_path, algorithm)]}')
+            except Exception as e:
+                failures[(data_path, algorithm)] = e
+                logging.error(f'Analysis of {data_path} with {algorithm.name} failed. Error: {e}')
+
+    return results, failures
+
+def main():
+    '''
+    This runs the analysis on several systems with several clustering algorithms in parallel.
+    By default, every real-world framework is analysed with every clustering algorithm.
+    '''
+    parser = argparse.ArgumentParser(description='Run the cluster analysis for a matrix of systems and clustering algorithms.')
+    parser.add_argument('--data-paths', nargs='+', default=DEFAULT_DATA_PATHS,
+                        help='Data directories of the systems, each containing graph/graph.json.')
+    parser.add_argument('--algorithms', nargs='+', default=[algorithm.name for algorithm in ClusteringAlgorithm],
+                        choices=[algorithm.name for algorithm in ClusteringAlgorithm],
+                        help='Clustering algorithms to run on every system.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes (defaults to the number of CPUs).')
+    parser.add_argument('--no-export', action='store_true',
+                        help='Only write the binary clusters caches, not the clusters.json reports.')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='Skip the pyvis plots, without importing matplotlib and pyvis.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    clustering_algorithms = [ClusteringAlgorithm[name] for name in args.algorithms]
+    _, failures = run_batch_analysis(args.data_paths, clustering_algorithms, args.workers, not args.no_export, not args.no_plot)
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
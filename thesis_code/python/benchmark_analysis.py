@@ -0,0 +1,177 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import time
+from concurrent.futures import ProcessPoolExecutor
+from analysis_manager import AnalysisManager, load_compact_graph, GRAPH_JSON_PATH, GRAPH_CACHE_PATH
+from benchmarks.synthetic_graph import SyntheticGraphConfig, write_graph_json, GRAPH_MODELS, PLANTED_PARTITION
+from pipeline_tools.cluster_analysis.cluster_identification import ClusteringAlgorithm
+from pipeline_tools.utils.profiling import StageProfiler, set_active_profiler
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_WORK_DIR = './thesis_code/data/benchmarks'
+# Girvan-Newman recomputes the edge betweenness after every removal, it does not finish on large graphs
+GIRVAN_NEWMAN_MAX_EDGES = 5000
+# Stages faster than this in the baseline are too noisy to be compared
+MIN_COMPARED_TIME = 0.05
+
+def prepare_synthetic_graph(config: SyntheticGraphConfig, data_path: str):
+    '''
+    Generate the graph.json of a synthetic system and parse it into the binary graph cache,
+    from which every benchmarked algorithm then loads the graph. Returns the wall time of both steps.
+    '''
+    profiler = StageProfiler()
+    previous_profiler = set_active_profiler(profiler)
+    try:
+        with profiler.stage('generation'):
+            write_graph_json(config, os.path.join(data_path, GRAPH_JSON_PATH))
+        graph_cache_path = os.path.join(data_path, GRAPH_CACHE_PATH)
+        if os.path.exists(graph_cache_path):
+            os.remove(graph_cache_path)
+        load_compact_graph(os.path.join(data_path, GRAPH_JSON_PATH), graph_cache_path)
+    finally:
+        set_active_profiler(previous_profiler)
+    return {stage.name: stage.wall_time for stage in profiler.stages}
+
+def run_benchmark_case(data_path: str, clustering_algorithm: ClusteringAlgorithm, trace_memory=False):
+    '''
+    Run the analysis of one synthetic system with one clustering algorithm and return its profile.
+    Executed in a fresh worker process, so that the peak RSS is the one of this analysis alone.
+    '''
+    # Without the partition cache, every run clusters the graph
+    analysis_manager = AnalysisManager(data_path, clustering_algorithm, use_partition_cache=False, trace_memory=trace_memory)
+    start = time.perf_counter()
+    analysis_manager.run_analysis()
+    total_wall_time = time.perf_counter() - start
+    with open(analysis_manager.profile_path) as profile_file:
+        profile = json.load(profile_file)
+    stages = {stage.pop('name'): stage for stage in profile['stages']}
+    return {
+        'total_wall_time': total_wall_time,
+        # The high-water mark of this fresh process, that of the whole analysis
+        'peak_rss_mb': max((stage['process_peak_rss_mb'] for stage in stages.values() if stage['process_peak_rss_mb'] is not None),
+                           default=None),
+        'workers_peak_rss_mb': max((stage['workers_peak_rss_mb'] for stage in stages.values() if stage['workers_peak_rss_mb'] is not None),
+                                   default=None),
+        'stages': stages,
+    }
+
+def run_benchmarks(configs: list[SyntheticGraphConfig], clustering_algorithms: list[ClusteringAlgorithm], work_dir: str,
+                   repeat=1, trace_memory=False, girvan_newman_max_edges=GIRVAN_NEWMAN_MAX_EDGES):
+    '''
+    Benchmark every clustering algorithm on every synthetic graph. Each run gets its own process,
+    of the repeated runs of a case the fastest one is kept. Returns the results as a dict ready to be saved.
+    '''
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'trace_memory': trace_memory,
+        'graphs': list(),
+        'runs': list(),
+    }
+    context = multiprocessing.get_context('spawn')
+    for config in configs:
+        data_path = os.path.join(work_dir, f'{config.model}_{config.num_edges}')
+        logging.info(f'Generating {data_path}: {config.num_classes} classes, {config.num_edges} edges.')
+        results['graphs'].append({**config.to_dict(), **prepare_synthetic_graph(config, data_path)})
+
+        for algorithm in clustering_algorithms:
+            if algorithm == ClusteringAlgorithm.GIRVAN_NEWMAN and config.num_edges > girvan_newman_max_edges:
+                logging.info(f'Skipping {algorithm.name} on {data_path}, more than {girvan_newman_max_edges} edges.')
+                continue
+            runs = list()
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    runs.append(executor.submit(run_benchmark_case, data_path, algorithm, trace_memory).result())
+            run = min(runs, key=lambda run: run['total_wall_time'])
+            logging.info(f'{algorithm.name} on {data_path}: {run["total_wall_time"]:.3f}s, peak RSS {run["peak_rss_mb"]} MB')
+            results['runs'].append({'model': config.model, 'num_classes': config.num_classes, 'num_edges': config.num_edges,
+                                    'algorithm': algorithm.name, **run})
+    return results
+
+def _run_key(run):
+    return run['model'], run['num_edges'], run['algorithm']
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float):
+    '''
+    Compare the wall time of every stage and the peak RSS of every run with the same case of the baseline.
+    Returns the regressions, measurements worse than the baseline by more than the threshold ratio.
+    '''
+    baseline_runs = {_run_key(run): run for run in baseline['runs']}
+    regressions = list()
+    for run in results['runs']:
+        baseline_run = baseline_runs.get(_run_key(run))
+        if baseline_run is None:
+            logging.info(f'{_run_key(run)}: not in the baseline.')
+            continue
+        measurements = [(f'{name} wall time', stage['wall_time'], baseline_run['stages'][name]['wall_time'])
+                        for name, stage in run['stages'].items()
+                        if name in baseline_run['stages'] and baseline_run['stages'][name]['wall_time'] >= MIN_COMPARED_TIME]
+        measurements.append(('total wall time', run['total_wall_time'], baseline_run['total_wall_time']))
+        if run['peak_rss_mb'] and baseline_run['peak_rss_mb']:
+            measurements.append(('peak RSS', run['peak_rss_mb'], baseline_run['peak_rss_mb']))
+        for measurement, value, baseline_value in measurements:
+            ratio = value / baseline_value if baseline_value else float('inf')
+            message = f'{_run_key(run)} {measurement}: {value:.3f} vs {baseline_value:.3f} in the baseline ({ratio:.2f}x)'
+            if ratio > threshold:
+                regressions.append(message)
+                logging.warning(f'Regression: {message}')
+            else:
+                logging.info(message)
+    return regressions
+
+def main():
+    '''
+    This benchmarks the analysis on synthetic graphs of growing size, for every clustering algorithm.
+    The results can be saved and used as the baseline of later runs, which then fail on regressions.
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the cluster analysis on synthetic graphs.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES,
+                        help='Numbers of edges of the synthetic graphs.')
+    parser.add_argument('--edges-per-class', type=float, default=10,
+                        help='Average number of edges per class, which sets the number of classes of every graph.')
+    parser.add_argument('--model', default=PLANTED_PARTITION, choices=GRAPH_MODELS,
+                        help='Random graph model of the synthetic graphs.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the graph generator.')
+    parser.add_argument('--algorithms', nargs='+', default=[algorithm.name for algorithm in ClusteringAlgorithm],
+                        choices=[algorithm.name for algorithm in ClusteringAlgorithm],
+                        help='Clustering algorithms to benchmark.')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs of every case, the fastest one is kept.')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Also record the peak memory allocated by Python in every stage (slower).')
+    parser.add_argument('--girvan-newman-max-edges', type=int, default=GIRVAN_NEWMAN_MAX_EDGES,
+                        help='Largest graph Girvan-Newman is benchmarked on.')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR,
+                        help='Directory the synthetic systems and their analysis outputs are written to.')
+    parser.add_argument('--output', default=None,
+                        help='File the results are saved to, defaults to results.json in the work directory.')
+    parser.add_argument('--baseline', default=None, help='Results of an earlier run to compare with.')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Ratio to the baseline above which a measurement is a regression.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    configs = [SyntheticGraphConfig(max(2, int(size / args.edges_per_class)), size, args.model, seed=args.seed)
+               for size in args.sizes]
+    clustering_algorithms = [ClusteringAlgorithm[name] for name in args.algorithms]
+    results = run_benchmarks(configs, clustering_algorithms, args.work_dir, args.repeat, args.trace_memory, args.girvan_newman_max_edges)
+
+    output_path = args.output or os.path.join(args.work_dir, 'results.json')
+    with open(output_path, 'w') as output_file:
+        json.dump(results, output_file, indent=4)
+    logging.info(f'Benchmark results saved to {output_path}')
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_with_baseline(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            logging.error(f'{len(regressions)} regressions against {args.baseline}.')
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
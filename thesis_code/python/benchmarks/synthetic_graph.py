@@ -0,0 +1,140 @@
+'''
+Generator of synthetic class dependency graphs, written as graph.json files in the schema of the GraphExtractor:
+classes as nodes and method calls between classes as edges, with the called method (link_method) and the calling
+method (source_method) of every edge. Like the extractor, it writes no self-loops and no duplicate edges for the same
+classes, called method and calling method.
+'''
+import json
+import os
+import numpy as np
+
+PLANTED_PARTITION = 'planted_partition'
+POWER_LAW = 'power_law'
+GRAPH_MODELS = (PLANTED_PARTITION, POWER_LAW)
+
+PARAMETER_TYPES = ('int', 'long', 'double', 'boolean', 'java.lang.String', 'java.util.List<java.lang.String>')
+RETURN_TYPES = ('void', 'int', 'boolean', 'java.lang.String', 'java.lang.Object')
+
+class SyntheticGraphConfig:
+    def __init__(self, num_classes, num_edges, model=PLANTED_PARTITION, num_communities=None, intra_community_probability=0.85,
+                 power_law_exponent=2.1, methods_per_class=8, seed=0) -> None:
+        if model not in GRAPH_MODELS:
+            raise ValueError(f'Unknown graph model {model}, expected one of {GRAPH_MODELS}')
+        if num_classes < 2:
+            raise ValueError('A synthetic graph needs at least 2 classes.')
+        self.num_classes = num_classes
+        self.num_edges = num_edges
+        self.model = model
+        # Planted partition: the classes of a community share a package and most of their calls stay in it
+        self.num_communities = num_communities or max(2, int(np.sqrt(num_classes)))
+        self.intra_community_probability = intra_community_probability
+        # Power law: exponent of the in and out-degree distributions (Chung-Lu model)
+        self.power_law_exponent = power_law_exponent
+        self.methods_per_class = methods_per_class
+        self.seed = seed
+        if methods_per_class < 1:
+            raise ValueError('A synthetic graph needs at least 1 method per class.')
+        max_num_edges = self.max_num_edges()
+        if not 0 <= num_edges <= max_num_edges:
+            raise ValueError(f'A synthetic graph of {num_classes} classes with methods_per_class={methods_per_class} has at most '
+                             f'{max_num_edges} distinct edges, {num_edges} requested.')
+
+    def max_num_edges(self):
+        '''
+        Number of distinct edges the model can draw: (source, destination, link method, source method) without self-loops,
+        only within the communities when every call of a planted partition stays in its community.
+        '''
+        n = self.num_classes
+        if self.model == PLANTED_PARTITION and self.intra_community_probability >= 1:
+            community_sizes = np.array([(n - 1 - community) // self.num_communities + 1 for community in range(min(self.num_communities, n))])
+            ordered_pairs = int(np.dot(community_sizes, community_sizes - 1))
+        else:
+            ordered_pairs = n * (n - 1)
+        return ordered_pairs * self.methods_per_class**2
+
+    def to_dict(self):
+        return dict(vars(self))
+
+def class_name(config: SyntheticGraphConfig, class_id: int):
+    return f'com.synthetic.p{class_id % config.num_communities}.Class{class_id}'
+
+def method_json(config: SyntheticGraphConfig, class_id: int, method_id: int, call: bool):
+    '''
+    Method method_id of a class, in the extractor's format. The arguments of a called method are the expressions
+    passed at the call site, those of a declared method its parameter names.
+    '''
+    parameter_types = [PARAMETER_TYPES[(class_id + method_id + i) % len(PARAMETER_TYPES)] for i in range(method_id % 3)]
+    name = f'method{method_id}'
+    return {
+        'method_signature': f'{name}({", ".join(parameter_types)})',
+        'method_name': name,
+        'return_type': RETURN_TYPES[(class_id * 7 + method_id) % len(RETURN_TYPES)],
+        'arguments': [{'type': parameter_type, 'value': f'arg{i}' if call else f'p{i}'}
+                      for i, parameter_type in enumerate(parameter_types)],
+        'declaring_class': class_name(config, class_id),
+    }
+
+def _sample_edges(config: SyntheticGraphConfig, rng: np.random.Generator, count: int):
+    '''Draws count (source, destination) class pairs of the configured model, possibly with self-loops.'''
+    n = config.num_classes
+    if config.model == PLANTED_PARTITION:
+        sources = rng.integers(n, size=count)
+        destinations = rng.integers(n, size=count)
+        # Classes of community c are c, c + k, c + 2k, ...
+        k = config.num_communities
+        communities = sources % k
+        community_sizes = (n - 1 - communities) // k + 1
+        same_community = communities + k * (rng.random(count) * community_sizes).astype(np.int64)
+        intra = rng.random(count) < config.intra_community_probability
+        destinations = np.where(intra, same_community, destinations)
+    else:
+        # Chung-Lu: expected degrees following a power law, shuffled so that hubs are spread over the packages
+        weights = (np.arange(n) + 1.0) ** (-1 / (config.power_law_exponent - 1))
+        weights /= weights.sum()
+        sources = rng.choice(n, size=count, p=weights[rng.permutation(n)])
+        destinations = rng.choice(n, size=count, p=weights[rng.permutation(n)])
+    return sources, destinations
+
+def generate_edges(config: SyntheticGraphConfig):
+    '''
+    Yields the (source class, destination class, link method, source method) ids of the edges of the graph.
+    '''
+    rng = np.random.default_rng(config.seed)
+    seen = set()
+    produced = 0
+    while produced < config.num_edges:
+        count = int((config.num_edges - produced) * 1.1) + 16
+        sources, destinations = _sample_edges(config, rng, count)
+        link_methods = rng.integers(config.methods_per_class, size=count)
+        source_methods = rng.integers(config.methods_per_class, size=count)
+        for edge in zip(sources.tolist(), destinations.tolist(), link_methods.tolist(), source_methods.tolist()):
+            if edge[0] == edge[1] or edge in seen:
+                continue
+            seen.add(edge)
+            yield edge
+            produced += 1
+            if produced == config.num_edges:
+                return
+
+def write_graph_json(config: SyntheticGraphConfig, file_path: str):
+    '''
+    Writes the synthetic graph to file_path, streaming the edges so that graphs of millions of edges fit in memory.
+    '''
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(file_path, 'w') as file:
+        file.write('{"nodes": [')
+        for class_id in range(config.num_classes):
+            file.write((', ' if class_id else '') + json.dumps({'name': class_name(config, class_id)}))
+        file.write('], "edges": [')
+        for position, (source, destination, link_method, source_method) in enumerate(generate_edges(config)):
+            edge = {
+                'source': class_name(config, source),
+                'destination': class_name(config, destination),
+                'link_method': method_json(config, destination, link_method, call=True),
+                'source_method': method_json(config, source, source_method, call=False),
+            }
+            file.write((',\n' if position else '\n') + json.dumps(edge))
+        file.write('\n]}\n')
+    return file_path
@@ -0,0 +1,73 @@
+import argparse
+import logging
+import os
+import numpy as np
+from analysis_manager import load_compact_graph, clusters_directory, GRAPH_JSON_PATH, GRAPH_CACHE_PATH, LOG_FORMAT
+from pipeline_tools.cluster_analysis.cluster_identification import ClusteringAlgorithm
+from pipeline_tools.cluster_analysis.partition_comparison import PartitionComparison, read_clusters_report_labels
+from results.binary_cache import read_partition
+
+def algorithm_labels(data_path: str, algorithm: ClusteringAlgorithm, compact_graph, graph_hash: bytes):
+    '''
+    Label array of the clusters of the last analysis of an algorithm: from its binary clusters cache when it was
+    computed for the current graph.json, otherwise from its clusters report. Returns None if it has neither.
+    '''
+    directory = clusters_directory(data_path, algorithm)
+    communities = read_partition(os.path.join(directory, 'clusters.bin'), graph_hash) if graph_hash is not None else None
+    if communities is not None:
+        labels = np.empty(compact_graph.num_nodes, dtype=np.int64)
+        for label, community in enumerate(communities):
+            labels[community] = label
+        return labels
+    clusters_path = os.path.join(directory, 'clusters.json')
+    if os.path.exists(clusters_path):
+        return read_clusters_report_labels(clusters_path, compact_graph)
+    return None
+
+def main():
+    '''
+    This compares the clusters of several algorithms (or any clusters reports) on the graph of one system,
+    and saves the similarity matrices to a JSON report.
+    '''
+    parser = argparse.ArgumentParser(description='Compare the partitions of a system into clusters.')
+    parser.add_argument('--data-path', required=True, help='Data directory of the system, e.g. ./thesis_code/data/joda_time.')
+    parser.add_argument('--algorithms', nargs='*', choices=[algorithm.name for algorithm in ClusteringAlgorithm],
+                        help='Algorithms whose last clusters are compared, by default all those with clusters.')
+    parser.add_argument('--clusters', nargs='+', default=list(), metavar='NAME=PATH',
+                        help='Further clusters reports to compare, e.g. leiden_level_1=<path>/clusters_level_1.json.')
+    parser.add_argument('--output', help='Path of the JSON report, by default clusters/comparison.json of the system.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    compact_graph, graph_hash = load_compact_graph(os.path.join(args.data_path, GRAPH_JSON_PATH), os.path.join(args.data_path, GRAPH_CACHE_PATH))
+
+    names, labels = list(), list()
+    algorithms = [ClusteringAlgorithm[name] for name in args.algorithms] if args.algorithms else list(ClusteringAlgorithm)
+    for algorithm in algorithms:
+        partition_labels = algorithm_labels(args.data_path, algorithm, compact_graph, graph_hash)
+        if partition_labels is None:
+            if args.algorithms:
+                parser.error(f'No clusters of {algorithm.name} in {args.data_path}, run its analysis first.')
+            continue
+        names.append(algorithm.name)
+        labels.append(partition_labels)
+    for named_path in args.clusters:
+        name, separator, path = named_path.partition('=')
+        if not separator:
+            name, path = os.path.splitext(os.path.basename(named_path))[0], named_path
+        if not os.path.exists(path):
+            parser.error(f'Clusters report {path} does not exist.')
+        names.append(name)
+        labels.append(read_clusters_report_labels(path, compact_graph))
+    if len(names) < 2:
+        parser.error('At least two partitions are needed for a comparison.')
+
+    comparison = PartitionComparison(names, np.stack(labels), compact_graph)
+    output_path = args.output or os.path.join(args.data_path, 'clusters', 'comparison.json')
+    with open(output_path, 'w') as comparison_file:
+        comparison_file.write(comparison.to_json())
+    print(comparison)
+    logging.info(f'Partition comparison saved to {output_path}.')
+
+if __name__ == '__main__':
+    main()
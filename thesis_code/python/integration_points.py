@@ -0,0 +1,41 @@
+import argparse
+import json
+import sys
+from results.binary_cache import read_integration_index
+from results.serializers import serialize_integration_point
+
+def main():
+    '''
+    This lists the integration points (inter-cluster edges) touched by a change, from the integration point index
+    saved next to clusters.json. The points matching any of the queries are written to stdout as JSON.
+    '''
+    parser = argparse.ArgumentParser(description='Query the integration points of a clustering for change impact analysis.')
+    parser.add_argument('--index', required=True,
+                        help='Integration point index, e.g. ./thesis_code/data/joda_time/clusters/louvain/integration_points.bin.')
+    parser.add_argument('--changed-files', nargs='+', default=list(),
+                        help='Changed files, e.g. from git diff --name-only; - reads them from stdin. Only .java files are matched.')
+    parser.add_argument('--classes', nargs='+', default=list(),
+                        help='Fully qualified class names; their nested classes are included unless --exact.')
+    parser.add_argument('--exact', action='store_true', help='Do not include the nested classes of --classes.')
+    parser.add_argument('--methods', nargs='+', default=list(),
+                        help='Method signatures like plus(int), or Class.plus(int) to also match the declaring class.')
+    parser.add_argument('--cluster-pair', nargs=2, type=int, metavar=('SOURCE', 'DESTINATION'),
+                        help='Source and destination cluster ids, matched in both directions.')
+    parser.add_argument('--count', action='store_true', help='Only print the number of integration points.')
+    args = parser.parse_args()
+
+    index = read_integration_index(args.index)
+    if index is None:
+        parser.error(f'No integration point index at {args.index}, save the clusters report of the analysis first.')
+
+    changed_files = [line.strip() for line in sys.stdin if line.strip()] if args.changed_files == ['-'] else args.changed_files
+    points = index.query(changed_files, args.classes, args.methods, args.cluster_pair, nested=not args.exact)
+
+    if args.count:
+        print(len(points))
+    else:
+        json.dump({'integration_points': [serialize_integration_point(point) for point in points]}, sys.stdout, indent=4)
+        print()
+
+if __name__ == '__main__':
+    main()
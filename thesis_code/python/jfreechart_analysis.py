@@ -1,3 +1,4 @@
+import argparse
 from analysis_manager import AnalysisManager
 from pipeline_tools.cluster_analysis.cluster_identification import ClusteringAlgorithm
 
@@ -5,10 +6,15 @@ def main():
     '''
     This runs the analysis on the real-world framework JFreeChart.
     '''
+    parser = argparse.ArgumentParser(description='Run the cluster analysis of JFreeChart.')
+    parser.add_argument('--no-plot', action='store_true', help='Skip the pyvis plots, without importing matplotlib and pyvis.')
+    args = parser.parse_args()
+
     data_path = './thesis_code/data/jfreechart'
     clustering_algorithm = ClusteringAlgorithm.LOUVAIN
-    analysis_manager = AnalysisManager(data_path, clustering_algorithm)
+    analysis_manager = AnalysisManager(data_path, clustering_algorithm, plot=not args.no_plot)
     analysis_manager.run_analysis()
+    analysis_manager.save_clusters_report()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
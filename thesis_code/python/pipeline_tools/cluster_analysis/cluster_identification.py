@@ -1,11 +1,13 @@
-import networkx as nx
-import infomap
-import igraph as ig
-import leidenalg
-from ..utils.utils import map_custom_graph_to_networkx
+from ..utils.utils import get_igraph, get_networkx
+from ..utils.profiling import stage
 from results.graph import Graph
+from results.compact_graph import CompactGraph, as_compact_graph
 from results.cluster import Cluster, ClustersInformation
-from pipeline_tools.cluster_analysis.inter_cluster_edges import find_inter_cluster_edges
+from results.partition_quality import modularity, labels_from_communities
+from pipeline_tools.cluster_analysis.inter_cluster_edges import partition_edges
+from pipeline_tools.cluster_analysis.partition_cache import PartitionCache
+from pipeline_tools.cluster_analysis.parallel_louvain import parallel_louvain_membership
+from pipeline_tools.cluster_analysis.modularity_optimisation import louvain_membership, leiden_membership, communities_from_membership
 from enum import Enum, auto
 import logging
 
@@ -13,117 +15,213 @@ class ClusteringAlgorithm(Enum):
     LOUVAIN = auto()
     GIRVAN_NEWMAN = auto()
     LEIDEN = auto()
+    PARALLEL_LOUVAIN = auto()
 
-def identify_clusters(graph_repr: Graph, algorithm: ClusteringAlgorithm):
-    if algorithm == ClusteringAlgorithm.LOUVAIN:
-        logging.info('BEGIN: Cluster identification from Graph representation using the Louvain Method.')
-        communities_sets = clusters_from_graph_with_louvain(graph_repr)
-        logging.info('END: Cluster identification from Graph representation using the Louvain Method.')
-    elif algorithm == ClusteringAlgorithm.GIRVAN_NEWMAN:
-        logging.info('BEGIN: Cluster identification from Graph representation using the Girvan-Newman algorithm.')
-        communities_sets = clusters_from_graph_with_girvan_newman(graph_repr)
-        logging.info('END: Cluster identification from Graph representation using the Girvan-Newman algorithm.')
-    elif algorithm == ClusteringAlgorithm.LEIDEN:
-        logging.info('BEGIN: Cluster identification from Graph representation using the Leiden algorithm.')
-        communities_sets = clusters_from_graph_with_leiden(graph_repr)
-        logging.info('END: Cluster identification from Graph representation using the Leiden algorithm.')
-    else:
-        raise ValueError("Unsupported clustering algorithm")
+def identify_clusters(graph_repr: Graph | CompactGraph, algorithm: ClusteringAlgorithm, sweep=None, cache: PartitionCache = None, sharding=None,
+                      **algorithm_options):
+    '''
+    Identify the clusters of a graph with the given algorithm.
+    The algorithms run on the compact representation of the graph; when a CompactGraph is given,
+    its Graph view is only built afterwards to assemble the cluster objects.
+    The algorithm options are passed on to the function of the chosen algorithm.
+    If a ClusteringSweep is given, the algorithm is run for all of its seeds and resolutions instead and the
+    best partition is kept; the summary of the sweep is then available on sweep.result.
+    If a PartitionCache is given, the partition is looked up in it first and stored in it after a miss
+    (not for sweeps, whose summary is not cached, nor for options that are not deterministic).
+    If a ComponentSharding is given, the weakly connected components of the graph are clustered separately
+    on its worker pool and their partitions merged.
+    '''
+    if sweep is not None and sharding is not None:
+        raise ValueError('A clustering sweep cannot be combined with the sharding into connected components.')
+    compact_graph = as_compact_graph(graph_repr)
+    cache_key = None
+    if cache is not None and sweep is None and is_deterministic(algorithm, algorithm_options):
+        with stage('partition_cache'):
+            # Sharded partitions are not those of the whole graph, they are cached apart
+            cache_algorithm_name = algorithm.name if sharding is None else f'{algorithm.name}_SHARDED'
+            cache_key = cache.key(compact_graph, cache_algorithm_name, algorithm_options)
+            communities = cache.get(cache_key)
+        if communities is not None:
+            node_names = compact_graph.node_names
+            communities_sets = [[node_names[node_id] for node_id in community] for community in communities]
+            logging.info(f'Modularity of the clusters is: {partition_modularity(compact_graph, communities_sets)}')
+            return _assemble_clusters(graph_repr, communities_sets)
+
+    with stage('clustering'):
+        if sweep is not None:
+            logging.info(f'BEGIN: Cluster identification from Graph representation using a sweep of {algorithm.name}.')
+            communities_sets = sweep.run(compact_graph, algorithm)
+            logging.info(f'Modularity of the clusters is: {partition_modularity(compact_graph, communities_sets)}')
+            logging.info(f'END: Cluster identification from Graph representation using a sweep of {algorithm.name}.')
+        elif sharding is not None:
+            backend = clustering_backend(algorithm)
+            logging.info(f'BEGIN: Cluster identification from Graph representation per connected component using {backend.description}.')
+            communities_sets = sharding.run(compact_graph, algorithm, algorithm_options)
+            logging.info(f'Modularity of the clusters is: {partition_modularity(compact_graph, communities_sets)}')
+            logging.info(f'END: Cluster identification from Graph representation per connected component using {backend.description}.')
+        else:
+            backend = clustering_backend(algorithm)
+            logging.info(f'BEGIN: Cluster identification from Graph representation using {backend.description}.')
+            communities_sets = backend.run(compact_graph, **algorithm_options)
+            logging.info(f'END: Cluster identification from Graph representation using {backend.description}.')
+
+    if cache_key is not None:
+        with stage('partition_cache'):
+            node_ids = compact_graph.node_ids
+            cache.put(cache_key, [[node_ids[node] for node in nodes_set] for nodes_set in communities_sets])
+    return _assemble_clusters(graph_repr, communities_sets)
+
+def is_deterministic(algorithm: ClusteringAlgorithm, algorithm_options: dict):
+    '''
+    Whether an algorithm gives the same partition of a graph on every run with these options: not with a seed of None,
+    nor Girvan-Newman with sampled betweenness and no seed, nor the parallel Louvain method in non-deterministic mode.
+    '''
+    if algorithm == ClusteringAlgorithm.GIRVAN_NEWMAN:
+        # Its seed only drives the sampling of the betweenness sources, and defaults to None
+        return algorithm_options.get('betweenness_sample_size') is None or algorithm_options.get('seed') is not None
+    if algorithm == ClusteringAlgorithm.PARALLEL_LOUVAIN and not algorithm_options.get('deterministic', True):
+        return False
+    return algorithm_options.get('seed', 0) is not None
+
+def _assemble_clusters(graph_repr: Graph | CompactGraph, communities_sets):
+    if isinstance(graph_repr, CompactGraph):
+        with stage('graph_objects'):
+            graph_repr = graph_repr.graph_view()
+
+    with stage('edge_assignment'):
+        return build_clusters_information(graph_repr, communities_sets)
+
+def build_clusters_information(graph_repr: Graph, communities_sets):
+    '''
+    Assemble the ClustersInformation of a partition, given as an ordered collection of node name sets.
+    Cluster ids are assigned from 1 in the order of the communities.
+    '''
+    logging.info('BEGIN: Intra and inter-cluster edges identification.')
+    node_cluster_map = {node: community_id for community_id, nodes_set in enumerate(communities_sets, start=1) for node in nodes_set}
+    intra_cluster_edges, inter_cluster_edges = partition_edges(graph_repr, node_cluster_map)
 
     cluster_objects = list()
     for community_id, nodes_set in enumerate(communities_sets, start=1):
         cluster_nodes = [graph_repr.get_node_by_name(node) for node in nodes_set]
-        intra_cluster_edges = [edge for edge in graph_repr.edges if edge.source.name in nodes_set and edge.destination.name in nodes_set]
-        
-        cluster_objects.append(Cluster(community_id, cluster_nodes, intra_cluster_edges))
+        cluster_objects.append(Cluster(community_id, cluster_nodes, intra_cluster_edges.get(community_id, list())))
 
     cluster_info = ClustersInformation(cluster_objects)
-    logging.info('BEGIN: Inter-cluster edges identification.')
-    cluster_info.inter_cluster_edges = find_inter_cluster_edges(graph_repr, cluster_info)
-    logging.info('END: Inter-cluster edges identification.')
+    cluster_info.inter_cluster_edges = inter_cluster_edges
+    logging.info('END: Intra and inter-cluster edges identification.')
 
     return cluster_info
 
-def clusters_from_graph_with_louvain(graph: Graph):
+def partition_modularity(graph: Graph | CompactGraph, communities_sets):
+    '''
+    Directed, weighted modularity of a partition of the graph into communities of node names,
+    scored on the sparse adjacency matrix cached on the graph.
+    '''
+    compact_graph = as_compact_graph(graph)
+    return modularity(compact_graph.sparse_adjacency(), labels_from_communities(communities_sets, compact_graph))
+
+def clusters_from_graph_with_louvain(graph: Graph | CompactGraph, backend='igraph', seed=2247, resolution=None):
     '''
     Identify communities in a graph using the Louvain method.
-    The function takes a Graph object as input.
+    The function takes a Graph or CompactGraph object as input.
+    By default the Louvain method runs on the cached igraph graph, using leidenalg's node moving and
+    aggregation steps without the Leiden refinement. backend='networkx' runs nx.community.louvain_communities instead,
+    which reproduces the partitions obtained before the igraph backend.
     '''
-    nx_graph = map_custom_graph_to_networkx(graph)
-    seed = 2247
-    # Use the Louvain method to find the best partition
-    communities_sets = nx.community.louvain_communities(G=nx_graph, 
-                                                        seed=seed)
+    if backend == 'networkx':
+        import networkx as nx
+        # Use the Louvain method to find the best partition
+        communities_sets = nx.community.louvain_communities(G=get_networkx(graph), 
+                                                            seed=seed,
+                                                            resolution=1 if resolution is None else resolution)
+    elif backend == 'igraph':
+        membership = louvain_membership(get_igraph(graph), seed, resolution)
+        communities_sets = communities_from_membership(membership, as_compact_graph(graph).node_names)
+    else:
+        raise ValueError(f'Unsupported Louvain backend {backend}')
     
-    modularity = nx.community.modularity(nx_graph, communities_sets)
+    modularity = partition_modularity(graph, communities_sets)
     logging.info(f'Modularity of the clusters is: {modularity}')
     
     return communities_sets
 
-def clusters_from_graph_with_girvan_newman(graph: Graph):
+def clusters_from_graph_with_girvan_newman(graph: Graph | CompactGraph, patience=None, betweenness_sample_size=None, seed=None,
+                                           resolution=None):
     '''
     Identify communities in a graph using the Girvan-Newman algorithm, 
     using the modularity metric to select the level of division.
-    The function takes a Graph object as input.
+    The function takes a Graph or CompactGraph object as input.
+    The dendrogram is built incrementally (see girvan_newman_levels); optionally it stops once the modularity
+    has not improved for `patience` levels, and the edge betweenness is approximated from
+    `betweenness_sample_size` sampled sources per component. The level is selected on the modularity
+    with a resolution parameter when one is given.
     '''
-    nx_graph = map_custom_graph_to_networkx(graph)
-    comp = nx.community.girvan_newman(nx_graph)
+    from pipeline_tools.cluster_analysis.girvan_newman import girvan_newman_best_partition
+    nx_graph = get_networkx(graph)
 
-    # Initialize variables to track modularity and levels
-    max_modularity = 0
-    current_modularity = 0
-    optimal_level = None
-    i = 0
-    
-    base_modularity = nx.community.modularity(nx_graph, [list(nx_graph.nodes)])
+    base_modularity = partition_modularity(graph, [list(nx_graph.nodes)])
     logging.info(f'Base modularity: {base_modularity}')
-    
-    for level in comp:
-        i += 1
-        communities = list(level)
-        current_modularity = nx.community.modularity(nx_graph, communities)
-        logging.info(f'Modularity score at level {i} is {current_modularity}')
-        
-        # Update the max modularity if the current modularity is higher
-        if current_modularity > max_modularity:
-            max_modularity = current_modularity
-            optimal_level = communities
-            optimal_i = i
-
-    if optimal_level is None:
-        logging.warning("No optimal level found; using the last level.")
-        optimal_level = communities
 
-    logging.info(f'Optimal level of depth in the Girvan-Newman algorithm was level {optimal_i}.')
+    communities_sets, optimal_i, _ = girvan_newman_best_partition(nx_graph,
+                                                                   patience=patience,
+                                                                   betweenness_sample_size=betweenness_sample_size,
+                                                                   seed=seed,
+                                                                   resolution=resolution)
 
-    communities_sets = optimal_level
+    logging.info(f'Optimal level of depth in the Girvan-Newman algorithm was level {optimal_i}.')
 
-    modularity = nx.community.modularity(nx_graph, communities_sets)
+    modularity = partition_modularity(graph, communities_sets)
     logging.info(f'Modularity of the clusters is: {modularity}')
     
     return communities_sets
 
-def clusters_from_graph_with_leiden(graph):
+def clusters_from_graph_with_leiden(graph: Graph | CompactGraph, seed=42, resolution=None):
     '''
     Directly identify communities in a graph using the Leiden algorithm with igraph and leidenalg,
     ensuring determinism with a specified seed.
-    The function takes a Graph object as input.
+    The function takes a Graph or CompactGraph object as input.
     '''
-    seed = 42
-    node_to_index = {node.name: index for index, node in enumerate(graph.nodes)}
-    
-    ig_edges = [(node_to_index[edge.source.name], node_to_index[edge.destination.name]) for edge in graph.edges]
-    ig_graph = ig.Graph(edges=ig_edges, directed=True)
-    ig_graph.vs["name"] = [node.name for node in graph.nodes]
-    
-    partition = leidenalg.find_partition(ig_graph, 
-                                         leidenalg.ModularityVertexPartition, 
-                                         seed=seed)
-    
-    communities_sets = [{ig_graph.vs[node_id]["name"] for node_id in community} for community in partition]
+    membership = leiden_membership(get_igraph(graph), seed, resolution)
+    communities_sets = communities_from_membership(membership, as_compact_graph(graph).node_names)
 
-    nx_graph = map_custom_graph_to_networkx(graph)
-    modularity = nx.community.modularity(nx_graph, communities_sets)
+    modularity = partition_modularity(graph, communities_sets)
     logging.info(f'Modularity of the clusters is: {modularity}')
     
     return communities_sets
+
+def clusters_from_graph_with_parallel_louvain(graph: Graph | CompactGraph, seed=2247, resolution=None, workers=None, deterministic=True):
+    '''
+    Identify communities in a graph using the Louvain method with a vectorized local moving phase,
+    split over `workers` threads. In deterministic mode, the same seed gives the same partition whatever the number of workers.
+    The function takes a Graph or CompactGraph object as input.
+    '''
+    compact_graph = as_compact_graph(graph)
+    membership = parallel_louvain_membership(compact_graph, seed, resolution, workers, deterministic)
+    communities_sets = communities_from_membership(membership, compact_graph.node_names)
+
+    modularity = partition_modularity(graph, communities_sets)
+    logging.info(f'Modularity of the clusters is: {modularity}')
+
+    return communities_sets
+
+class ClusteringBackend:
+    '''
+    A clustering algorithm of the registry: the function identifying the communities of a graph, and its name in the logs.
+    The libraries of a backend (NetworkX, igraph, leidenalg) are only imported when its function runs.
+    '''
+    def __init__(self, description: str, run) -> None:
+        self.description = description
+        self.run = run
+
+CLUSTERING_BACKENDS = {
+    ClusteringAlgorithm.LOUVAIN: ClusteringBackend('the Louvain Method', clusters_from_graph_with_louvain),
+    ClusteringAlgorithm.GIRVAN_NEWMAN: ClusteringBackend('the Girvan-Newman algorithm', clusters_from_graph_with_girvan_newman),
+    ClusteringAlgorithm.LEIDEN: ClusteringBackend('the Leiden algorithm', clusters_from_graph_with_leiden),
+    ClusteringAlgorithm.PARALLEL_LOUVAIN: ClusteringBackend('the parallel Louvain Method', clusters_from_graph_with_parallel_louvain),
+}
+
+def clustering_backend(algorithm: ClusteringAlgorithm):
+    '''Returns the registered backend of a clustering algorithm.'''
+    backend = CLUSTERING_BACKENDS.get(algorithm)
+    if backend is None:
+        raise ValueError("Unsupported clustering algorithm")
+    return backend
@@ -0,0 +1,193 @@
+import itertools
+import logging
+import multiprocessing
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+import numpy as np
+from ..utils.utils import get_igraph
+from ..utils.profiling import worker_task, record_worker_peak_rss
+from results.compact_graph import CompactGraph, as_compact_graph
+from results.partition_quality import batch_modularity
+from pipeline_tools.cluster_analysis.cluster_identification import ClusteringAlgorithm
+from pipeline_tools.cluster_analysis.modularity_optimisation import louvain_membership, leiden_membership, communities_from_membership
+
+# igraph graph of the sweep worker process, built once from the shared edge arrays
+_worker_graph = None
+
+def _share_edge_arrays(compact_graph: CompactGraph):
+    '''
+    Copies the collapsed edge arrays of a compact graph into one shared memory block:
+    weights (float64[E]), then source ids and destination ids (int32[E] each).
+    Returns the block and the number of collapsed edges E.
+    '''
+    collapsed_edges = compact_graph.collapsed_edges()
+    num_edges = collapsed_edges.num_edges
+    block = shared_memory.SharedMemory(create=True, size=max(16 * num_edges, 1))
+    block.buf[:8 * num_edges] = collapsed_edges.weight.tobytes()
+    block.buf[8 * num_edges:12 * num_edges] = collapsed_edges.src.astype('int32').tobytes()
+    block.buf[12 * num_edges:16 * num_edges] = collapsed_edges.dst.astype('int32').tobytes()
+    return block, num_edges
+
+def _init_sweep_worker(block_name: str, num_nodes: int, num_edges: int):
+    '''
+    Builds the igraph graph of a worker process once, from the edge arrays shared by the parent process.
+    '''
+    import igraph as ig
+    global _worker_graph
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        weight = block.buf[:8 * num_edges].cast('d')
+        src = block.buf[8 * num_edges:12 * num_edges].cast('i')
+        dst = block.buf[12 * num_edges:16 * num_edges].cast('i')
+        _worker_graph = ig.Graph(n=num_nodes, edges=list(zip(src, dst)), directed=True)
+        _worker_graph.es['weight'] = weight.tolist()
+        for view in (weight, src, dst):
+            view.release()
+    finally:
+        block.close()
+
+def _run_clustering(ig_graph, algorithm: ClusteringAlgorithm, seed: int, resolution):
+    '''Runs one clustering of the sweep. Returns the membership of the vertices.'''
+    if algorithm == ClusteringAlgorithm.LOUVAIN:
+        return louvain_membership(ig_graph, seed, resolution)
+    return leiden_membership(ig_graph, seed, resolution)
+
+def _run_sweep_task(algorithm: ClusteringAlgorithm, seed: int, resolution):
+    return _run_clustering(_worker_graph, algorithm, seed, resolution)
+
+def _node_stability(memberships, best_membership):
+    '''
+    Fraction of the runs in which every node lies in the cluster matching its cluster of the best partition,
+    each cluster of a run being matched to the best partition cluster it overlaps the most.
+    '''
+    stable_counts = [0] * len(best_membership)
+    for membership in memberships:
+        overlaps = dict()
+        for label, best_label in zip(membership, best_membership):
+            overlaps[(label, best_label)] = overlaps.get((label, best_label), 0) + 1
+        matches = dict()
+        for (label, best_label), overlap in overlaps.items():
+            if label not in matches or overlap > matches[label][0]:
+                matches[label] = (overlap, best_label)
+        for node_id, (label, best_label) in enumerate(zip(membership, best_membership)):
+            if matches[label][1] == best_label:
+                stable_counts[node_id] += 1
+    return [count / len(memberships) for count in stable_counts]
+
+class SweepRun:
+    def __init__(self, seed, resolution, membership, modularity) -> None:
+        self.seed = seed
+        self.resolution = resolution
+        self.membership: list[int] = membership
+        self.modularity: float = modularity
+
+    def __str__(self):
+        return f'Sweep run (seed {self.seed}, resolution {self.resolution}): modularity {self.modularity}'
+
+class SweepResult:
+    def __init__(self, algorithm: ClusteringAlgorithm, node_names, runs) -> None:
+        self.algorithm = algorithm
+        self.node_names: list[str] = node_names
+        self.runs: list[SweepRun] = runs
+        # Ties go to the first run in sweep order, so the best run is deterministic
+        self.best_run: SweepRun = max(runs, key=lambda run: run.modularity)
+
+    def best_communities(self):
+        '''The best partition as communities of node name sets.'''
+        return communities_from_membership(self.best_run.membership, self.node_names)
+
+    def summary(self):
+        '''
+        Consensus and stability summary of the sweep as a JSON serialisable dict: the score of every run,
+        the best run, the NMI of every run to the best partition and between pairs of runs,
+        statistics per resolution and the stability of every node.
+        '''
+        import igraph as ig
+        best_membership = self.best_run.membership
+        nmi_to_best = [ig.compare_communities(run.membership, best_membership, method='nmi') for run in self.runs]
+        pairwise_nmi = [ig.compare_communities(a.membership, b.membership, method='nmi')
+                        for a, b in itertools.combinations(self.runs, 2)]
+        node_stability = _node_stability([run.membership for run in self.runs], best_membership)
+
+        per_resolution = list()
+        for resolution in dict.fromkeys(run.resolution for run in self.runs):
+            runs = [run for run in self.runs if run.resolution == resolution]
+            modularities = [run.modularity for run in runs]
+            per_resolution.append({
+                'resolution': resolution,
+                'runs': len(runs),
+                'mean_modularity': statistics.fmean(modularities),
+                'min_modularity': min(modularities),
+                'max_modularity': max(modularities),
+                'mean_number_of_clusters': statistics.fmean(len(set(run.membership)) for run in runs),
+            })
+
+        return {
+            'algorithm': self.algorithm.name,
+            'best_run': {
+                'seed': self.best_run.seed,
+                'resolution': self.best_run.resolution,
+                'modularity': self.best_run.modularity,
+                'number_of_clusters': len(set(best_membership)),
+            },
+            'runs': [{'seed': run.seed, 'resolution': run.resolution, 'modularity': run.modularity,
+                      'number_of_clusters': len(set(run.membership)), 'nmi_to_best': nmi}
+                     for run, nmi in zip(self.runs, nmi_to_best)],
+            'mean_pairwise_nmi': statistics.fmean(pairwise_nmi) if pairwise_nmi else 1.0,
+            'per_resolution': per_resolution,
+            'mean_node_stability': statistics.fmean(node_stability) if node_stability else 1.0,
+            'node_stability': dict(zip(self.node_names, node_stability)),
+        }
+
+class ClusteringSweep:
+    '''
+    Sweep of a modularity based clustering algorithm over seeds x resolutions, run on a process pool.
+    The edge arrays of the graph are shared with the workers through shared memory, and every worker
+    builds its igraph graph once for all of its runs. A resolution of None is the plain modularity.
+    '''
+    def __init__(self, seeds=range(10), resolutions=(None,), max_workers=None) -> None:
+        self.seeds = list(seeds)
+        self.resolutions = list(resolutions)
+        self.max_workers = max_workers
+        self.result: SweepResult = None
+        if not self.seeds or not self.resolutions:
+            raise ValueError('A clustering sweep needs at least one seed and one resolution.')
+
+    def run(self, graph, algorithm: ClusteringAlgorithm):
+        '''
+        Runs the sweep on a Graph or CompactGraph, keeps its SweepResult and returns the best partition
+        as communities of node name sets.
+        '''
+        if algorithm not in (ClusteringAlgorithm.LOUVAIN, ClusteringAlgorithm.LEIDEN):
+            raise ValueError(f'Clustering sweeps are not supported for {algorithm.name}')
+        compact_graph = as_compact_graph(graph)
+        tasks = [(seed, resolution) for resolution in self.resolutions for seed in self.seeds]
+        logging.info(f'Clustering sweep of {algorithm.name}: {len(self.seeds)} seeds x {len(self.resolutions)} resolutions.')
+
+        if self.max_workers == 1 or len(tasks) == 1:
+            ig_graph = get_igraph(compact_graph)
+            outcomes = [_run_clustering(ig_graph, algorithm, seed, resolution) for seed, resolution in tasks]
+        else:
+            block, num_edges = _share_edge_arrays(compact_graph)
+            try:
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context, initializer=_init_sweep_worker,
+                                         initargs=(block.name, compact_graph.num_nodes, num_edges)) as executor:
+                    worker_outcomes = list(executor.map(partial(worker_task, _run_sweep_task), itertools.repeat(algorithm),
+                                                        [seed for seed, _ in tasks], [resolution for _, resolution in tasks]))
+                outcomes = [membership for membership, _ in worker_outcomes]
+                for _, worker_peak_rss in worker_outcomes:
+                    record_worker_peak_rss(worker_peak_rss)
+            finally:
+                block.close()
+                block.unlink()
+
+        # The runs are scored together, on the standard directed modularity whatever the resolution they were optimised for
+        modularities = batch_modularity(compact_graph.sparse_adjacency(), np.array(outcomes)).tolist()
+        runs = [SweepRun(seed, resolution, membership, modularity)
+                for (seed, resolution), membership, modularity in zip(tasks, outcomes, modularities)]
+        self.result = SweepResult(algorithm, compact_graph.node_names, runs)
+        logging.info(f'Best run of the sweep: {self.result.best_run}')
+        return self.result.best_communities()
@@ -0,0 +1,197 @@
+'''
+Clustering of a graph one weakly connected component at a time.
+
+The directed modularity of a partition is the sum of the contributions of its communities, and a community of a
+modularity optimum never spans two components. So the components can be clustered independently, each with the
+resolution scaled by its share of the total edge weight: the modularity of a component with the resolution
+resolution * m_c / m is its contribution to the modularity of the whole graph, up to the factor m / m_c.
+'''
+import logging
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from results.compact_graph import CompactGraph
+from pipeline_tools.utils.profiling import set_active_profiler, worker_task, record_worker_peak_rss
+from pipeline_tools.cluster_analysis.cluster_identification import ClusteringAlgorithm, clustering_backend
+
+# Components are batched into tasks of at least this many edges, so the small ones do not cost a task each
+MIN_TASK_EDGES = 5000
+
+def weakly_connected_components(compact_graph: CompactGraph):
+    '''
+    Labels every node with the smallest node id of its weakly connected component, by hooking the root of every edge
+    endpoint onto the smaller root and compressing the paths to the roots until every edge lies within a tree.
+    '''
+    labels = np.arange(compact_graph.num_nodes)
+    src, dst, _ = compact_graph.as_numpy()
+    while True:
+        src_labels, dst_labels = labels[src], labels[dst]
+        if np.array_equal(src_labels, dst_labels):
+            return labels
+        lower = np.minimum(src_labels, dst_labels)
+        np.minimum.at(labels, src_labels, lower)
+        np.minimum.at(labels, dst_labels, lower)
+        while True:
+            root_labels = labels[labels]
+            if np.array_equal(root_labels, labels):
+                break
+            labels = root_labels
+
+def _component_graph(node_names, src, dst, weight):
+    '''
+    CompactGraph of a component from its node names and its edge arrays in local node ids.
+    It only holds what the clustering algorithms see, the methods of the edges are not copied.
+    '''
+    compact_graph = CompactGraph()
+    for name in node_names:
+        compact_graph.add_node(name)
+    compact_graph.src = array('i', src.astype(np.int32).tobytes())
+    compact_graph.dst = array('i', dst.astype(np.int32).tobytes())
+    compact_graph.weight = array('d', weight.astype(np.float64).tobytes())
+    compact_graph.link_method = array('i', bytes(4 * len(src)))
+    compact_graph.source_method = array('i', bytes(4 * len(src)))
+    return compact_graph
+
+def _quality(membership, src, dst, weight, total_weight, resolution):
+    '''Contribution of a partition of a component to the directed modularity of the whole graph.'''
+    num_communities = membership.max() + 1
+    intra_weight = weight[membership[src] == membership[dst]].sum()
+    community_out = np.bincount(membership[src], weights=weight, minlength=num_communities)
+    community_in = np.bincount(membership[dst], weights=weight, minlength=num_communities)
+    return intra_weight / total_weight - resolution * np.dot(community_out, community_in) / total_weight**2
+
+def _cluster_component(algorithm: ClusteringAlgorithm, algorithm_options: dict, shard):
+    '''
+    Clusters one component with the resolution scaled to its edge weight.
+    Returns its communities as lists of local node ids.
+    '''
+    node_names, src, dst, weight, total_weight = shard
+    resolution = algorithm_options.get('resolution')
+    resolution = 1 if resolution is None else resolution
+    component_resolution = resolution * weight.sum() / total_weight
+    component_graph = _component_graph(node_names, src, dst, weight)
+    communities_sets = clustering_backend(algorithm).run(component_graph, **{**algorithm_options, 'resolution': component_resolution})
+
+    communities = [sorted(component_graph.node_ids[node] for node in nodes_set) for nodes_set in communities_sets]
+    if algorithm == ClusteringAlgorithm.GIRVAN_NEWMAN:
+        # Girvan-Newman never selects the unsplit component, keep it whole when none of its levels does better
+        membership = np.empty(len(node_names), dtype=np.int64)
+        for community_id, community in enumerate(communities):
+            membership[community] = community_id
+        whole = np.zeros(len(node_names), dtype=np.int64)
+        if _quality(whole, src, dst, weight, total_weight, resolution) > _quality(membership, src, dst, weight, total_weight, resolution):
+            return [list(range(len(node_names)))]
+    return communities
+
+def _cluster_components(algorithm: ClusteringAlgorithm, algorithm_options: dict, shards):
+    # The stages of every component are not profiled, in this process as in the workers
+    previous_profiler = set_active_profiler(None)
+    try:
+        return [_cluster_component(algorithm, algorithm_options, shard) for shard in shards]
+    finally:
+        set_active_profiler(previous_profiler)
+
+class ComponentSharding:
+    '''
+    Clustering of the weakly connected components of a graph on a process pool, merged into one partition.
+    Isolated nodes are clusters of their own and the clusters of two-node components are decided directly;
+    the other components are clustered by the algorithm with the resolution scaled to their edge weight.
+    The communities are listed component by component, in the order of the first node of every component.
+    '''
+    def __init__(self, max_workers=None) -> None:
+        self.max_workers = max_workers
+        self.number_of_components = 0
+        self.number_of_isolated_nodes = 0
+        self.number_of_trivial_components = 0
+        self.number_of_clustered_components = 0
+
+    def run(self, compact_graph: CompactGraph, algorithm: ClusteringAlgorithm, algorithm_options: dict):
+        '''Clusters every component of a CompactGraph and returns the partition as communities of node name sets.'''
+        labels = weakly_connected_components(compact_graph)
+        roots, component_ids, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+        component_ids = component_ids.ravel()
+        # Local id of every node in its component, in the order of the graph
+        node_order = np.argsort(component_ids, kind='stable')
+        node_offsets = np.concatenate(([0], np.cumsum(sizes)))
+        local_ids = np.empty(compact_graph.num_nodes, dtype=np.int64)
+        local_ids[node_order] = np.arange(compact_graph.num_nodes) - np.repeat(node_offsets[:-1], sizes)
+
+        src, dst, weight = compact_graph.as_numpy()
+        edge_component_ids = component_ids[src]
+        edge_order = np.argsort(edge_component_ids, kind='stable')
+        edge_offsets = np.concatenate(([0], np.cumsum(np.bincount(edge_component_ids, minlength=len(roots)))))
+        total_weight = weight.sum()
+        resolution = algorithm_options.get('resolution')
+        resolution = 1 if resolution is None else resolution
+
+        component_communities = [None] * len(roots)
+        shards = list()
+        for component_id in range(len(roots)):
+            nodes = node_order[node_offsets[component_id]:node_offsets[component_id + 1]]
+            edges = edge_order[edge_offsets[component_id]:edge_offsets[component_id + 1]]
+            if len(nodes) == 1:
+                component_communities[component_id] = [[0]]
+                continue
+            component_src, component_dst, component_weight = local_ids[src[edges]], local_ids[dst[edges]], weight[edges]
+            if len(nodes) == 2:
+                # Two nodes are joined when it increases the modularity
+                together = _quality(np.array([0, 0]), component_src, component_dst, component_weight, total_weight, resolution)
+                apart = _quality(np.array([0, 1]), component_src, component_dst, component_weight, total_weight, resolution)
+                component_communities[component_id] = [[0, 1]] if together > apart else [[0], [1]]
+                continue
+            node_names = [compact_graph.node_names[node] for node in nodes.tolist()]
+            shards.append((component_id, (node_names, component_src, component_dst, component_weight, total_weight)))
+
+        self.number_of_components = len(roots)
+        self.number_of_isolated_nodes = int((sizes == 1).sum())
+        self.number_of_trivial_components = int((sizes == 2).sum())
+        self.number_of_clustered_components = len(shards)
+        logging.info(str(self))
+
+        for (component_id, _), communities in zip(shards, self._cluster_shards(algorithm, algorithm_options, shards)):
+            component_communities[component_id] = communities
+
+        communities_sets = list()
+        for component_id, communities in enumerate(component_communities):
+            nodes = node_order[node_offsets[component_id]:node_offsets[component_id + 1]]
+            communities_sets.extend({compact_graph.node_names[node] for node in nodes[community].tolist()} for community in communities)
+        return communities_sets
+
+    def _cluster_shards(self, algorithm: ClusteringAlgorithm, algorithm_options: dict, shards):
+        '''
+        Clusters the components of the shards, the largest first. The components are batched into tasks
+        of at least MIN_TASK_EDGES edges, run in this process when there is a single task or a single worker.
+        '''
+        order = sorted(range(len(shards)), key=lambda shard_id: -len(shards[shard_id][1][1]))
+        tasks = list()
+        task_edges = MIN_TASK_EDGES
+        for shard_id in order:
+            if task_edges >= MIN_TASK_EDGES:
+                tasks.append(list())
+                task_edges = 0
+            tasks[-1].append(shard_id)
+            task_edges += len(shards[shard_id][1][1])
+
+        task_shards = [[shards[shard_id][1] for shard_id in task] for task in tasks]
+        if self.max_workers == 1 or len(tasks) <= 1:
+            outcomes = [_cluster_components(algorithm, algorithm_options, shard_batch) for shard_batch in task_shards]
+        else:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context) as executor:
+                worker_outcomes = list(executor.map(partial(worker_task, _cluster_components),
+                                                    [algorithm] * len(tasks), [algorithm_options] * len(tasks), task_shards))
+            outcomes = [task_outcomes for task_outcomes, _ in worker_outcomes]
+            for _, worker_peak_rss in worker_outcomes:
+                record_worker_peak_rss(worker_peak_rss)
+
+        communities = [None] * len(shards)
+        for task, task_outcomes in zip(tasks, outcomes):
+            for shard_id, shard_communities in zip(task, task_outcomes):
+                communities[shard_id] = shard_communities
+        return communities
+
+    def __str__(self):
+        return (f'{self.number_of_components} weakly connected components: {self.number_of_isolated_nodes} isolated nodes, '
+                f'{self.number_of_trivial_components} two-node components and {self.number_of_clustered_components} clustered components.')
@@ -0,0 +1,208 @@
+import heapq
+import logging
+import random
+from bisect import insort
+from collections import deque
+import networkx as nx
+
+def _modularity_degrees(nx_graph):
+    '''
+    Computes the weighted in and out-degrees and total edge weight used by the directed modularity.
+    '''
+    out_degree = dict(nx_graph.out_degree(weight='weight'))
+    in_degree = dict(nx_graph.in_degree(weight='weight'))
+    m = sum(out_degree.values())
+    return out_degree, in_degree, m
+
+def _community_contribution(nx_graph, community, out_degree, in_degree, m, resolution=1):
+    '''
+    Contribution of a single community to the directed modularity of a partition,
+    computed the same way as nx.community.modularity so the scores are identical.
+    '''
+    L_c = sum(wt for u, v, wt in nx_graph.edges(community, data='weight', default=1) if v in community)
+    out_degree_sum = sum(out_degree[u] for u in community)
+    in_degree_sum = sum(in_degree[u] for u in community)
+    return L_c / m - resolution * out_degree_sum * in_degree_sum * (1 / m**2)
+
+def _reachable_nodes(graph, source):
+    '''
+    Returns the set of nodes reachable from source in an undirected graph.
+    '''
+    seen = {source}
+    next_level = [source]
+    while next_level:
+        this_level = next_level
+        next_level = list()
+        for v in this_level:
+            for w in graph[v]:
+                if w not in seen:
+                    seen.add(w)
+                    next_level.append(w)
+    return seen
+
+def _edge_betweenness(graph, sources, node_position):
+    '''
+    Accumulates the (unscaled) shortest-path edge betweenness from the given sources with Brandes' algorithm,
+    following the same BFS and accumulation order as nx.edge_betweenness_centrality. Edges are keyed by
+    their endpoints ordered on their position in the graph, parallel edges sharing one entry.
+    '''
+    betweenness = dict()
+    for s in sources:
+        S = list()
+        P = {s: list()}
+        sigma = {s: 1.0}
+        D = {s: 0}
+        Q = deque([s])
+        while Q:
+            v = Q.popleft()
+            S.append(v)
+            Dv = D[v]
+            sigmav = sigma[v]
+            for w in graph[v]:
+                if w not in D:
+                    Q.append(w)
+                    D[w] = Dv + 1
+                    sigma[w] = 0.0
+                    P[w] = list()
+                if D[w] == Dv + 1:
+                    sigma[w] += sigmav
+                    P[w].append(v)
+
+        delta = dict.fromkeys(S, 0)
+        while S:
+            w = S.pop()
+            coeff = (1 + delta[w]) / sigma[w]
+            for v in P[w]:
+                c = sigma[v] * coeff
+                pair = (v, w) if node_position[v] < node_position[w] else (w, v)
+                betweenness[pair] = betweenness.get(pair, 0.0) + c
+                delta[v] += c
+    return betweenness
+
+def _most_central_edge(graph, component, node_position, edge_rank, betweenness_sample_size, rng):
+    '''
+    Returns (betweenness, rank, edge) of the edge with the highest betweenness inside a component,
+    or None if the component has no edges. Only the sources of the component contribute to the betweenness
+    of its edges, so the values are those of a betweenness computation over the full graph.
+    Betweenness is approximated from sampled sources when the component has more nodes than betweenness_sample_size.
+    '''
+    sources = sorted(component, key=node_position.get)
+    n = len(graph)
+    scale = 1 / (n * (n - 1)) if n > 1 else 1
+    if betweenness_sample_size is not None and betweenness_sample_size < len(sources):
+        scale = scale * len(sources) / betweenness_sample_size
+        sources = rng.sample(sources, betweenness_sample_size)
+
+    best = None
+    for (u, v), value in _edge_betweenness(graph, sources, node_position).items():
+        # The betweenness of a pair of nodes is divided among its parallel edges
+        keys = graph[u][v]
+        value = value * scale / len(keys)
+        # Ties are broken on the position of the edge in the graph, like max() over the full graph's betweenness
+        rank = edge_rank[(u, v, next(iter(keys)))]
+        if best is None or value > best[0] or (value == best[0] and rank < best[1]):
+            best = (value, rank, (u, v, next(iter(keys))))
+    return best
+
+def girvan_newman_levels(nx_graph, betweenness_sample_size=None, seed=None, resolution=None):
+    '''
+    Incremental Girvan-Newman dendrogram. Yields (level, graph, modularity) every time a component splits,
+    where graph is the undirected working graph at that level (its connected components are the communities)
+    and modularity is the directed modularity of those communities on nx_graph (with a resolution parameter when given).
+
+    Unlike nx.community.girvan_newman, the edge betweenness is only recomputed inside the component the
+    last edge was removed from, and the modularity is updated from the contributions of the two components
+    of a split instead of being recomputed over the whole partition. With exact betweenness
+    (betweenness_sample_size=None) the levels are the same as those of nx.community.girvan_newman.
+    '''
+    graph = nx_graph.to_undirected()
+    graph.remove_edges_from(list(nx.selfloop_edges(graph)))
+    rng = random.Random(seed)
+    resolution = 1 if resolution is None else resolution
+
+    out_degree, in_degree, m = _modularity_degrees(nx_graph)
+    node_position = {node: position for position, node in enumerate(graph)}
+    edge_rank = {edge: rank for rank, edge in enumerate(graph.edges(keys=True))}
+
+    components = dict()
+    contributions = dict()
+    # Components ordered on their first node, the order in which nx.connected_components lists them
+    component_order = list()
+    central_edges = list()
+    versions = dict()
+
+    def add_component(component_id, component):
+        components[component_id] = component
+        contributions[component_id] = _community_contribution(nx_graph, component, out_degree, in_degree, m, resolution) if m else 0
+        versions[component_id] = versions.get(component_id, -1) + 1
+        central_edge = _most_central_edge(graph, component, node_position, edge_rank, betweenness_sample_size, rng)
+        if central_edge is not None:
+            value, rank, edge = central_edge
+            heapq.heappush(central_edges, (-value, rank, component_id, versions[component_id], edge))
+
+    for component_id, component in enumerate(nx.connected_components(graph)):
+        add_component(component_id, component)
+        component_order.append((min(node_position[node] for node in component), component_id))
+    next_component_id = len(components)
+
+    level = 0
+    while graph.number_of_edges() > 0:
+        while True:
+            _, _, component_id, version, (u, v, key) = heapq.heappop(central_edges)
+            if versions[component_id] != version:
+                continue
+            graph.remove_edge(u, v, key)
+            component = components[component_id]
+            reachable = _reachable_nodes(graph, u)
+            if v in reachable:
+                add_component(component_id, component)
+                continue
+            # The component split: the part holding its first node keeps the id and position
+            first_node = min(component, key=node_position.get)
+            kept, split = (reachable, component - reachable) if first_node in reachable else (component - reachable, reachable)
+            add_component(component_id, kept)
+            add_component(next_component_id, split)
+            insort(component_order, (min(node_position[node] for node in split), next_component_id))
+            next_component_id += 1
+            break
+
+        level += 1
+        modularity = sum(contributions[component_id] for _, component_id in component_order)
+        yield level, graph, modularity
+
+def girvan_newman_best_partition(nx_graph, patience=None, betweenness_sample_size=None, seed=None, resolution=None):
+    '''
+    Runs the incremental Girvan-Newman algorithm and returns the communities of the level with the
+    highest modularity, together with that level and its modularity.
+    If patience is given, the dendrogram is no longer explored once the modularity has not improved
+    for that many levels.
+    '''
+    max_modularity = 0
+    optimal_level = None
+    optimal_i = None
+    last_i = 0
+    last_graph = nx_graph.to_undirected(as_view=True)
+    levels_without_improvement = 0
+
+    for i, graph, current_modularity in girvan_newman_levels(nx_graph, betweenness_sample_size, seed, resolution):
+        logging.info(f'Modularity score at level {i} is {current_modularity}')
+        last_i, last_graph = i, graph
+
+        # Update the max modularity if the current modularity is higher
+        if current_modularity > max_modularity:
+            max_modularity = current_modularity
+            optimal_level = list(nx.connected_components(graph))
+            optimal_i = i
+            levels_without_improvement = 0
+        else:
+            levels_without_improvement += 1
+            if patience is not None and levels_without_improvement >= patience:
+                logging.info(f'Modularity did not improve for {patience} levels, stopping at level {i}.')
+                break
+
+    if optimal_level is None:
+        logging.warning("No optimal level found; using the last level.")
+        optimal_level = list(nx.connected_components(last_graph))
+        optimal_i = last_i
+
+    return optimal_level, optimal_i, max_modularity
@@ -0,0 +1,95 @@
+import logging
+import numpy as np
+from ..utils.utils import get_igraph
+from ..utils.profiling import stage
+from results.graph import Graph
+from results.compact_graph import CompactGraph, as_compact_graph
+from results.cluster import Cluster, ClustersInformation, ClusterTree
+from results.partition_quality import batch_modularity
+from pipeline_tools.cluster_analysis.cluster_identification import ClusteringAlgorithm
+from pipeline_tools.cluster_analysis.incremental_clustering import DEFAULT_SEEDS
+from pipeline_tools.cluster_analysis.modularity_optimisation import louvain_levels, leiden_levels
+
+def _cluster_ids(membership):
+    '''Numbers the communities of a membership from 1, in the order of their labels.'''
+    _, cluster_ids = np.unique(np.asarray(membership), return_inverse=True)
+    return cluster_ids.ravel() + 1
+
+def build_cluster_tree(compact_graph: CompactGraph, algorithm: ClusteringAlgorithm, level_memberships):
+    '''
+    Assembles the ClusterTree of nested memberships of the nodes, given from the finest to the coarsest level.
+    Consecutive levels with the same clusters are merged. The edges are classified once for all levels:
+    an edge is intra-cluster from the first level its endpoints share a cluster at.
+    '''
+    memberships = list()
+    for membership in level_memberships:
+        cluster_ids = _cluster_ids(membership)
+        if memberships and cluster_ids.max(initial=0) == memberships[-1].max(initial=0):
+            # Nested levels with as many clusters are the same partition
+            memberships[-1] = cluster_ids
+        else:
+            memberships.append(cluster_ids)
+
+    src, dst, _ = compact_graph.as_numpy()
+    edge_merge_levels = np.full(compact_graph.num_edges, len(memberships) + 1, dtype=np.int32)
+    # From the coarsest level down, so every edge ends up with the finest level it is intra-cluster at
+    for level in range(len(memberships), 0, -1):
+        membership = memberships[level - 1]
+        edge_merge_levels[membership[src] == membership[dst]] = level
+
+    modularities = batch_modularity(compact_graph.sparse_adjacency(), np.stack(memberships)).tolist() if memberships else list()
+    return ClusterTree(algorithm.name, compact_graph.node_names, memberships, edge_merge_levels, modularities)
+
+def identify_cluster_tree(graph_repr: Graph | CompactGraph, algorithm: ClusteringAlgorithm, seed=None, resolution=None, backend='igraph'):
+    '''
+    Identify the clusters of a graph at every aggregation level of the Louvain method or of the Leiden algorithm.
+    The final level is the partition identify_clusters finds with the same options.
+    '''
+    if algorithm not in DEFAULT_SEEDS:
+        raise ValueError(f'Hierarchical clustering is not supported for {algorithm.name}')
+    if backend != 'igraph':
+        raise ValueError(f'Hierarchical clustering is only supported with the igraph backend, not {backend}')
+    seed = DEFAULT_SEEDS[algorithm] if seed is None else seed
+
+    compact_graph = as_compact_graph(graph_repr)
+    with stage('clustering'):
+        logging.info(f'BEGIN: Hierarchical cluster identification from Graph representation using {algorithm.name}.')
+        if algorithm == ClusteringAlgorithm.LOUVAIN:
+            level_memberships = louvain_levels(get_igraph(compact_graph), seed, resolution)
+        else:
+            level_memberships = leiden_levels(get_igraph(compact_graph), seed, resolution)
+        cluster_tree = build_cluster_tree(compact_graph, algorithm, level_memberships)
+        logging.info(str(cluster_tree))
+        logging.info(f'Modularity of the clusters is: {cluster_tree.modularities[-1]}')
+        logging.info(f'END: Hierarchical cluster identification from Graph representation using {algorithm.name}.')
+    return cluster_tree
+
+def clusters_information_at_level(graph_repr: Graph | CompactGraph, cluster_tree: ClusterTree, level: int):
+    '''
+    Assemble the ClustersInformation of one level of a cluster tree, from the edge classification of the tree.
+    The nodes and edges of every cluster and the inter-cluster edges are in the order of the graph.
+    '''
+    if not 1 <= level <= cluster_tree.number_of_levels:
+        raise ValueError(f'Level {level} is not in the cluster tree, which has {cluster_tree.number_of_levels} levels')
+    compact_graph = as_compact_graph(graph_repr)
+    if isinstance(graph_repr, CompactGraph):
+        with stage('graph_objects'):
+            graph_repr = graph_repr.graph_view()
+
+    membership = cluster_tree.memberships[level - 1]
+    clusters = [Cluster(cluster_id, list(), list()) for cluster_id in range(1, cluster_tree.number_of_clusters(level) + 1)]
+    for node, cluster_id in zip(graph_repr.nodes, membership.tolist()):
+        clusters[cluster_id - 1].nodes.append(node)
+
+    src, _, _ = compact_graph.as_numpy()
+    inter_cluster_edges = list()
+    intra_cluster = (cluster_tree.edge_merge_levels <= level).tolist()
+    for edge, is_intra_cluster, cluster_id in zip(graph_repr.edges, intra_cluster, membership[src].tolist()):
+        if is_intra_cluster:
+            clusters[cluster_id - 1].intra_cluster_edges.append(edge)
+        else:
+            inter_cluster_edges.append(edge)
+
+    clusters_info = ClustersInformation(clusters)
+    clusters_info.inter_cluster_edges = inter_cluster_edges
+    return clusters_info
@@ -0,0 +1,180 @@
+from collections import Counter
+import logging
+from ..utils.utils import get_igraph
+from results.compact_graph import CompactGraph
+from results.cluster import ClustersInformation, ClustersDelta
+from pipeline_tools.cluster_analysis.cluster_identification import ClusteringAlgorithm
+from pipeline_tools.cluster_analysis.modularity_optimisation import communities_from_membership
+
+# Seeds of the full runs of the algorithms, reused for the incremental runs
+DEFAULT_SEEDS = {ClusteringAlgorithm.LOUVAIN: 2247, ClusteringAlgorithm.LEIDEN: 42}
+
+class GraphDiff:
+    def __init__(self, added_nodes, removed_nodes, added_edges, removed_edges, affected_nodes) -> None:
+        self.added_nodes: list[str] = added_nodes
+        self.removed_nodes: list[str] = removed_nodes
+        self.added_edges: Counter = added_edges
+        self.removed_edges: Counter = removed_edges
+        # Nodes of the new graph that were added or gained or lost an edge
+        self.affected_nodes: set[str] = affected_nodes
+
+    def is_empty(self):
+        return not (self.added_nodes or self.removed_nodes or self.added_edges or self.removed_edges)
+
+    def __str__(self):
+        return (f'Graph diff: {len(self.added_nodes)} added nodes, {len(self.removed_nodes)} removed nodes, '
+                f'{self.added_edges.total()} added edges, {self.removed_edges.total()} removed edges, '
+                f'{len(self.affected_nodes)} affected nodes')
+
+def edge_key(source: str, destination: str, link_method: tuple, source_method: tuple, weight):
+    '''
+    Identity of an edge across graphs: its endpoint names, the fields of its methods and its weight.
+    '''
+    return (source, destination, link_method, source_method, weight)
+
+def compact_graph_edge_keys(compact_graph: CompactGraph):
+    '''
+    Returns the multiset of the edge keys of a compact graph.
+    '''
+    names = compact_graph.node_names
+    methods = list(compact_graph.methods)
+    return Counter(edge_key(names[compact_graph.src[i]], names[compact_graph.dst[i]], methods[compact_graph.link_method[i]],
+                            methods[compact_graph.source_method[i]], compact_graph.weight[i])
+                   for i in range(compact_graph.num_edges))
+
+def diff_graphs(previous: CompactGraph, current: CompactGraph):
+    '''
+    Diffs the nodes and edges of two versions of a graph.
+    '''
+    added_nodes = [name for name in current.node_names if name not in previous.node_ids]
+    removed_nodes = [name for name in previous.node_names if name not in current.node_ids]
+    previous_edges = compact_graph_edge_keys(previous)
+    current_edges = compact_graph_edge_keys(current)
+    added_edges = current_edges - previous_edges
+    removed_edges = previous_edges - current_edges
+
+    affected_nodes = set(added_nodes)
+    for source, destination, *_ in list(added_edges) + list(removed_edges):
+        affected_nodes.update(node for node in (source, destination) if node in current.node_ids)
+    return GraphDiff(added_nodes, removed_nodes, added_edges, removed_edges, affected_nodes)
+
+def _neighbourhood(compact_graph: CompactGraph, node_ids: set[int], depth: int):
+    '''
+    Returns the node ids within depth hops of the given nodes, ignoring the direction of the edges.
+    '''
+    neighbours = [list() for _ in range(compact_graph.num_nodes)]
+    for source_id, destination_id in zip(compact_graph.src, compact_graph.dst):
+        neighbours[source_id].append(destination_id)
+        neighbours[destination_id].append(source_id)
+    reached = set(node_ids)
+    frontier = set(node_ids)
+    for _ in range(depth):
+        frontier = {neighbour for node_id in frontier for neighbour in neighbours[node_id]} - reached
+        reached |= frontier
+    return reached
+
+def seeded_membership(compact_graph: CompactGraph, previous_communities, freed_node_ids: set[int]):
+    '''
+    Initial membership of the nodes of the new graph: every node keeps the index of its previous community,
+    while the freed nodes and the nodes that are new to the graph start as singletons.
+    Returns the membership and which nodes are fixed to their previous community.
+    '''
+    previous_community = {node: index for index, community in enumerate(previous_communities) for node in community}
+    next_label = len(previous_communities)
+    membership = list()
+    fixed = list()
+    for node_id, name in enumerate(compact_graph.node_names):
+        label = previous_community.get(name)
+        if label is None or node_id in freed_node_ids:
+            membership.append(next_label)
+            fixed.append(False)
+            next_label += 1
+        else:
+            membership.append(label)
+            fixed.append(True)
+    return membership, fixed
+
+def recluster_incrementally(compact_graph: CompactGraph, algorithm: ClusteringAlgorithm, previous_communities, diff: GraphDiff,
+                            seed=None, resolution=None, depth=1):
+    '''
+    Re-optimises a previous partition after the graph changed. Only the affected nodes of the diff and their
+    neighbours within depth hops are freed and moved; the other nodes stay in their previous community.
+    Returns the communities as node name sets: the communities that hold nodes of a previous community
+    first, in the previous order, then the new ones.
+    '''
+    if algorithm not in DEFAULT_SEEDS:
+        raise ValueError(f'Incremental clustering is not supported for {algorithm.name}')
+    seed = DEFAULT_SEEDS[algorithm] if seed is None else seed
+
+    freed_node_ids = _neighbourhood(compact_graph, {compact_graph.node_ids[node] for node in diff.affected_nodes}, depth)
+    membership, fixed = seeded_membership(compact_graph, previous_communities, freed_node_ids)
+    logging.info(f'Incremental clustering: {len(freed_node_ids)} of {compact_graph.num_nodes} nodes are re-optimised.')
+
+    import leidenalg
+    ig_graph = get_igraph(compact_graph)
+    if resolution is None:
+        partition = leidenalg.ModularityVertexPartition(ig_graph, initial_membership=membership, weights='weight')
+    else:
+        partition = leidenalg.RBConfigurationVertexPartition(ig_graph, initial_membership=membership, weights='weight',
+                                                             resolution_parameter=resolution)
+    optimiser = leidenalg.Optimiser()
+    optimiser.set_rng_seed(seed)
+    if algorithm == ClusteringAlgorithm.LEIDEN:
+        optimiser.optimise_partition(partition, n_iterations=2, is_membership_fixed=fixed)
+    else:
+        # Louvain: only the local moving of the freed nodes, the fixed nodes keep the previous aggregation
+        while optimiser.move_nodes(partition, is_membership_fixed=fixed) > 0:
+            pass
+
+    # Communities holding fixed nodes take the index of their previous community, the others follow
+    order = dict()
+    for node_id, label in enumerate(partition.membership):
+        if fixed[node_id]:
+            order[label] = membership[node_id]
+    for node_id, label in enumerate(partition.membership):
+        order.setdefault(label, len(previous_communities) + node_id)
+    ranks = {label: rank for rank, label in enumerate(sorted(order, key=order.get))}
+    return communities_from_membership([ranks[label] for label in partition.membership], compact_graph.node_names)
+
+def _method_key(method):
+    parameters = tuple((param.get('type', ''), param.get('name', '')) for param in method.parameters)
+    return (method.name, parameters, method.return_type, method.declaring_class, method.signature)
+
+def _cluster_edge_key(edge):
+    return edge_key(edge.source.name, edge.destination.name, _method_key(edge.method), _method_key(edge.source_method), edge.weight)
+
+def clusters_delta(previous_clusters: ClustersInformation, clusters: ClustersInformation, diff: GraphDiff):
+    '''
+    Computes the changes between the clusters of two versions of a graph: the clusters whose nodes or
+    intra-cluster edges changed, the previous clusters that no longer exist and the added and removed
+    inter-cluster edges.
+    '''
+    previous_clusters_by_nodes = {frozenset(node.name for node in cluster.nodes): cluster for cluster in previous_clusters.clusters}
+    current_node_sets = set()
+    changed_clusters = list()
+    for cluster in clusters.clusters:
+        node_set = frozenset(node.name for node in cluster.nodes)
+        current_node_sets.add(node_set)
+        if node_set not in previous_clusters_by_nodes or not node_set.isdisjoint(diff.affected_nodes):
+            changed_clusters.append(cluster)
+    removed_cluster_ids = [cluster.id for node_set, cluster in previous_clusters_by_nodes.items() if node_set not in current_node_sets]
+
+    previous_inter_edges = Counter(_cluster_edge_key(edge) for edge in previous_clusters.inter_cluster_edges)
+    current_inter_edges = Counter(_cluster_edge_key(edge) for edge in clusters.inter_cluster_edges)
+    added_inter_edges = current_inter_edges - previous_inter_edges
+    removed_inter_edges = previous_inter_edges - current_inter_edges
+    added_inter_cluster_edges = list()
+    for edge in clusters.inter_cluster_edges:
+        key = _cluster_edge_key(edge)
+        if added_inter_edges[key] > 0:
+            added_inter_edges[key] -= 1
+            added_inter_cluster_edges.append(edge)
+    removed_inter_cluster_edges = list()
+    for edge in previous_clusters.inter_cluster_edges:
+        key = _cluster_edge_key(edge)
+        if removed_inter_edges[key] > 0:
+            removed_inter_edges[key] -= 1
+            removed_inter_cluster_edges.append(edge)
+
+    return ClustersDelta(diff.added_nodes, diff.removed_nodes, changed_clusters, removed_cluster_ids,
+                         added_inter_cluster_edges, removed_inter_cluster_edges)
@@ -13,16 +13,32 @@ def find_cluster_of_node(clusters: ClustersInformation, node_name: str):
     logging.warning(f'Cluster of node {node_name} not found.')
     return None
 
-def find_inter_cluster_edges(graph: Graph, clusters: ClustersInformation):
+def build_node_cluster_map(clusters: ClustersInformation) -> dict[str, int]:
     '''
-    Identifies inter-cluster edges.
+    Builds the membership map from node name to the id of its cluster.
+    '''
+    return {node.name: cluster.id for cluster in clusters.clusters for node in cluster.nodes}
+
+def partition_edges(graph: Graph, node_cluster_map: dict[str, int]):
+    '''
+    Buckets every edge of the graph in a single pass, using the node to cluster id membership map.
+    Returns the intra-cluster edges per cluster id and the list of inter-cluster edges,
+    both in the order of the graph's edges.
     '''
+    intra_cluster_edges: dict[int, list[Edge]] = dict()
     inter_cluster_edges = list()
     for edge in graph.edges:
-        src_cluster = find_cluster_of_node(clusters, edge.source)
-        dest_cluster = find_cluster_of_node(clusters, edge.destination)
+        src_cluster = node_cluster_map.get(edge.source.name)
+        dest_cluster = node_cluster_map.get(edge.destination.name)
         if src_cluster != dest_cluster:
             inter_cluster_edges.append(edge)
-    return inter_cluster_edges
-
+        elif src_cluster is not None:
+            intra_cluster_edges.setdefault(src_cluster, list()).append(edge)
+    return intra_cluster_edges, inter_cluster_edges
 
+def find_inter_cluster_edges(graph: Graph, clusters: ClustersInformation):
+    '''
+    Identifies inter-cluster edges.
+    '''
+    _, inter_cluster_edges = partition_edges(graph, build_node_cluster_map(clusters))
+    return inter_cluster_edges
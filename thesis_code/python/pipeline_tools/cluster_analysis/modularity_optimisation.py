@@ -0,0 +1,91 @@
+# leidenalg (and igraph with it) is only imported once an algorithm runs, so that importing the helpers of this module stays cheap
+
+def _vertex_partition(ig_graph, resolution=None):
+    '''
+    Initial singleton partition optimising modularity, or the RB configuration model
+    (modularity with a resolution parameter) when a resolution is given.
+    '''
+    import leidenalg
+    if resolution is None:
+        return leidenalg.ModularityVertexPartition(ig_graph, weights='weight')
+    return leidenalg.RBConfigurationVertexPartition(ig_graph, weights='weight', resolution_parameter=resolution)
+
+def _optimiser(seed):
+    '''leidenalg optimiser with its random number generator seeded.'''
+    import leidenalg
+    optimiser = leidenalg.Optimiser()
+    optimiser.set_rng_seed(seed)
+    return optimiser
+
+def louvain_levels(ig_graph, seed, resolution=None):
+    '''
+    Runs the Louvain method on an igraph graph with leidenalg's node moving and aggregation steps,
+    without the Leiden refinement. Returns the community label of every vertex after every aggregation level,
+    from the finest level to the final partition.
+    '''
+    partition = _vertex_partition(ig_graph, resolution)
+    optimiser = _optimiser(seed)
+    # Louvain: local moving of nodes, then aggregation of the communities, until no node moves
+    levels = list()
+    aggregate_partition = partition.aggregate_partition()
+    while optimiser.move_nodes(aggregate_partition) > 0:
+        partition.from_coarse_partition(aggregate_partition)
+        levels.append(partition.membership)
+        aggregate_partition = aggregate_partition.aggregate_partition()
+    return levels or [partition.membership]
+
+def louvain_membership(ig_graph, seed, resolution=None):
+    '''
+    Runs the Louvain method on an igraph graph. Returns the community label of every vertex.
+    '''
+    return louvain_levels(ig_graph, seed, resolution)[-1]
+
+def leiden_levels(ig_graph, seed, resolution=None, n_iterations=2):
+    '''
+    Runs the Leiden algorithm on an igraph graph, step by step as leidenalg's Optimiser.optimise_partition does,
+    so the final partition is the one of leiden_membership. Returns the community label of every vertex at every
+    aggregation level of the last iteration, the refined communities aggregated into the nodes of the next level,
+    and then in the final partition. Every level is nested in the next one.
+    '''
+    partition = _vertex_partition(ig_graph, resolution)
+    optimiser = _optimiser(seed)
+    for _ in range(n_iterations):
+        levels = list()
+        collapsed_partition = partition
+        # Singleton partition of the aggregate graph, the start of the refinement
+        refined_partition = _vertex_partition(ig_graph, resolution)
+        aggregate_node = list(range(ig_graph.vcount()))
+        while True:
+            optimiser.move_nodes(collapsed_partition)
+            partition.from_coarse_partition(collapsed_partition, aggregate_node)
+            optimiser.merge_nodes_constrained(refined_partition, collapsed_partition)
+            aggregate_node = [refined_partition.membership[node] for node in aggregate_node]
+            levels.append(aggregate_node)
+            aggregate_partition = refined_partition.aggregate_partition(collapsed_partition)
+            aggregate_further = (aggregate_partition.graph.vcount() < collapsed_partition.graph.vcount()
+                                 and collapsed_partition.graph.vcount() > len(collapsed_partition))
+            if not aggregate_further:
+                break
+            # The aggregate graph again with a singleton partition, for the refinement of the next level
+            refined_partition = refined_partition.aggregate_partition()
+            collapsed_partition = aggregate_partition
+        partition.renumber_communities()
+    return levels + [partition.membership]
+
+def leiden_membership(ig_graph, seed, resolution=None):
+    '''
+    Runs the Leiden algorithm on an igraph graph. Returns the community label of every vertex.
+    '''
+    partition = _vertex_partition(ig_graph, resolution)
+    optimiser = _optimiser(seed)
+    optimiser.optimise_partition(partition, n_iterations=2)
+    return partition.membership
+
+def communities_from_membership(membership, node_names):
+    '''
+    Groups node names into communities of node name sets, ordered on their label.
+    '''
+    communities = [set() for _ in range(max(membership, default=-1) + 1)]
+    for node_name, label in zip(node_names, membership):
+        communities[label].add(node_name)
+    return [community for community in communities if community]
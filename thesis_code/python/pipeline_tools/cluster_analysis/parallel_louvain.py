@@ -0,0 +1,216 @@
+'''
+Louvain method on the edge arrays of a compact graph, with a vectorized local moving phase.
+
+In every round, the best move of every node is computed at once with NumPy from a snapshot of the communities,
+over chunks of nodes processed by a thread pool (NumPy releases the GIL in its sorts and array operations).
+The nodes are split into a few chunks per thread with about as many incident edges each.
+A random half of the improving moves is applied, the rest waiting for the next round, so that neighbouring nodes
+rarely swap communities with each other; a round that lowers the modularity is undone and retried with fewer moves.
+In deterministic mode, the moves of a round only depend on the seed, whatever the number of threads.
+Otherwise every chunk applies its moves as soon as they are computed, which converges in fewer rounds
+but depends on the order in which the threads finish.
+'''
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from results.compact_graph import CompactGraph
+
+# Chunks of nodes per thread, so that threads finishing early take over the remaining chunks
+CHUNKS_PER_WORKER = 4
+# Fewest nodes in a chunk, below which splitting costs more in NumPy calls than the threads give back
+MIN_CHUNK_SIZE = 1 << 10
+# Fraction of the improving moves applied in a round, halved when a round lowers the modularity
+MOVE_PROBABILITY = 0.5
+MIN_MOVE_PROBABILITY = 1 / 64
+MAX_ROUNDS = 200
+TOLERANCE = 1e-12
+
+class _LevelGraph:
+    '''
+    Weighted directed graph of one aggregation level, with the incident edges of every node
+    in both directions (without self-loops) grouped per node.
+    '''
+    def __init__(self, num_nodes: int, src: np.ndarray, dst: np.ndarray, weight: np.ndarray) -> None:
+        self.num_nodes = num_nodes
+        self.src = src
+        self.dst = dst
+        self.weight = weight
+        self.total_weight = weight.sum()
+        self.out_degree = np.bincount(src, weights=weight, minlength=num_nodes)
+        self.in_degree = np.bincount(dst, weights=weight, minlength=num_nodes)
+
+        not_loop = src != dst
+        nodes = np.concatenate((src[not_loop], dst[not_loop]))
+        order = np.argsort(nodes, kind='stable')
+        self.neighbours = np.concatenate((dst[not_loop], src[not_loop]))[order]
+        self.neighbour_weights = np.concatenate((weight[not_loop], weight[not_loop]))[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(nodes, minlength=num_nodes))))
+
+    def aggregate(self, membership: np.ndarray, num_communities: int) -> '_LevelGraph':
+        '''Graph of the communities, the edges between two communities merged into one weighted edge.'''
+        keys = membership[self.src].astype(np.int64) * num_communities + membership[self.dst]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        weight = np.bincount(inverse.ravel(), weights=self.weight, minlength=len(keys))
+        return _LevelGraph(num_communities, keys // num_communities, keys % num_communities, weight)
+
+    def modularity(self, membership: np.ndarray, resolution: float):
+        community_out = np.bincount(membership, weights=self.out_degree, minlength=self.num_nodes)
+        community_in = np.bincount(membership, weights=self.in_degree, minlength=self.num_nodes)
+        intra_weight = self.weight[membership[self.src] == membership[self.dst]].sum()
+        m = self.total_weight
+        return intra_weight / m - resolution * np.dot(community_out, community_in) / m**2
+
+def _best_moves(graph: _LevelGraph, membership, community_out, community_in, community_size, first, last, resolution):
+    '''
+    Best move of the nodes first to last - 1: the neighbouring community whose directed modularity gain is the
+    highest, ties going to the lowest community label. Returns the nodes with an improving move and their targets.
+    '''
+    start, end = graph.offsets[first], graph.offsets[last]
+    if start == end:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    nodes = np.repeat(np.arange(first, last), np.diff(graph.offsets[first:last + 1]))
+    # Weight between every node and each of its neighbouring communities, in both directions
+    keys = (nodes - first).astype(np.int64) * graph.num_nodes + membership[graph.neighbours[start:end]]
+    keys, inverse = np.unique(keys, return_inverse=True)
+    links = np.bincount(inverse.ravel(), weights=graph.neighbour_weights[start:end], minlength=len(keys))
+    pair_nodes = keys // graph.num_nodes + first
+    pair_communities = keys % graph.num_nodes
+
+    # Gains of joining every neighbouring community and of staying, from the node on its own
+    m = graph.total_weight
+    node_out = graph.out_degree[pair_nodes]
+    node_in = graph.in_degree[pair_nodes]
+    own = pair_communities == membership[pair_nodes]
+    target_in = community_in[pair_communities] - np.where(own, node_in, 0)
+    target_out = community_out[pair_communities] - np.where(own, node_out, 0)
+    gains = links / m - resolution * (node_out * target_in + node_in * target_out) / m**2
+
+    chunk_nodes = np.arange(first, last)
+    own_community = membership[chunk_nodes]
+    own_links = np.bincount(pair_nodes[own] - first, weights=links[own], minlength=last - first)
+    own_gains = own_links / m - resolution * (graph.out_degree[chunk_nodes] * (community_in[own_community] - graph.in_degree[chunk_nodes])
+                                              + graph.in_degree[chunk_nodes] * (community_out[own_community] - graph.out_degree[chunk_nodes])) / m**2
+
+    # The pairs are sorted on node, then community: the first pair of a node with its highest gain is its best move
+    node_starts = np.flatnonzero(np.diff(pair_nodes, prepend=-1))
+    best_gains = np.maximum.reduceat(gains, node_starts)
+    candidates = np.flatnonzero(gains == np.repeat(best_gains, np.diff(node_starts, append=len(gains))))
+    best = candidates[np.diff(pair_nodes[candidates], prepend=-1) != 0]
+    best_nodes = pair_nodes[best]
+    targets = pair_communities[best]
+    improving = (gains[best] > own_gains[best_nodes - first] + TOLERANCE) & (targets != membership[best_nodes])
+    # Of two singletons joining each other, only the move to the lower label is made
+    singletons = (community_size[membership[best_nodes]] == 1) & (community_size[targets] == 1)
+    improving &= ~singletons | (targets < membership[best_nodes])
+    return best_nodes[improving], targets[improving]
+
+def _chunks(graph: _LevelGraph, workers: int):
+    '''
+    Contiguous ranges of nodes (first, last) covering the nodes of a level, CHUNKS_PER_WORKER per worker at most
+    and not smaller than MIN_CHUNK_SIZE, with about as many incident edges each.
+    '''
+    n = graph.num_nodes
+    number_of_chunks = max(1, min(workers * CHUNKS_PER_WORKER, n // MIN_CHUNK_SIZE))
+    boundaries = np.searchsorted(graph.offsets, np.linspace(0, graph.offsets[-1], number_of_chunks + 1)[1:-1])
+    boundaries = np.unique(np.concatenate(([0], boundaries, [n])))
+    return list(zip(boundaries[:-1].tolist(), boundaries[1:].tolist()))
+
+def _local_moving(graph: _LevelGraph, rng: np.random.Generator, resolution: float, executor, workers: int, deterministic: bool):
+    '''
+    Moves the nodes of a level between communities, starting from singletons, until no move improves the modularity.
+    Returns the membership and whether any node moved.
+    '''
+    n = graph.num_nodes
+    membership = np.arange(n)
+    community_out = graph.out_degree.copy()
+    community_in = graph.in_degree.copy()
+    community_size = np.ones(n, dtype=np.int64)
+    # The moves of a deterministic round are those of the nodes in order, however the nodes are chunked
+    chunks = _chunks(graph, workers)
+    lock = threading.Lock()
+
+    def apply(nodes, targets):
+        np.subtract.at(community_out, membership[nodes], graph.out_degree[nodes])
+        np.subtract.at(community_in, membership[nodes], graph.in_degree[nodes])
+        np.subtract.at(community_size, membership[nodes], 1)
+        membership[nodes] = targets
+        np.add.at(community_out, targets, graph.out_degree[nodes])
+        np.add.at(community_in, targets, graph.in_degree[nodes])
+        np.add.at(community_size, targets, 1)
+
+    def select(nodes, targets, probability, chunk_rng):
+        selected = chunk_rng.random(len(nodes)) < probability
+        if len(nodes) and not selected.any():
+            selected[chunk_rng.integers(len(nodes))] = True
+        return nodes[selected], targets[selected]
+
+    def move_chunk(chunk, probability, chunk_seed):
+        with lock:
+            snapshot = (membership.copy(), community_out.copy(), community_in.copy(), community_size.copy())
+        nodes, targets = _best_moves(graph, *snapshot, *chunk, resolution)
+        with lock:
+            apply(*select(nodes, targets, probability, np.random.default_rng(chunk_seed)))
+        return len(nodes)
+
+    modularity = graph.modularity(membership, resolution)
+    probability = MOVE_PROBABILITY
+    moved = False
+    for _ in range(MAX_ROUNDS):
+        previous = (membership.copy(), community_out.copy(), community_in.copy(), community_size.copy())
+        if deterministic:
+            moves = list(executor.map(lambda chunk: _best_moves(graph, membership, community_out, community_in, community_size,
+                                                                *chunk, resolution), chunks))
+            nodes = np.concatenate([chunk_nodes for chunk_nodes, _ in moves])
+            targets = np.concatenate([chunk_targets for _, chunk_targets in moves])
+            if len(nodes) == 0:
+                break
+            apply(*select(nodes, targets, probability, rng))
+        elif sum(executor.map(move_chunk, chunks, [probability] * len(chunks), rng.integers(2**32, size=len(chunks)).tolist())) == 0:
+            break
+
+        new_modularity = graph.modularity(membership, resolution)
+        if new_modularity < modularity - TOLERANCE:
+            # Too many nodes moved at once, undo the round and move fewer nodes
+            membership[:], community_out[:], community_in[:], community_size[:] = previous
+            probability /= 2
+            if probability < MIN_MOVE_PROBABILITY:
+                break
+            continue
+        moved = True
+        if new_modularity - modularity <= TOLERANCE:
+            break
+        modularity = new_modularity
+    return membership, moved
+
+def parallel_louvain_membership(compact_graph: CompactGraph, seed=2247, resolution=None, workers=None, deterministic=True):
+    '''
+    Runs the Louvain method on the collapsed edges of a compact graph, optimising the directed modularity
+    (with a resolution parameter when given). Returns the community label of every node.
+    The work of a level is split over `workers` threads, by default one per CPU.
+    '''
+    workers = workers or os.cpu_count() or 1
+    resolution = 1 if resolution is None else resolution
+    collapsed_edges = compact_graph.collapsed_edges()
+    graph = _LevelGraph(compact_graph.num_nodes, collapsed_edges.src.astype(np.int64), collapsed_edges.dst.astype(np.int64),
+                        collapsed_edges.weight)
+    node_membership = np.arange(compact_graph.num_nodes)
+    if graph.total_weight == 0:
+        return node_membership.tolist()
+
+    rng = np.random.default_rng(seed)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        level = 0
+        while True:
+            membership, moved = _local_moving(graph, rng, resolution, executor, workers, deterministic)
+            if not moved:
+                break
+            labels, membership = np.unique(membership, return_inverse=True)
+            membership = membership.ravel()
+            node_membership = membership[node_membership]
+            level += 1
+            logging.info(f'Parallel Louvain level {level}: {graph.num_nodes} nodes into {len(labels)} communities, '
+                         f'modularity {graph.modularity(membership, resolution)}')
+            graph = graph.aggregate(membership, len(labels))
+    return node_membership.tolist()
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+from results.compact_graph import CompactGraph
+from results.binary_cache import read_partition, write_partition
+
+# Part of every key, to be bumped when a change of the algorithms makes the cached partitions stale
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+def graph_structure_hash(compact_graph: CompactGraph):
+    '''
+    SHA-256 digest of what the clustering algorithms see of a graph: its node names in order and its weighted edges.
+    Graphs differing only in the methods of their edges have the same digest.
+    '''
+    digest = hashlib.sha256()
+    digest.update(struct.pack('<QQ', compact_graph.num_nodes, compact_graph.num_edges))
+    for name in compact_graph.node_names:
+        digest.update(name.encode('utf-8'))
+        digest.update(b'\0')
+    for edge_array in (compact_graph.src, compact_graph.dst, compact_graph.weight):
+        digest.update(edge_array.tobytes())
+    return digest.hexdigest()
+
+class PartitionCache:
+    '''
+    Content-addressed cache of partitions on disk, one binary clusters file per key.
+    The key is the digest of the graph structure, the algorithm and its options, so a partition is only reused
+    for the same input; identify_clusters does not use the cache for options that are not deterministic.
+    The least recently used partitions are evicted once the files take more than max_bytes. Several processes
+    may share a directory: an entry removed by another one is a miss.
+    '''
+    def __init__(self, directory: str, max_bytes=DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, compact_graph: CompactGraph, algorithm_name: str, algorithm_options: dict):
+        description = json.dumps({'version': CACHE_VERSION,
+                                  'graph': graph_structure_hash(compact_graph),
+                                  'algorithm': algorithm_name,
+                                  'options': algorithm_options}, sort_keys=True, default=str)
+        return hashlib.sha256(description.encode('utf-8')).digest()
+
+    def _path(self, key: bytes):
+        return os.path.join(self.directory, f'{key.hex()}.bin')
+
+    def get(self, key: bytes):
+        '''
+        Returns the cached partition as the ordered member node ids of every cluster, or None on a miss.
+        A hit marks the partition as the most recently used.
+        '''
+        path = self._path(key)
+        try:
+            communities = read_partition(path, key)
+        except (OSError, ValueError, struct.error) as e:
+            logging.warning(f'Partition cache entry {path} could not be read. Error: {e}')
+            communities = None
+        if communities is None:
+            self.misses += 1
+            logging.info(f'Partition cache miss for {key.hex()[:16]}.')
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted by another process since it was read
+            pass
+        self.hits += 1
+        logging.info(f'Partition cache hit for {key.hex()[:16]}, partition loaded from {path}.')
+        return communities
+
+    def put(self, key: bytes, communities: list[list[int]]):
+        '''Stores a partition, then evicts the least recently used partitions beyond the size limit.'''
+        os.makedirs(self.directory, exist_ok=True)
+        write_partition(communities, self._path(key), key)
+        self.evict()
+
+    def evict(self):
+        entries = list()
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.bin'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                logging.info(f'Partition cache entry {path} evicted.')
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def __str__(self):
+        return f'Partition cache {self.directory}: {self.hits} hits, {self.misses} misses'
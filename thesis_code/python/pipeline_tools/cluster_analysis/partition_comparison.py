@@ -0,0 +1,139 @@
+'''
+Pairwise comparison of partitions of the same graph, e.g. the clusters of Louvain, Leiden and Girvan-Newman.
+
+Every partition is a row of a label matrix over the node ids of the compact graph. The information-theoretic scores
+and the adjusted Rand index of a pair only depend on the non-empty cells of its contingency table, counted with one
+bincount of the combined labels; the entropies and pair counts of the partitions themselves are computed once.
+The inter-cluster edges of all partitions are compared at once, as a product of their edge masks.
+'''
+import json
+import numpy as np
+from results.compact_graph import CompactGraph
+from results.partition_quality import labels_from_communities
+from pipeline_tools.utils.utils import iter_json_array
+
+# Largest contingency table, relative to the number of nodes, counted densely with bincount rather than by sorting
+DENSE_CONTINGENCY_FACTOR = 8
+# Collapsed edges per block of the edge mask product, which bounds its memory
+EDGE_BLOCK_SIZE = 1 << 16
+
+def read_clusters_report_labels(clusters_path: str, compact_graph: CompactGraph):
+    '''Label array of the partition of a clusters report (clusters.json), streamed cluster by cluster.'''
+    communities = [[node['name'] for node in cluster['nodes']] for cluster in iter_json_array(clusters_path, 'clusters', strict=True)]
+    return labels_from_communities(communities, compact_graph)
+
+def _entropy_terms(counts: np.ndarray):
+    '''Sum of c log c and of c (c - 1) / 2 over counts.'''
+    counts = counts[counts > 0].astype(np.float64)
+    return float(np.dot(counts, np.log(counts))), float(np.dot(counts, counts - 1) / 2)
+
+def _contingency_counts(labels_a: np.ndarray, number_a: int, labels_b: np.ndarray, number_b: int):
+    '''Counts of the non-empty cells of the contingency table of two label arrays.'''
+    keys = labels_a * number_b + labels_b
+    if number_a * number_b <= DENSE_CONTINGENCY_FACTOR * len(keys):
+        return np.bincount(keys, minlength=number_a * number_b)
+    keys = np.sort(keys)
+    cell_starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return np.diff(np.append(cell_starts, len(keys)))
+
+class PartitionComparison:
+    '''
+    Similarity matrices of named partitions of the same graph, given as a label matrix (one row per partition):
+    the normalized mutual information (arithmetic mean normalization, as igraph's compare_communities),
+    the adjusted Rand index, the variation of information (in nats) and the overlap of their inter-cluster edges,
+    the Jaccard index of their sets of inter-cluster call sites.
+    '''
+    def __init__(self, names: list[str], labels: np.ndarray, compact_graph: CompactGraph) -> None:
+        self.names = names
+        self.number_of_nodes = labels.shape[1]
+        # Labels renumbered from 0 in every row, so the contingency tables are as small as possible
+        self.labels = np.empty(labels.shape, dtype=np.int64)
+        self.number_of_clusters = list()
+        for row, partition_labels in enumerate(labels):
+            unique_labels, self.labels[row] = np.unique(partition_labels, return_inverse=True)
+            self.number_of_clusters.append(len(unique_labels))
+
+        number_of_partitions = len(names)
+        self.nmi = np.ones((number_of_partitions, number_of_partitions))
+        self.ari = np.ones((number_of_partitions, number_of_partitions))
+        self.vi = np.zeros((number_of_partitions, number_of_partitions))
+        self._compare_labels()
+        self.number_of_inter_cluster_edges, self.inter_cluster_edge_overlap = self._compare_inter_cluster_edges(compact_graph)
+
+    def _compare_labels(self):
+        n = self.number_of_nodes
+        if n == 0:
+            return
+        log_n = np.log(n)
+        total_pairs = n * (n - 1) / 2
+        entropies, pair_counts = list(), list()
+        for row, number_of_clusters in zip(self.labels, self.number_of_clusters):
+            count_log_count, pair_count = _entropy_terms(np.bincount(row, minlength=number_of_clusters))
+            entropies.append(log_n - count_log_count / n)
+            pair_counts.append(pair_count)
+
+        for a in range(len(self.names)):
+            for b in range(a + 1, len(self.names)):
+                cell_log_cell, cell_pairs = _entropy_terms(_contingency_counts(self.labels[a], self.number_of_clusters[a],
+                                                                               self.labels[b], self.number_of_clusters[b]))
+                joint_entropy = log_n - cell_log_cell / n
+                mutual_information = entropies[a] + entropies[b] - joint_entropy
+                entropy_sum = entropies[a] + entropies[b]
+                nmi = 2 * mutual_information / entropy_sum if entropy_sum > 0 else 1.0
+                expected_pairs = pair_counts[a] * pair_counts[b] / total_pairs if total_pairs else 0.0
+                max_pairs = (pair_counts[a] + pair_counts[b]) / 2
+                # Both partitions are trivial (one cluster, or only singletons) when the denominator vanishes
+                ari = (cell_pairs - expected_pairs) / (max_pairs - expected_pairs) if max_pairs != expected_pairs else 1.0
+                vi = max(2 * joint_entropy - entropy_sum, 0.0)
+                self.nmi[a, b] = self.nmi[b, a] = min(max(nmi, 0.0), 1.0)
+                self.ari[a, b] = self.ari[b, a] = ari
+                self.vi[a, b] = self.vi[b, a] = vi
+
+    def _compare_inter_cluster_edges(self, compact_graph: CompactGraph):
+        '''
+        Number of inter-cluster call sites of every partition and the Jaccard index of these sets for every pair.
+        The masks are built on the collapsed edges, weighted by their number of call sites, block by block.
+        '''
+        collapsed_edges = compact_graph.collapsed_edges()
+        call_sites = np.diff(collapsed_edges.call_site_offsets).astype(np.float64)
+        # One row of labels per node, so the labels of the endpoints of an edge are gathered in one contiguous read
+        node_labels = np.ascontiguousarray(self.labels.T, dtype=np.int32)
+        number_of_partitions = len(self.names)
+        shared = np.zeros((number_of_partitions, number_of_partitions))
+        for start in range(0, collapsed_edges.num_edges, EDGE_BLOCK_SIZE):
+            end = min(start + EDGE_BLOCK_SIZE, collapsed_edges.num_edges)
+            src, dst = collapsed_edges.src[start:end], collapsed_edges.dst[start:end]
+            masks = (node_labels[src] != node_labels[dst]).astype(np.float64)
+            shared += masks.T @ (masks * call_sites[start:end, None])
+
+        counts = np.diag(shared).copy()
+        union = counts[:, None] + counts[None, :] - shared
+        with np.errstate(invalid='ignore', divide='ignore'):
+            overlap = np.where(union > 0, shared / union, 1.0)
+        return np.rint(counts).astype(np.int64).tolist(), overlap
+
+    def to_dict(self):
+        return {
+            'number_of_nodes': self.number_of_nodes,
+            'partitions': [{'name': name, 'number_of_clusters': number_of_clusters, 'number_of_inter_cluster_edges': number_of_edges}
+                           for name, number_of_clusters, number_of_edges in zip(self.names, self.number_of_clusters, self.number_of_inter_cluster_edges)],
+            'nmi': self.nmi.tolist(),
+            'adjusted_rand_index': self.ari.tolist(),
+            'variation_of_information': self.vi.tolist(),
+            'inter_cluster_edge_overlap': self.inter_cluster_edge_overlap.tolist(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=4)
+
+    def __str__(self):
+        width = max([len(name) for name in self.names] + [8])
+        lines = list()
+        for title, matrix in (('NMI', self.nmi), ('Adjusted Rand index', self.ari), ('Variation of information', self.vi),
+                              ('Inter-cluster edge overlap', self.inter_cluster_edge_overlap)):
+            lines.append(title)
+            lines.append(' ' * width + ''.join(f' {name:>{width}}' for name in self.names))
+            for name, row in zip(self.names, matrix.tolist()):
+                lines.append(f'{name:<{width}}' + ''.join(f' {value:>{width}.4f}' for value in row))
+            lines.append('')
+        return '\n'.join(lines)
@@ -1,5 +1,6 @@
 from results.graph import Graph, Edge, Node, Method, Attribute
-from ..utils.utils import load_json_data
+from results.compact_graph import CompactGraph
+from ..utils.utils import load_json_data, iter_json_array
 
 def extract_method_info(method_data):
     '''
@@ -13,6 +14,17 @@ def extract_method_info(method_data):
 
     return Method(method_name, method_arguments, method_return_type, method_declaring_class, method_signature)
 
+def intern_method_info(compact_graph: CompactGraph, method_data):
+    '''
+    Adds the method described by a dictionary to the method table of a CompactGraph and returns its index.
+    '''
+    method_arguments = ((arg.get('type', ''), arg.get('value', '')) for arg in method_data.get('arguments', []))
+    return compact_graph.methods.intern_fields(method_data.get('method_name', ''),
+                                               method_arguments,
+                                               method_data.get('return_type', ''),
+                                               method_data.get('declaring_class', ''),
+                                               method_data.get('method_signature', ''))
+
 def parse_json_graph(file_path):
     data = load_json_data(file_path)
     if data is None:
@@ -59,8 +71,50 @@ def create_graph(nodes, link_data):
 
     return Graph(nodes, edges)
     
-def graph_json_to_object(file_path) -> Graph:
-    nodes, link_data = parse_json_graph(file_path)
-    graph = create_graph(nodes, link_data)
+def stream_json_graph(file_path, strict=True) -> Graph:
+    '''
+    Incrementally loads a graph JSON file: the nodes and edges arrays are streamed one item at a time
+    and turned into Node and Edge objects on the fly, so the parsed document is never held in memory.
+    The nodes are streamed first, so edges can be resolved whatever the key order in the file.
+    Edges whose source or destination is not a node of the graph are dropped, as in create_graph.
+    With strict, a missing or malformed file (e.g. cut off mid-write) raises rather than giving a partial graph.
+    '''
+    graph = Graph(list(), list())
+    for node in iter_json_array(file_path, 'nodes', strict):
+        graph.add_node(Node(node.get('name', '')))
+
+    for edge in iter_json_array(file_path, 'edges', strict):
+        src_name = edge.get('source', '')
+        dest_name = edge.get('destination', '')
+        if graph.has_node(src_name) and graph.has_node(dest_name):
+            graph.add_edge(Edge(graph.get_node_by_name(src_name),
+                                graph.get_node_by_name(dest_name),
+                                extract_method_info(edge.get('link_method', {})),
+                                extract_method_info(edge.get('source_method', {}))))
+
     return graph
-    
\ No newline at end of file
+
+def graph_json_to_object(file_path, strict=True) -> Graph:
+    return stream_json_graph(file_path, strict)
+
+def graph_json_to_compact_graph(file_path, strict=True) -> CompactGraph:
+    '''
+    Streams a graph JSON file straight into a CompactGraph, without building Node, Edge or Method objects.
+    Edges whose source or destination is not a node of the graph are dropped, as in create_graph.
+    With strict, a missing or malformed file (e.g. cut off mid-write) raises rather than giving a partial graph.
+    '''
+    compact_graph = CompactGraph()
+    for node in iter_json_array(file_path, 'nodes', strict):
+        compact_graph.add_node(node.get('name', ''))
+
+    for edge in iter_json_array(file_path, 'edges', strict):
+        src_id = compact_graph.node_ids.get(edge.get('source', ''))
+        dest_id = compact_graph.node_ids.get(edge.get('destination', ''))
+        if src_id is None or dest_id is None:
+            continue
+        compact_graph.add_edge(src_id,
+                               dest_id,
+                               intern_method_info(compact_graph, edge.get('link_method', {})),
+                               intern_method_info(compact_graph, edge.get('source_method', {})))
+
+    return compact_graph
@@ -0,0 +1,238 @@
+import cProfile
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak RSS is then not recorded
+    resource = None
+
+# Profiler the stages of the pipeline are recorded in, set while an analysis runs
+_active_profiler = None
+
+def process_peak_rss_mb():
+    '''
+    High-water mark of the resident set size of the process so far in MB (not of the current stage),
+    or None if it cannot be measured.
+    '''
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak_rss / 2**20 if sys.platform == 'darwin' else peak_rss / 2**10
+
+def children_cpu_time():
+    '''CPU time of the child processes of this process that finished and were waited for, e.g. pool workers.'''
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def _status_kb(field: str):
+    '''A memory field of /proc/self/status (e.g. VmRSS or VmHWM) in kB, or None where there is no /proc.'''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _reset_peak_rss():
+    '''Resets the RSS high-water mark (VmHWM) of the process to its current RSS, on Linux. Returns whether it could.'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+def worker_task(function, *args):
+    '''
+    Runs a task in a worker process of a pool, e.g. with functools.partial(worker_task, function) as the mapped function.
+    Returns its result together with the RSS high-water mark of the worker, to be passed to record_worker_peak_rss.
+    '''
+    return function(*args), process_peak_rss_mb()
+
+def record_worker_peak_rss(peak_rss_mb):
+    '''Records the peak RSS reported by a worker process in the current stage of the active profiler, if any.'''
+    if _active_profiler is not None:
+        _active_profiler.record_worker_peak_rss(peak_rss_mb)
+
+class StageMetrics:
+    '''
+    Measurements of one stage. The peak RSS is the highest RSS of the process during the stage and the RSS increase
+    its excess over the RSS at the start of the stage (both None where the high-water mark cannot be reset),
+    the process peak RSS is the high-water mark of the process up to the end of the stage. The child CPU time and
+    the worker peak RSS are those of the worker processes of the stage, e.g. of a sweep or of the sharding.
+    '''
+    def __init__(self, name, wall_time, cpu_time, peak_rss_mb, rss_increase_mb, process_peak_rss_mb, tracemalloc_peak_mb,
+                 children_cpu_time=0.0, workers_peak_rss_mb=None) -> None:
+        self.name: str = name
+        self.wall_time: float = wall_time
+        self.cpu_time: float = cpu_time
+        self.peak_rss_mb: float = peak_rss_mb
+        self.rss_increase_mb: float = rss_increase_mb
+        self.process_peak_rss_mb: float = process_peak_rss_mb
+        self.tracemalloc_peak_mb: float = tracemalloc_peak_mb
+        self.children_cpu_time: float = children_cpu_time
+        self.workers_peak_rss_mb: float = workers_peak_rss_mb
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'children_cpu_time': self.children_cpu_time,
+            'peak_rss_mb': self.peak_rss_mb,
+            'rss_increase_mb': self.rss_increase_mb,
+            'process_peak_rss_mb': self.process_peak_rss_mb,
+            'workers_peak_rss_mb': self.workers_peak_rss_mb,
+            'tracemalloc_peak_mb': self.tracemalloc_peak_mb,
+        }
+
+    def __str__(self):
+        text = f'Stage {self.name}: {self.wall_time:.3f}s wall time, {self.cpu_time:.3f}s CPU time'
+        if self.children_cpu_time:
+            text += f' (+{self.children_cpu_time:.3f}s in worker processes)'
+        if self.peak_rss_mb is not None:
+            text += f', peak RSS {self.peak_rss_mb:.2f} MB (+{self.rss_increase_mb:.2f} MB)'
+        else:
+            text += f', process peak RSS {self.process_peak_rss_mb} MB'
+        if self.workers_peak_rss_mb is not None:
+            text += f', worker peak RSS {self.workers_peak_rss_mb:.2f} MB'
+        return text
+
+class StageProfiler:
+    '''
+    Records the wall time, CPU time and peak RSS of the stages of the pipeline, and with trace_memory the peak
+    of the memory allocated by Python during every stage (tracemalloc, which slows the pipeline down).
+    Nested stages are named after their parents, e.g. clustering/networkx_conversion.
+    The peak RSS of a stage is measured on Linux by resetting the high-water mark of the process when the stage starts.
+    '''
+    def __init__(self, trace_memory=False) -> None:
+        self.trace_memory = trace_memory
+        self.stages: list[StageMetrics] = list()
+        self._stack: list[str] = list()
+        # Highest tracemalloc peak seen so far in every open stage, as the peak is reset when a nested stage starts
+        self._peaks: list[int] = list()
+        # Highest RSS (kB) seen so far in every open stage, its RSS at the start and the highest peak of its workers
+        self._rss_peaks: list[int] = list()
+        self._start_rss: list[int] = list()
+        self._worker_peaks: list[float] = list()
+        # Highest RSS (kB) seen before a reset of the high-water mark, the process peak otherwise lost with it
+        self._process_peak = 0
+        self.track_stage_rss = _status_kb('VmHWM') is not None and _reset_peak_rss()
+        self.tracemalloc_started = False
+
+    def _update_rss_peaks(self):
+        '''Adds the current high-water mark to the peaks of the open stages and of the process.'''
+        high_water_mark = _status_kb('VmHWM') or 0
+        self._process_peak = max(self._process_peak, high_water_mark)
+        if self._rss_peaks:
+            self._rss_peaks[-1] = max(self._rss_peaks[-1], high_water_mark)
+        return high_water_mark
+
+    def record_worker_peak_rss(self, peak_rss_mb):
+        if self._worker_peaks and peak_rss_mb is not None:
+            self._worker_peaks[-1] = max(self._worker_peaks[-1] or 0, peak_rss_mb)
+
+    @contextmanager
+    def stage(self, name: str):
+        self._stack.append(name)
+        full_name = '/'.join(self._stack)
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.tracemalloc_started = True
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+        if self.track_stage_rss:
+            self._update_rss_peaks()
+            _reset_peak_rss()
+            self._rss_peaks.append(0)
+            self._start_rss.append(_status_kb('VmRSS') or 0)
+        self._worker_peaks.append(None)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        children_cpu_start = children_cpu_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+            stage_children_cpu_time = children_cpu_time() - children_cpu_start
+            tracemalloc_peak = None
+            if self.trace_memory:
+                stage_peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                tracemalloc_peak = stage_peak / 2**20
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], stage_peak)
+            peak_rss, rss_increase = None, None
+            process_peak_rss = process_peak_rss_mb()
+            if self.track_stage_rss:
+                stage_peak = max(self._rss_peaks.pop(), self._update_rss_peaks())
+                if self._rss_peaks:
+                    self._rss_peaks[-1] = max(self._rss_peaks[-1], stage_peak)
+                peak_rss = stage_peak / 2**10
+                rss_increase = max(stage_peak - self._start_rss.pop(), 0) / 2**10
+                process_peak_rss = max(process_peak_rss or 0, self._process_peak / 2**10)
+            workers_peak_rss = self._worker_peaks.pop()
+            if self._worker_peaks and workers_peak_rss is not None:
+                self._worker_peaks[-1] = max(self._worker_peaks[-1] or 0, workers_peak_rss)
+            self._stack.pop()
+            metrics = StageMetrics(full_name, wall_time, cpu_time, peak_rss, rss_increase, process_peak_rss, tracemalloc_peak,
+                                   stage_children_cpu_time, workers_peak_rss)
+            self.stages.append(metrics)
+            logging.info(str(metrics))
+
+    def stop(self):
+        if self.tracemalloc_started:
+            tracemalloc.stop()
+            self.tracemalloc_started = False
+
+    def to_dict(self):
+        return {'stages': [stage.to_dict() for stage in self.stages]}
+
+    def save(self, file_path: str, **context):
+        '''Saves the metrics of the stages as JSON, together with the given context (algorithm, data path, ...).'''
+        with open(file_path, 'w') as profile_file:
+            json.dump({**context, **self.to_dict()}, profile_file, indent=4)
+
+def set_active_profiler(profiler):
+    '''Sets the profiler the stages are recorded in, None to stop recording. Returns the previous one.'''
+    global _active_profiler
+    previous, _active_profiler = _active_profiler, profiler
+    return previous
+
+@contextmanager
+def stage(name: str):
+    '''Records a stage of the pipeline in the active profiler, if any.'''
+    if _active_profiler is None:
+        yield
+    else:
+        with _active_profiler.stage(name):
+            yield
+
+@contextmanager
+def cprofile_to(file_path):
+    '''Runs the block under cProfile and dumps the statistics to file_path, or just runs it when file_path is None.'''
+    if file_path is None:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(file_path)
+        logging.info(f'cProfile statistics saved to {file_path}')
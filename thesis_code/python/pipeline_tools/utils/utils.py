@@ -1,8 +1,10 @@
+import hashlib
 import json
-import networkx as nx
 import os
 import logging
 from results.graph import Edge, Graph
+from results.compact_graph import as_compact_graph
+from pipeline_tools.utils.profiling import stage
 
 def load_json_data(filepath):
     '''
@@ -23,6 +25,132 @@ def load_json_data(filepath):
     
     return None
 
+class _JsonStreamReader:
+    '''
+    Minimal incremental reader over a JSON text file. It keeps only a sliding window
+    of the file in memory and decodes one value at a time with the standard json decoder.
+    '''
+    def __init__(self, file, chunk_size=1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''Returns the next non-whitespace character without consuming it, or None at the end of the file.'''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f'Expecting {char!r}', self.buffer, self.pos)
+        self.pos += 1
+
+    def decode_value(self):
+        '''Decodes the next complete JSON value, reading more of the file as long as the value is truncated.'''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A value is only known to be complete once it is followed by a delimiter (e.g. numbers)
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in ' \t\r\n,:]}'):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read_more()
+
+    def iter_array(self):
+        '''Yields the items of the JSON array starting at the current position one by one.'''
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+def iter_json_array(filepath, key, strict=False):
+    '''
+    Stream the items of the array stored under `key` in the top-level JSON object of a file,
+    without loading the whole document. Other top-level arrays are skipped item by item.
+    If the file does not exist or an error occurs, log the error and stop yielding. With strict,
+    the error is raised instead, so a file cut off mid-write is never taken for a complete one.
+    '''
+    if not os.path.exists(filepath):
+        logging.error(f"File does not exist: {filepath}")
+        if strict:
+            raise FileNotFoundError(f'File does not exist: {filepath}')
+        return
+
+    try:
+        with open(filepath, 'r') as file:
+            reader = _JsonStreamReader(file)
+            reader.expect('{')
+            if reader.peek() == '}':
+                return
+            while True:
+                current_key = reader.decode_value()
+                reader.expect(':')
+                if current_key == key:
+                    yield from reader.iter_array()
+                    return
+                if reader.peek() == '[':
+                    for _ in reader.iter_array():
+                        pass
+                else:
+                    reader.decode_value()
+                if reader.peek() != ',':
+                    reader.expect('}')
+                    return
+                reader.pos += 1
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding JSON from {filepath}. Error: {e}")
+        if strict:
+            raise
+    except Exception as e:
+        logging.error(f"Error loading JSON data from {filepath}. Error: {e}")
+        if strict:
+            raise
+
+def file_content_hash(filepath, chunk_size=1 << 20):
+    '''
+    Compute the SHA-256 digest of a file's content without loading it at once.
+    If the file does not exist, log the error and return None.
+    '''
+    if not os.path.exists(filepath):
+        logging.error(f"File does not exist: {filepath}")
+        return None
+
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.digest()
+
 def check_or_create_path(directory):
     if not os.path.exists(directory):
         try:
@@ -35,10 +163,59 @@ def check_or_create_path(directory):
 def map_custom_graph_to_networkx(graph):
     '''
     Maps the custom Graph structure to a NetworkX graph.
+    Only the node names and edge weights are copied, which is all the algorithms use.
+    '''
+    import networkx as nx
+    nx_graph = nx.MultiDiGraph()
+    nx_graph.add_nodes_from(node.name for node in graph.nodes)
+    nx_graph.add_edges_from((edge.source.name, edge.destination.name, {'weight': edge.weight}) for edge in graph.edges)
+    return nx_graph
+
+def map_compact_graph_to_networkx(compact_graph):
     '''
+    Maps a CompactGraph to a NetworkX graph straight from its edge arrays.
+    '''
+    import networkx as nx
+    names = compact_graph.node_names
     nx_graph = nx.MultiDiGraph()
-    for node in graph.nodes:
-        nx_graph.add_node(node.name, **vars(node))
-    for edge in graph.edges:
-        nx_graph.add_edge(edge.source.name, edge.destination.name, **vars(edge))
-    return nx_graph
\ No newline at end of file
+    nx_graph.add_nodes_from(names)
+    nx_graph.add_edges_from((names[src], names[dst], {'weight': weight})
+                            for src, dst, weight in zip(compact_graph.src, compact_graph.dst, compact_graph.weight))
+    return nx_graph
+
+def map_compact_graph_to_igraph(compact_graph):
+    '''
+    Maps a CompactGraph to a directed igraph graph with one weighted edge per pair of connected nodes:
+    the parallel edges (one per call site) are collapsed, their weights summed, which leaves the weighted
+    modularity unchanged. Vertex ids are the node ids of the compact graph, edge ids those of its collapsed edges.
+    '''
+    import igraph as ig
+    with stage('edge_collapsing'):
+        collapsed_edges = compact_graph.collapsed_edges()
+    logging.info(str(collapsed_edges))
+    ig_graph = ig.Graph(n=compact_graph.num_nodes, edges=list(zip(collapsed_edges.src.tolist(), collapsed_edges.dst.tolist())), directed=True)
+    ig_graph.vs['name'] = compact_graph.node_names
+    ig_graph.es['weight'] = collapsed_edges.weight.tolist()
+    return ig_graph
+
+def get_igraph(graph):
+    '''
+    Returns the igraph graph of a Graph or CompactGraph. It is built once and cached on the graph,
+    so every algorithm and score computed on the same graph shares it.
+    '''
+    compact_graph = as_compact_graph(graph)
+    def build():
+        with stage('igraph_conversion'):
+            return map_compact_graph_to_igraph(compact_graph)
+    return compact_graph.derived_representation('igraph', build)
+
+def get_networkx(graph):
+    '''
+    Returns the NetworkX graph of a Graph or CompactGraph, for the algorithms that need NetworkX.
+    It is built once and cached on the graph; callers must not modify it.
+    '''
+    compact_graph = as_compact_graph(graph)
+    def build():
+        with stage('networkx_conversion'):
+            return map_compact_graph_to_networkx(compact_graph)
+    return compact_graph.derived_representation('networkx', build)
@@ -0,0 +1,69 @@
+import random
+import igraph as ig
+import numpy as np
+from pipeline_tools.utils.utils import get_igraph
+from results.compact_graph import as_compact_graph
+from results.cluster import ClustersInformation
+
+GOLDEN_ANGLE = np.pi * (3 - np.sqrt(5))
+# Distance between the discs of neighbouring clusters, relative to their radius
+CLUSTER_SPACING = 1.3
+
+class ClusterLayout:
+    def __init__(self, positions, cluster_centers, cluster_radii) -> None:
+        # Position of every node, indexed by the node ids of the compact graph
+        self.positions: np.ndarray = positions
+        # Center and radius of the disc of every cluster, in the order of the clusters
+        self.cluster_centers: np.ndarray = cluster_centers
+        self.cluster_radii: np.ndarray = cluster_radii
+
+    def scaled(self, scale: float) -> 'ClusterLayout':
+        return ClusterLayout(self.positions * scale, self.cluster_centers * scale, self.cluster_radii * scale)
+
+def cluster_disc_centers(cluster_radii: np.ndarray):
+    '''
+    Places the discs of the clusters on a sunflower (Vogel) spiral, the largest cluster in the center,
+    each disc at a distance from the center that grows with the area of the larger discs.
+    '''
+    order = np.argsort(-cluster_radii, kind='stable')
+    areas = (CLUSTER_SPACING * cluster_radii[order]) ** 2
+    distances = 2 * np.sqrt(np.concatenate(([0.0], np.cumsum(areas)[:-1])))
+    angles = GOLDEN_ANGLE * np.arange(len(order))
+    centers = np.empty((len(order), 2))
+    centers[order] = np.column_stack((distances * np.cos(angles), distances * np.sin(angles)))
+    return centers
+
+def cluster_layout(graph, clusters: ClustersInformation, seed=42):
+    '''
+    Computes the layout of a clustered graph server side, so it can be drawn without physics in the browser.
+    Every cluster gets a disc with an area proportional to its number of nodes. The nodes of a cluster are laid out
+    inside its disc with the Fruchterman-Reingold layout of igraph on the subgraph of the cluster, started
+    from positions drawn with the given seed, so the layout is the same on every run.
+    '''
+    compact_graph = as_compact_graph(graph)
+    ig_graph = get_igraph(compact_graph)
+    node_ids = compact_graph.node_ids
+    rng = np.random.default_rng(seed)
+
+    cluster_radii = np.sqrt(np.array([len(cluster.nodes) for cluster in clusters.clusters], dtype=float))
+    cluster_centers = cluster_disc_centers(cluster_radii) if len(cluster_radii) else np.empty((0, 2))
+    positions = np.zeros((compact_graph.num_nodes, 2))
+
+    # igraph draws the random numbers of its layouts from the random module, give it its own seeded generator
+    ig.set_random_number_generator(random.Random(seed))
+    try:
+        for center, radius, cluster in zip(cluster_centers, cluster_radii, clusters.clusters):
+            # Sorted, the order of the vertices in the induced subgraph
+            members = np.sort(np.array([node_ids[node.name] for node in cluster.nodes], dtype=np.int64))
+            if len(members) == 1:
+                positions[members] = center
+                continue
+            start = rng.uniform(-1, 1, (len(members), 2))
+            coords = np.array(ig_graph.induced_subgraph(members.tolist()).layout_fruchterman_reingold(seed=start.tolist()).coords)
+            coords -= coords.mean(axis=0)
+            extent = np.sqrt((coords ** 2).sum(axis=1)).max()
+            positions[members] = center + coords * (radius / extent if extent > 0 else 0)
+    finally:
+        ig.set_random_number_generator(random)
+
+    return ClusterLayout(positions, cluster_centers, cluster_radii)
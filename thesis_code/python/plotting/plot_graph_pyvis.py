@@ -1,27 +1,72 @@
 from matplotlib import pyplot as plt
 from pyvis.network import Network
+import json
 import os
 import logging
 
-from pipeline_tools.utils.utils import check_or_create_path, map_custom_graph_to_networkx
+from pipeline_tools.utils.utils import check_or_create_path
+from plotting.cluster_layout import cluster_layout
 from results.cluster import ClustersInformation
+from results.compact_graph import as_compact_graph
+from results.graph import Graph
 
-def visualize_graph_pyvis_without_clusters(G, output_path, net_options):
-    net = Network(notebook=True, height="800px", width="100%")
-    
-    for node in G.nodes():
-        net.add_node(node, color='black')
+# Graphs with more nodes are drawn with a server side layout and without physics in the browser
+STATIC_LAYOUT_NODE_THRESHOLD = 1000
+# Pixels per unit of the server side layout
+LAYOUT_SCALE = 250
 
-    for edge in G.edges():
-        net.add_edge(edge[0], edge[1], color='black')
+# Collapsed clusters of the static plot with clusters: a double click on a cluster node replaces it by its nodes and
+# intra-cluster edges. The inter-cluster edges are aggregated between the nodes shown, collapsed clusters or nodes.
+COLLAPSED_CLUSTERS_SCRIPT = """
+<script type="text/javascript">
+    var clusterData = %s;
+    var expandedClusters = {};
 
-    net.set_options(net_options)
-    net.show(output_path)
+    function shownNodeId(nodeId) {
+        var clusterId = clusterData.nodeClusters[nodeId];
+        return expandedClusters[clusterId] ? nodeId : 'cluster-' + clusterId;
+    }
 
-    return output_path
+    function drawInterClusterEdges() {
+        edges.remove(edges.getIds({filter: function (edge) { return edge.interCluster; }}));
+        var aggregated = {};
+        clusterData.interClusterEdges.forEach(function (edge) {
+            var from = shownNodeId(edge[0]);
+            var to = shownNodeId(edge[1]);
+            var key = from + '>' + to;
+            if (!(key in aggregated)) {
+                aggregated[key] = {from: from, to: to, count: 0};
+            }
+            aggregated[key].count += 1;
+        });
+        edges.add(Object.values(aggregated).map(function (edge) {
+            return {from: edge.from, to: edge.to, color: 'red', interCluster: true,
+                    width: Math.min(8 * (1 + Math.log2(edge.count)), 40),
+                    title: edge.count + ' inter-cluster edge(s)'};
+        }));
+    }
 
-def visualize_graph_pyvis_with_clusters(output_path, net_options, clusters: ClustersInformation, single_node_cluster_color_black=False):
-    net = Network(notebook=True, height='800px', width='100%')
+    network.on('doubleClick', function (params) {
+        if (params.nodes.length !== 1 || !(params.nodes[0] in clusterData.members)) {
+            return;
+        }
+        var clusterId = params.nodes[0].substring('cluster-'.length);
+        expandedClusters[clusterId] = true;
+        nodes.remove(params.nodes[0]);
+        nodes.add(clusterData.members[params.nodes[0]].nodes);
+        edges.add(clusterData.members[params.nodes[0]].edges);
+        delete clusterData.members[params.nodes[0]];
+        drawInterClusterEdges();
+    });
+
+    drawInterClusterEdges();
+</script>
+"""
+
+def cluster_colors(clusters: ClustersInformation, single_node_cluster_color_black=False):
+    '''
+    Returns the color of every cluster, keyed on the cluster id, spread over the hsv color map without the reds.
+    '''
     colors = {}
 
     total_clusters = len(clusters.clusters)
@@ -41,8 +86,29 @@ def visualize_graph_pyvis_with_clusters(output_path, net_options, clusters: Clus
 
         colors[cluster.id] = color
 
+    return colors
+
+def visualize_graph_pyvis_without_clusters(graph: Graph, output_path, net_options):
+    net = Network(notebook=True, height="800px", width="100%")
+    
+    for node in graph.nodes:
+        net.add_node(node.name, color='black')
+
+    for edge in graph.edges:
+        net.add_edge(edge.source.name, edge.destination.name, color='black')
+
+    net.set_options(net_options)
+    net.show(output_path)
+
+    return output_path
+
+def visualize_graph_pyvis_with_clusters(output_path, net_options, clusters: ClustersInformation, single_node_cluster_color_black=False):
+    net = Network(notebook=True, height='800px', width='100%')
+    colors = cluster_colors(clusters, single_node_cluster_color_black)
+
+    for cluster in clusters.clusters:
         for node in cluster.nodes:
-            net.add_node(node.name, label=node.name, color=color)
+            net.add_node(node.name, label=node.name, color=colors[cluster.id])
 
     # Add intra-cluster edges
     for cluster in clusters.clusters:
@@ -59,11 +125,95 @@ def visualize_graph_pyvis_with_clusters(output_path, net_options, clusters: Clus
     return output_path
 
 
-def plot_graphs_pyvis(data_path, clusters, graph, single_node_cluster_color_black=False):
+def static_net_options(net_options):
+    '''
+    Options of a plot drawn with a server side layout: no physics, straight edges and no edges while dragging.
+    '''
+    options = json.loads(net_options)
+    options['physics'] = {'enabled': False}
+    options['edges']['smooth'] = False
+    options['interaction'] = {'hideEdgesOnDrag': True}
+    return json.dumps(options)
+
+def write_static_network(nodes, edges, output_path, net_options, script=''):
+    '''
+    Writes the HTML of a plot drawn with a server side layout, with an optional script run after the network is drawn.
+    The nodes and edges are given as vis.js dicts and set on the pyvis Network at once, as Network.add_node and
+    Network.add_edge look for duplicates with a linear scan, which does not scale to large graphs.
+    '''
+    net = Network(height='800px', width='100%', cdn_resources='remote')
+    net.nodes = nodes
+    net.node_ids = [node['id'] for node in nodes]
+    net.node_map = {node['id']: node for node in nodes}
+    net.edges = edges
+    net.set_options(static_net_options(net_options))
+    html = net.generate_html()
+    if script:
+        head, body_end, tail = html.rpartition('</body>')
+        html = head + script + body_end + tail
+    with open(output_path, 'w') as html_file:
+        html_file.write(html)
+    return output_path
+
+def visualize_graph_static_without_clusters(graph: Graph, layout, output_path, net_options):
+    '''
+    Plot of the graph drawn with the node positions of a server side layout and without physics in the browser.
+    '''
+    compact_graph = as_compact_graph(graph)
+    positions = layout.positions.tolist()
+    nodes = [{'id': node_id, 'label': name, 'color': 'black', 'shape': 'dot', 'x': x, 'y': y}
+             for node_id, (name, (x, y)) in enumerate(zip(compact_graph.node_names, positions))]
+    edges = [{'from': source_id, 'to': destination_id, 'color': 'black'}
+             for source_id, destination_id in zip(compact_graph.src, compact_graph.dst)]
+    return write_static_network(nodes, edges, output_path, net_options)
+
+def visualize_graph_static_with_clusters(graph: Graph, layout, output_path, net_options, clusters: ClustersInformation,
+                                         single_node_cluster_color_black=False):
+    '''
+    Plot of the clusters drawn with a server side layout and without physics in the browser. Every cluster is
+    collapsed into a cluster node, with the inter-cluster edges aggregated between the cluster nodes, and is expanded
+    into its nodes and intra-cluster edges on a double click.
+    '''
+    compact_graph = as_compact_graph(graph)
+    node_ids = compact_graph.node_ids
+    colors = cluster_colors(clusters, single_node_cluster_color_black)
+    positions = layout.positions.tolist()
+    centers = layout.cluster_centers.tolist()
+
+    cluster_nodes = list()
+    members = dict()
+    node_clusters = [0] * compact_graph.num_nodes
+    for (x, y), radius, cluster in zip(centers, layout.cluster_radii.tolist(), clusters.clusters):
+        color = colors[cluster.id]
+        cluster_node_id = f'cluster-{cluster.id}'
+        cluster_nodes.append({'id': cluster_node_id, 'label': f'Cluster {cluster.id} ({len(cluster.nodes)} nodes)', 'color': color,
+                              'shape': 'dot', 'size': 25 + radius * LAYOUT_SCALE / 4, 'x': x, 'y': y})
+        member_nodes = list()
+        for node in cluster.nodes:
+            node_id = node_ids[node.name]
+            node_clusters[node_id] = cluster.id
+            member_nodes.append({'id': node_id, 'label': node.name, 'color': color, 'shape': 'dot',
+                                 'x': positions[node_id][0], 'y': positions[node_id][1]})
+        member_edges = [{'from': node_ids[edge.source.name], 'to': node_ids[edge.destination.name], 'color': color}
+                        for edge in cluster.intra_cluster_edges]
+        members[cluster_node_id] = {'nodes': member_nodes, 'edges': member_edges}
+
+    cluster_data = {
+        'nodeClusters': node_clusters,
+        'members': members,
+        'interClusterEdges': [[node_ids[edge.source.name], node_ids[edge.destination.name]] for edge in clusters.inter_cluster_edges],
+    }
+    script = COLLAPSED_CLUSTERS_SCRIPT % json.dumps(cluster_data, separators=(',', ':')).replace('</', '<\\/')
+    return write_static_network(cluster_nodes, list(), output_path, net_options, script)
+
+def plot_graphs_pyvis(data_path, clusters, graph, single_node_cluster_color_black=False, static_layout=None):
+    '''
+    Plots the graph without and with its clusters as HTML pages. With static_layout, or by default for graphs of more
+    than STATIC_LAYOUT_NODE_THRESHOLD nodes, the layout is computed server side and physics is disabled in the browser,
+    and the plot with clusters starts with every cluster collapsed into a single node.
+    '''
     logging.basicConfig(level=logging.INFO)
 
-    G = map_custom_graph_to_networkx(graph)
-    
     # output paths
     graph_dir = os.path.join(data_path, 'plot')
     check_or_create_path(graph_dir)
@@ -98,5 +248,14 @@ def plot_graphs_pyvis(data_path, clusters, graph, single_node_cluster_color_blac
     }
     """
 
-    visualize_graph_pyvis_without_clusters(G, os.path.abspath(graph_path), net_options)
+    if static_layout is None:
+        static_layout = len(graph.nodes) > STATIC_LAYOUT_NODE_THRESHOLD
+    if static_layout:
+        layout = cluster_layout(graph, clusters).scaled(LAYOUT_SCALE)
+        visualize_graph_static_without_clusters(graph, layout, os.path.abspath(graph_path), net_options)
+        visualize_graph_static_with_clusters(graph, layout, os.path.abspath(clusters_path), net_options, clusters,
+                                             single_node_cluster_color_black=single_node_cluster_color_black)
+        return
+
+    visualize_graph_pyvis_without_clusters(graph, os.path.abspath(graph_path), net_options)
     visualize_graph_pyvis_with_clusters(os.path.abspath(clusters_path), net_options, clusters, single_node_cluster_color_black=single_node_cluster_color_black)
@@ -0,0 +1,122 @@
+import json
+import numpy as np
+from results.compact_graph import CompactGraph
+from results.cluster import ClustersInformation
+from results.partition_quality import PartitionQuality
+
+CLUSTER_SIZE_PERCENTILES = (25, 50, 75, 90)
+
+def _median(values: np.ndarray):
+    '''Median of a sorted array, the mean of the two middle values for an even count (as Graph.calculate_median).'''
+    n = len(values)
+    if n == 0:
+        return 0
+    if n % 2 == 1:
+        return values[n // 2].item()
+    return (values[n // 2 - 1].item() + values[n // 2].item()) / 2
+
+def _upper_median(values: np.ndarray):
+    '''Middle value of a sorted array, the upper one for an even count.'''
+    return values[len(values) // 2].item() if len(values) else 0
+
+def _mean(values: np.ndarray):
+    return values.mean().item() if len(values) else None
+
+def _distribution(values: np.ndarray):
+    '''Summary and histogram (count of every value from 0) of a distribution of non-negative integers.'''
+    return {
+        'min': values.min().item() if len(values) else 0,
+        'max': values.max().item() if len(values) else 0,
+        'mean': _mean(values),
+        'median': _median(np.sort(values)),
+        'histogram': np.bincount(values).tolist(),
+    }
+
+class GraphMetrics:
+    def __init__(self, compact_graph: CompactGraph) -> None:
+        src, dst, _ = compact_graph.as_numpy()
+        num_nodes = compact_graph.num_nodes
+        in_degrees = np.bincount(dst, minlength=num_nodes)
+        out_degrees = np.bincount(src, minlength=num_nodes)
+        self.number_of_nodes: int = num_nodes
+        self.number_of_edges: int = compact_graph.num_edges
+        # Edges are equal when they have the same source and destination (see Edge.__eq__)
+        self.number_of_unique_edges: int = compact_graph.collapsed_edges().num_edges
+        self.number_of_isolated_nodes: int = int(np.count_nonzero((in_degrees == 0) & (out_degrees == 0)))
+        self.average_edges_per_node: float = self.number_of_edges / num_nodes if num_nodes else 0
+        self.in_degrees = _distribution(in_degrees)
+        self.out_degrees = _distribution(out_degrees)
+
+    def to_dict(self):
+        return {
+            'number_of_nodes': self.number_of_nodes,
+            'number_of_edges': self.number_of_edges,
+            'number_of_unique_edges': self.number_of_unique_edges,
+            'number_of_isolated_nodes': self.number_of_isolated_nodes,
+            'average_edges_per_node': self.average_edges_per_node,
+            'in_degrees': self.in_degrees,
+            'out_degrees': self.out_degrees,
+        }
+
+class ClustersMetrics:
+    def __init__(self, clusters_info: ClustersInformation) -> None:
+        clusters = clusters_info.clusters
+        self.cluster_ids: list[int] = [cluster.id for cluster in clusters]
+        self.cluster_sizes = np.fromiter((len(cluster.nodes) for cluster in clusters), dtype=np.int64, count=len(clusters))
+        self.intra_cluster_edges = np.fromiter((len(cluster.intra_cluster_edges) for cluster in clusters), dtype=np.int64, count=len(clusters))
+        self.number_of_clusters: int = len(clusters)
+        self.number_of_intra_cluster_edges: int = int(self.intra_cluster_edges.sum())
+        self.number_of_inter_cluster_edges: int = len(clusters_info.inter_cluster_edges)
+        self.total_number_of_edges: int = self.number_of_intra_cluster_edges + self.number_of_inter_cluster_edges
+        self.percentage_of_inter_cluster_edges: float = (self.number_of_inter_cluster_edges / self.total_number_of_edges * 100
+                                                         if self.total_number_of_edges else None)
+
+        sorted_sizes = np.sort(self.cluster_sizes)
+        # Cluster size statistics over all clusters and over the clusters with more than 2 and 5 nodes
+        self.size_statistics = dict()
+        for label, minimum in (('all', 0), ('more_than_2_nodes', 3), ('more_than_5_nodes', 6)):
+            sizes = sorted_sizes[np.searchsorted(sorted_sizes, minimum):]
+            self.size_statistics[label] = {
+                'number_of_clusters': len(sizes),
+                'average_number_of_nodes': _mean(sizes),
+                'median_number_of_nodes': _upper_median(sizes),
+            }
+        self.size_percentiles = {f'p{percentile}': value for percentile, value in
+                                 zip(CLUSTER_SIZE_PERCENTILES, np.percentile(sorted_sizes, CLUSTER_SIZE_PERCENTILES).tolist())} \
+            if len(sorted_sizes) else dict()
+
+    def to_dict(self):
+        return {
+            'number_of_clusters': self.number_of_clusters,
+            'number_of_intra_cluster_edges': self.number_of_intra_cluster_edges,
+            'number_of_inter_cluster_edges': self.number_of_inter_cluster_edges,
+            'total_number_of_edges': self.total_number_of_edges,
+            'percentage_of_inter_cluster_edges': self.percentage_of_inter_cluster_edges,
+            'size_statistics': self.size_statistics,
+            'size_percentiles': self.size_percentiles,
+            'clusters': [{'id': cluster_id, 'number_of_nodes': size, 'number_of_intra_cluster_edges': intra_edges}
+                         for cluster_id, size, intra_edges in zip(self.cluster_ids, self.cluster_sizes.tolist(), self.intra_cluster_edges.tolist())],
+        }
+
+class AnalysisMetrics:
+    '''
+    Statistics of the graph and of its clusters, and the quality of the clusters,
+    as logged at the end of an analysis and saved to metrics.json.
+    '''
+    def __init__(self, compact_graph: CompactGraph, clusters_info: ClustersInformation) -> None:
+        self.graph = GraphMetrics(compact_graph)
+        self.clusters = ClustersMetrics(clusters_info)
+        cluster_labels = np.zeros(compact_graph.num_nodes, dtype=np.int64)
+        for cluster in clusters_info.clusters:
+            cluster_labels[[compact_graph.node_ids[node.name] for node in cluster.nodes]] = cluster.id
+        self.quality = PartitionQuality(compact_graph.sparse_adjacency(), cluster_labels)
+
+    def to_dict(self):
+        return {
+            'graph': self.graph.to_dict(),
+            'clusters': self.clusters.to_dict(),
+            'quality': self.quality.to_dict(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=4)
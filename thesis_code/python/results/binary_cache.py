@@ -0,0 +1,335 @@
+'''
+Compact binary on-disk format for graphs and cluster partitions, stored alongside graph.json and clusters.json.
+
+Both files start with a fixed header holding the SHA-256 digest of the graph.json they were built from,
+followed by 8-byte aligned little-endian sections, so the edge arrays can be memory-mapped as is
+(e.g. with numpy.memmap) by other tools.
+
+Graph file sections:
+    string table offsets (uint64[S + 1]) and UTF-8 blob (S distinct strings)
+    node name string ids (int32[N])
+    method fields as string ids (int32[4 * M]: name, return type, declaring class, signature)
+    method parameter offsets (int32[M + 1]) and parameter (type, name) string ids (int32[2 * P])
+    edge source ids, destination ids, link method ids, source method ids (int32[E] each), weights (float64[E])
+
+Clusters file sections:
+    cluster offsets (int32[C + 1]) and member node ids of every cluster, in cluster order (int32[total])
+
+Integration point index sections:
+    string table offsets (uint64[S + 1]) and UTF-8 blob (S distinct strings)
+    class name string ids (int32[K])
+    method fields, parameter offsets and parameters, as in the graph file
+    source and destination class ids, source and destination cluster ids, link and source method ids (int32[I] each)
+    class postings: key string ids (int32[KC]), offsets (int32[KC + 1]) and point ids (int32[offsets[KC]])
+    method signature postings: key string ids (int32[KS]), offsets (int32[KS + 1]) and point ids (int32[offsets[KS]])
+    cluster pair postings: (source, destination) cluster ids (int32[2 * KP]), offsets (int32[KP + 1]) and point ids
+'''
+import mmap
+import os
+import struct
+import sys
+from array import array
+from results.compact_graph import CompactGraph, MethodTable
+from results.graph import Method
+from results.integration_index import IntegrationPointIndex, Postings
+
+GRAPH_MAGIC = b'TCSG'
+CLUSTERS_MAGIC = b'TCSC'
+INDEX_MAGIC = b'TCSI'
+FORMAT_VERSION = 1
+_GRAPH_HEADER = struct.Struct('<4sI32sQQQQQ')
+_CLUSTERS_HEADER = struct.Struct('<4sI32sQQ')
+_INDEX_HEADER = struct.Struct('<4sI32sQQQQQQQQ')
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def _write_section(file, data: bytes) -> None:
+    file.write(data)
+    file.write(b'\0' * (_aligned(len(data)) - len(data)))
+
+def _write_array(file, values: array) -> None:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    _write_section(file, values.tobytes())
+
+def _read_array(buffer, offset: int, typecode: str, count: int):
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    if end > len(buffer):
+        raise ValueError(f'Truncated file: a section ends at byte {end} of {len(buffer)}.')
+    values.frombytes(buffer[offset:end])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values, _aligned(end)
+
+def _read_header(buffer, header: struct.Struct, magic: bytes, graph_hash: bytes):
+    '''
+    Returns the unpacked header, or None if the file is not of the expected kind, version or graph hash.
+    '''
+    if len(buffer) < header.size:
+        return None
+    fields = header.unpack_from(buffer, 0)
+    if fields[0] != magic or fields[1] != FORMAT_VERSION or (graph_hash is not None and fields[2] != graph_hash):
+        return None
+    return fields
+
+class _StringTable:
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = dict()
+        self.strings: list[str] = list()
+
+    def intern(self, value: str) -> int:
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[value] = string_id
+            self.strings.append(value)
+        return string_id
+
+    def encode(self):
+        offsets = array('Q', [0])
+        blob = bytearray()
+        for value in self.strings:
+            blob += value.encode('utf-8')
+            offsets.append(len(blob))
+        return offsets, bytes(blob)
+
+def _encode_methods(strings: _StringTable, methods: MethodTable):
+    '''Returns the method fields, parameter offsets and parameters of a method table as string ids.'''
+    method_fields = array('i')
+    param_offsets = array('i', [0])
+    param_ids = array('i')
+    for name, parameters, return_type, declaring_class, signature in methods:
+        method_fields.extend((strings.intern(name), strings.intern(return_type),
+                              strings.intern(declaring_class), strings.intern(signature)))
+        for param_type, param_name in parameters:
+            param_ids.extend((strings.intern(param_type), strings.intern(param_name)))
+        param_offsets.append(len(param_ids) // 2)
+    return method_fields, param_offsets, param_ids
+
+def _read_strings(buffer, offset: int, num_strings: int, blob_size: int):
+    string_offsets, offset = _read_array(buffer, offset, 'Q', num_strings + 1)
+    blob = buffer[offset:offset + blob_size]
+    strings = [sys.intern(blob[string_offsets[i]:string_offsets[i + 1]].decode('utf-8')) for i in range(num_strings)]
+    return strings, _aligned(offset + blob_size)
+
+def _read_methods(buffer, offset: int, strings: list[str], num_methods: int, methods: MethodTable):
+    '''Reads the method sections into a method table, returns the offset after them.'''
+    method_fields, offset = _read_array(buffer, offset, 'i', 4 * num_methods)
+    param_offsets, offset = _read_array(buffer, offset, 'i', num_methods + 1)
+    param_ids, offset = _read_array(buffer, offset, 'i', 2 * param_offsets[-1])
+    for method_id in range(num_methods):
+        name, return_type, declaring_class, signature = method_fields[4 * method_id:4 * method_id + 4]
+        parameters = ((strings[param_ids[2 * i]], strings[param_ids[2 * i + 1]])
+                      for i in range(param_offsets[method_id], param_offsets[method_id + 1]))
+        methods.intern_fields(strings[name], parameters, strings[return_type], strings[declaring_class], strings[signature])
+    return offset
+
+class _StoredMethods:
+    '''
+    Method table of an index file, read as its string ids: the Method objects of the few methods a query
+    returns are built on demand, like the views of a MethodTable, instead of interning every method at load time.
+    '''
+    __slots__ = ('_strings', '_method_fields', '_param_offsets', '_param_ids', '_views')
+
+    def __init__(self, strings: list[str], method_fields, param_offsets, param_ids) -> None:
+        self._strings = strings
+        self._method_fields = method_fields
+        self._param_offsets = param_offsets
+        self._param_ids = param_ids
+        self._views: dict[int, Method] = dict()
+
+    def _entry(self, method_id: int):
+        strings, param_ids = self._strings, self._param_ids
+        name, return_type, declaring_class, signature = self._method_fields[4 * method_id:4 * method_id + 4]
+        parameters = tuple((strings[param_ids[2 * i]], strings[param_ids[2 * i + 1]])
+                           for i in range(self._param_offsets[method_id], self._param_offsets[method_id + 1]))
+        return strings[name], parameters, strings[return_type], strings[declaring_class], strings[signature]
+
+    def get(self, method_id: int) -> Method:
+        method = self._views.get(method_id)
+        if method is None:
+            name, parameters, return_type, declaring_class, signature = self._entry(method_id)
+            method_parameters = [{'type': param_type, 'name': param_name} for param_type, param_name in parameters]
+            method = Method(name, method_parameters, return_type, declaring_class, signature)
+            self._views[method_id] = method
+        return method
+
+    def __len__(self) -> int:
+        return len(self._param_offsets) - 1
+
+    def __iter__(self):
+        return (self._entry(method_id) for method_id in range(len(self)))
+
+def write_compact_graph(compact_graph: CompactGraph, file_path: str, graph_hash: bytes) -> None:
+    '''
+    Writes a CompactGraph to the binary graph format, keyed on the hash of the graph.json it was loaded from.
+    '''
+    strings = _StringTable()
+    node_name_ids = array('i', (strings.intern(name) for name in compact_graph.node_names))
+    method_fields, param_offsets, param_ids = _encode_methods(strings, compact_graph.methods)
+    string_offsets, blob = strings.encode()
+
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        _write_section(file, _GRAPH_HEADER.pack(GRAPH_MAGIC, FORMAT_VERSION, graph_hash, len(strings.strings),
+                                                len(blob), compact_graph.num_nodes, len(compact_graph.methods),
+                                                compact_graph.num_edges))
+        _write_array(file, string_offsets)
+        _write_section(file, blob)
+        _write_array(file, node_name_ids)
+        _write_array(file, method_fields)
+        _write_array(file, param_offsets)
+        _write_array(file, param_ids)
+        for edge_array in (compact_graph.src, compact_graph.dst, compact_graph.link_method,
+                           compact_graph.source_method, compact_graph.weight):
+            _write_array(file, edge_array)
+    os.replace(tmp_path, file_path)
+
+def read_compact_graph(file_path: str, graph_hash: bytes):
+    '''
+    Reads a CompactGraph from the binary graph format.
+    Returns None if the file does not exist or was not built from the graph.json with the given hash.
+    '''
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return None
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        header = _read_header(buffer, _GRAPH_HEADER, GRAPH_MAGIC, graph_hash)
+        if header is None:
+            return None
+        _, _, _, num_strings, blob_size, num_nodes, num_methods, num_edges = header
+        offset = _aligned(_GRAPH_HEADER.size)
+
+        strings, offset = _read_strings(buffer, offset, num_strings, blob_size)
+        node_name_ids, offset = _read_array(buffer, offset, 'i', num_nodes)
+
+        compact_graph = CompactGraph()
+        for string_id in node_name_ids:
+            compact_graph.add_node(strings[string_id])
+        offset = _read_methods(buffer, offset, strings, num_methods, compact_graph.methods)
+
+        compact_graph.src, offset = _read_array(buffer, offset, 'i', num_edges)
+        compact_graph.dst, offset = _read_array(buffer, offset, 'i', num_edges)
+        compact_graph.link_method, offset = _read_array(buffer, offset, 'i', num_edges)
+        compact_graph.source_method, offset = _read_array(buffer, offset, 'i', num_edges)
+        compact_graph.weight, offset = _read_array(buffer, offset, 'd', num_edges)
+    return compact_graph
+
+def read_graph_hash(file_path: str):
+    '''
+    Returns the hash of the graph.json a binary graph file was built from, or None if there is no valid file.
+    '''
+    if not os.path.exists(file_path) or os.path.getsize(file_path) < _GRAPH_HEADER.size:
+        return None
+    with open(file_path, 'rb') as file:
+        magic, version, graph_hash, *_ = _GRAPH_HEADER.unpack(file.read(_GRAPH_HEADER.size))
+    if magic != GRAPH_MAGIC or version != FORMAT_VERSION:
+        return None
+    return graph_hash
+
+def write_partition(communities: list[list[int]], file_path: str, graph_hash: bytes) -> None:
+    '''
+    Writes a partition, given as the ordered member node ids of every cluster, to the binary clusters format.
+    '''
+    offsets = array('i', [0])
+    members = array('i')
+    for community in communities:
+        members.extend(community)
+        offsets.append(len(members))
+
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        _write_section(file, _CLUSTERS_HEADER.pack(CLUSTERS_MAGIC, FORMAT_VERSION, graph_hash, len(communities), len(members)))
+        _write_array(file, offsets)
+        _write_array(file, members)
+    os.replace(tmp_path, file_path)
+
+def read_partition(file_path: str, graph_hash: bytes):
+    '''
+    Reads a partition from the binary clusters format as the ordered member node ids of every cluster.
+    Returns None if the file does not exist or was not built from the graph.json with the given hash.
+    '''
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return None
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        header = _read_header(buffer, _CLUSTERS_HEADER, CLUSTERS_MAGIC, graph_hash)
+        if header is None:
+            return None
+        _, _, _, num_clusters, num_members = header
+        offset = _aligned(_CLUSTERS_HEADER.size)
+        offsets, offset = _read_array(buffer, offset, 'i', num_clusters + 1)
+        members, offset = _read_array(buffer, offset, 'i', num_members)
+    return [members[offsets[i]:offsets[i + 1]].tolist() for i in range(num_clusters)]
+
+def write_integration_index(index: IntegrationPointIndex, file_path: str, graph_hash: bytes) -> None:
+    '''
+    Writes an integration point index to the binary index format, keyed on the hash of the graph.json of its clusters.
+    '''
+    strings = _StringTable()
+    class_name_ids = array('i', (strings.intern(name) for name in index.class_names))
+    method_fields, param_offsets, param_ids = _encode_methods(strings, index.methods)
+    class_keys = array('i', (strings.intern(key) for key in index.by_class.keys))
+    signature_keys = array('i', (strings.intern(key) for key in index.by_signature.keys))
+    pair_keys = array('i', (cluster_id for key in index.by_cluster_pair.keys for cluster_id in key))
+    string_offsets, blob = strings.encode()
+
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        _write_section(file, _INDEX_HEADER.pack(INDEX_MAGIC, FORMAT_VERSION, graph_hash, len(strings.strings), len(blob),
+                                                len(index.class_names), len(index.methods), index.number_of_points,
+                                                len(class_keys), len(signature_keys), len(index.by_cluster_pair.keys)))
+        _write_array(file, string_offsets)
+        _write_section(file, blob)
+        _write_array(file, class_name_ids)
+        _write_array(file, method_fields)
+        _write_array(file, param_offsets)
+        _write_array(file, param_ids)
+        for point_array in (index.source, index.destination, index.source_cluster, index.destination_cluster,
+                            index.link_method, index.source_method):
+            _write_array(file, point_array)
+        for keys, postings in ((class_keys, index.by_class), (signature_keys, index.by_signature), (pair_keys, index.by_cluster_pair)):
+            _write_array(file, keys)
+            _write_array(file, postings.offsets)
+            _write_array(file, postings.point_ids)
+    os.replace(tmp_path, file_path)
+
+def read_integration_index(file_path: str, graph_hash: bytes = None):
+    '''
+    Reads an integration point index from the binary index format. Returns None if the file does not exist, or if
+    a graph hash is given and the index was not built from the graph.json with that hash.
+    '''
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return None
+    with open(file_path, 'rb') as file:
+        buffer = file.read()
+    header = _read_header(buffer, _INDEX_HEADER, INDEX_MAGIC, graph_hash)
+    if header is None:
+        return None
+    _, _, _, num_strings, blob_size, num_classes, num_methods, num_points, num_class_keys, num_signature_keys, num_pair_keys = header
+    offset = _aligned(_INDEX_HEADER.size)
+
+    strings, offset = _read_strings(buffer, offset, num_strings, blob_size)
+    class_name_ids, offset = _read_array(buffer, offset, 'i', num_classes)
+    method_fields, offset = _read_array(buffer, offset, 'i', 4 * num_methods)
+    param_offsets, offset = _read_array(buffer, offset, 'i', num_methods + 1)
+    param_ids, offset = _read_array(buffer, offset, 'i', 2 * param_offsets[-1])
+    methods = _StoredMethods(strings, method_fields, param_offsets, param_ids)
+    point_arrays = list()
+    for _ in range(6):
+        point_array, offset = _read_array(buffer, offset, 'i', num_points)
+        point_arrays.append(point_array)
+
+    postings = list()
+    for num_keys, key_size in ((num_class_keys, 1), (num_signature_keys, 1), (num_pair_keys, 2)):
+        keys, offset = _read_array(buffer, offset, 'i', key_size * num_keys)
+        offsets, offset = _read_array(buffer, offset, 'i', num_keys + 1)
+        point_ids, offset = _read_array(buffer, offset, 'i', offsets[-1])
+        if key_size == 1:
+            keys = [strings[string_id] for string_id in keys]
+        else:
+            keys = list(zip(keys[0::2], keys[1::2]))
+        postings.append(Postings(keys, offsets, point_ids))
+
+    return IntegrationPointIndex([strings[string_id] for string_id in class_name_ids], *point_arrays, methods, *postings)
@@ -1,3 +1,4 @@
+import numpy as np
 from  results.graph import Node, Edge
 
 class Cluster:
@@ -24,7 +25,8 @@ class Cluster:
         return self.id == other.id and self.nodes == other.nodes and self.intra_cluster_edges == other.intra_cluster_edges
 
     def __hash__(self):
-        return hash((self.id, self.nodes, self.intra_cluster_edges))
+        # Equal clusters have the same id and nodes, the edges are left out of the hash
+        return hash((self.id, tuple(self.nodes)))
 
 class ClustersInformation:
     def __init__(self, clusters):
@@ -38,5 +40,58 @@ class ClustersInformation:
         if not isinstance(other, ClustersInformation):
             return NotImplemented
         return set(self.clusters) == set(other.clusters)
+
     def __hash__(self):
-            return hash((self.clusters))
+        return hash(frozenset(self.clusters))
+
+class ClustersDelta:
+    def __init__(self, added_nodes, removed_nodes, changed_clusters, removed_cluster_ids,
+                 added_inter_cluster_edges, removed_inter_cluster_edges):
+        self.added_nodes: list[str] = added_nodes
+        self.removed_nodes: list[str] = removed_nodes
+        self.changed_clusters: list[Cluster] = changed_clusters
+        self.removed_cluster_ids: list[int] = removed_cluster_ids
+        self.added_inter_cluster_edges: list[Edge] = added_inter_cluster_edges
+        self.removed_inter_cluster_edges: list[Edge] = removed_inter_cluster_edges
+
+    def __str__(self):
+        return (f'Clusters Delta: {len(self.changed_clusters)} changed clusters, {len(self.removed_cluster_ids)} removed clusters, '
+                f'{len(self.added_inter_cluster_edges)} added and {len(self.removed_inter_cluster_edges)} removed inter-cluster edges')
+
+class ClusterTree:
+    '''
+    Clusters of a graph at every aggregation level of a hierarchical clustering, from the finest level 1 to the
+    final partition. The levels are nested: every cluster of a level lies in one cluster of the next level.
+    '''
+    def __init__(self, algorithm, node_names, memberships, edge_merge_levels, modularities):
+        self.algorithm: str = algorithm
+        self.node_names: list[str] = node_names
+        # Cluster id (from 1) of every node at every level
+        self.memberships: list[np.ndarray] = memberships
+        # First level at which the endpoints of every edge of the graph are in the same cluster,
+        # number_of_levels + 1 for the edges between clusters at every level
+        self.edge_merge_levels: np.ndarray = edge_merge_levels
+        self.modularities: list[float] = modularities
+
+    @property
+    def number_of_levels(self):
+        return len(self.memberships)
+
+    def number_of_clusters(self, level: int):
+        return int(self.memberships[level - 1].max(initial=0))
+
+    def parents(self, level: int):
+        '''Cluster id at the next level of every cluster of a level (index id - 1), or None for the last level.'''
+        if level == self.number_of_levels:
+            return None
+        parents = np.zeros(self.number_of_clusters(level), dtype=np.int64)
+        parents[self.memberships[level - 1] - 1] = self.memberships[level]
+        return parents
+
+    def inter_cluster_edge_ids(self, level: int):
+        '''Ids of the edges of the graph between clusters of the given level.'''
+        return np.flatnonzero(self.edge_merge_levels > level)
+
+    def __str__(self):
+        return (f'Cluster Tree: {self.number_of_levels} levels of '
+                f'{", ".join(str(self.number_of_clusters(level)) for level in range(1, self.number_of_levels + 1))} clusters')
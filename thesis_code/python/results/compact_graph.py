@@ -0,0 +1,236 @@
+import sys
+from array import array
+from results.graph import Graph, Node, Edge, Method
+
+class MethodTable:
+    '''
+    Deduplicated table of methods. Edges of a CompactGraph reference its entries by index.
+    Method objects are only built when a view is requested and are shared between edges.
+    '''
+    __slots__ = ('_index', '_entries', '_views')
+
+    def __init__(self) -> None:
+        self._index: dict[tuple, int] = dict()
+        self._entries: list[tuple] = list()
+        self._views: list = list()
+
+    def intern_fields(self, name, parameters, return_type, declaring_class, signature) -> int:
+        '''
+        Returns the index of the method described by the given fields, adding it to the table if needed.
+        The parameters are a sequence of (type, name) pairs.
+        '''
+        key = (name, tuple(parameters), return_type, declaring_class, signature)
+        method_id = self._index.get(key)
+        if method_id is None:
+            method_id = len(self._entries)
+            self._index[key] = method_id
+            self._entries.append(key)
+            self._views.append(None)
+        return method_id
+
+    def intern(self, method: Method) -> int:
+        parameters = ((param.get('type', ''), param.get('name', '')) for param in method.parameters)
+        return self.intern_fields(method.name, parameters, method.return_type, method.declaring_class, method.signature)
+
+    def get(self, method_id: int) -> Method:
+        method = self._views[method_id]
+        if method is None:
+            name, parameters, return_type, declaring_class, signature = self._entries[method_id]
+            method_parameters = [{'type': param_type, 'name': param_name} for param_type, param_name in parameters]
+            method = Method(name, method_parameters, return_type, declaring_class, signature)
+            self._views[method_id] = method
+        return method
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        '''
+        Iterates over the entries as (name, parameters, return_type, declaring_class, signature) tuples.
+        '''
+        return iter(self._entries)
+
+class CollapsedEdges:
+    '''
+    Parallel edges of a CompactGraph merged into one weighted edge per (source, destination) pair,
+    in the order of their first call site. The weight of a collapsed edge is the sum of the weights of its
+    call sites, whose edge ids are kept grouped per collapsed edge (call_site_ids[offsets[i]:offsets[i + 1]]).
+    '''
+    __slots__ = ('src', 'dst', 'weight', 'call_site_offsets', 'call_site_ids')
+
+    def __init__(self, src, dst, weight, call_site_offsets, call_site_ids) -> None:
+        self.src = src
+        self.dst = dst
+        self.weight = weight
+        self.call_site_offsets = call_site_offsets
+        self.call_site_ids = call_site_ids
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.src)
+
+    def call_sites(self, collapsed_edge_id: int):
+        '''Returns the ids of the edges of the compact graph merged into the given collapsed edge.'''
+        return self.call_site_ids[self.call_site_offsets[collapsed_edge_id]:self.call_site_offsets[collapsed_edge_id + 1]]
+
+    def __str__(self):
+        return f'{len(self.call_site_ids)} call site edges collapsed into {self.num_edges} weighted edges.'
+
+class CompactGraph:
+    '''
+    Array-backed graph representation with interned integer node ids.
+    Edges are stored as parallel arrays of source id, destination id, weight
+    and the indexes of their link and source methods in the method table.
+    '''
+    __slots__ = ('node_names', 'node_ids', 'src', 'dst', 'weight', 'link_method', 'source_method', 'methods',
+                 '_derived_representations')
+
+    def __init__(self) -> None:
+        self.node_names: list[str] = list()
+        self.node_ids: dict[str, int] = dict()
+        self.src = array('i')
+        self.dst = array('i')
+        self.weight = array('d')
+        self.link_method = array('i')
+        self.source_method = array('i')
+        self.methods = MethodTable()
+        # Representations derived from the graph (igraph, NetworkX, ...), dropped when the graph changes
+        self._derived_representations: dict = dict()
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_names)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.src)
+
+    def add_node(self, name: str) -> int:
+        '''
+        Returns the id of the node with the given name, adding it if it is not in the graph yet.
+        '''
+        node_id = self.node_ids.get(name)
+        if node_id is None:
+            node_id = len(self.node_names)
+            name = sys.intern(name)
+            self.node_ids[name] = node_id
+            self.node_names.append(name)
+            if self._derived_representations:
+                self._derived_representations.clear()
+        return node_id
+
+    def add_edge(self, src_id: int, dst_id: int, link_method_id: int, source_method_id: int, weight=1) -> None:
+        self.src.append(src_id)
+        self.dst.append(dst_id)
+        self.weight.append(weight)
+        self.link_method.append(link_method_id)
+        self.source_method.append(source_method_id)
+        if self._derived_representations:
+            self._derived_representations.clear()
+
+    def derived_representation(self, key: str, build):
+        '''
+        Returns the representation of this graph cached under key, building it with build() on first use.
+        '''
+        representation = self._derived_representations.get(key)
+        if representation is None:
+            representation = build()
+            self._derived_representations[key] = representation
+        return representation
+
+    def as_numpy(self):
+        '''
+        Returns zero-copy NumPy views (src, dst, weight) of the edge arrays.
+        '''
+        import numpy as np
+        return (np.frombuffer(self.src, dtype=np.int32),
+                np.frombuffer(self.dst, dtype=np.int32),
+                np.frombuffer(self.weight, dtype=np.float64))
+
+    def collapsed_edges(self) -> CollapsedEdges:
+        '''
+        Returns the parallel edges of the graph merged into weighted edges, built once and cached on the graph.
+        '''
+        return self.derived_representation('collapsed_edges', self._collapse_edges)
+
+    def _collapse_edges(self) -> CollapsedEdges:
+        import numpy as np
+        src, dst, weight = self.as_numpy()
+        pair_keys = src.astype(np.int64) * max(self.num_nodes, 1) + dst
+        _, first_call_sites, pair_ids = np.unique(pair_keys, return_index=True, return_inverse=True)
+        # Number the pairs in the order of their first call site rather than in the order of their keys
+        order = np.argsort(first_call_sites, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        collapsed_ids = rank[pair_ids.ravel()]
+        call_site_ids = np.argsort(collapsed_ids, kind='stable').astype(np.int32)
+        call_site_offsets = np.concatenate(([0], np.cumsum(np.bincount(collapsed_ids, minlength=len(order)))))
+        first_call_sites = first_call_sites[order]
+        return CollapsedEdges(src[first_call_sites],
+                              dst[first_call_sites],
+                              np.bincount(collapsed_ids, weights=weight, minlength=len(order)),
+                              call_site_offsets,
+                              call_site_ids)
+
+    def sparse_adjacency(self):
+        '''
+        Returns the weighted adjacency matrix of the graph as a SciPy CSR matrix (rows are the sources),
+        the parallel edges summed, built once and cached on the graph.
+        '''
+        return self.derived_representation('sparse_adjacency', self._build_sparse_adjacency)
+
+    def _build_sparse_adjacency(self):
+        import scipy.sparse as sp
+        collapsed_edges = self.collapsed_edges()
+        return sp.csr_matrix((collapsed_edges.weight, (collapsed_edges.src, collapsed_edges.dst)), shape=(self.num_nodes, self.num_nodes))
+
+    def edge_view(self, edge_id: int, nodes: list[Node]) -> Edge:
+        weight = self.weight[edge_id]
+        return Edge(nodes[self.src[edge_id]],
+                    nodes[self.dst[edge_id]],
+                    self.methods.get(self.link_method[edge_id]),
+                    self.methods.get(self.source_method[edge_id]),
+                    int(weight) if weight.is_integer() else weight)
+
+    def to_graph(self) -> Graph:
+        '''
+        Builds the object Graph view of this compact graph, as needed by the reports.
+        The view keeps this compact graph as its compact representation, so it is never converted back.
+        '''
+        nodes = [Node(name) for name in self.node_names]
+        edges = [self.edge_view(edge_id, nodes) for edge_id in range(self.num_edges)]
+        graph = Graph(nodes, edges)
+        graph.derived_representation('compact', lambda: self)
+        return graph
+
+    def graph_view(self) -> Graph:
+        '''
+        Returns the object Graph view of this compact graph, built once on first use and cached on the graph,
+        so that the clusters, reports and plots of an analysis share the same Node and Edge objects.
+        '''
+        return self.derived_representation('graph', self.to_graph)
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> 'CompactGraph':
+        compact_graph = cls()
+        for node in graph.nodes:
+            compact_graph.add_node(node.name)
+        for edge in graph.edges:
+            compact_graph.add_edge(compact_graph.node_ids[edge.source.name],
+                                   compact_graph.node_ids[edge.destination.name],
+                                   compact_graph.methods.intern(edge.method),
+                                   compact_graph.methods.intern(edge.source_method),
+                                   edge.weight)
+        return compact_graph
+
+    def __str__(self):
+        return f'Compact graph with {self.num_nodes} nodes, {self.num_edges} edges and {len(self.methods)} distinct methods.'
+
+def as_compact_graph(graph) -> CompactGraph:
+    '''
+    Returns the given graph as a CompactGraph, converting it if it is a Graph.
+    The conversion is cached on the Graph, so it is done once per graph.
+    '''
+    if isinstance(graph, CompactGraph):
+        return graph
+    return graph.derived_representation('compact', lambda: CompactGraph.from_graph(graph))
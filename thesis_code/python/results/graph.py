@@ -1,6 +1,8 @@
 import logging 
 
 class Method:
+    __slots__ = ('name', 'parameters', 'return_type', 'declaring_class', 'signature')
+
     def __init__(self, name, parameters, return_type, declaring_class, signature) -> None:
         if name is None:
             raise Exception('Name of a method must not be undefined.')
@@ -21,6 +23,8 @@ class Method:
         return f'{self.name}({params}): {self.return_type} @ {self.declaring_class}'
 
 class Attribute:
+    __slots__ = ('name', 'type')
+
     def __init__(self, name, typeAtt) -> None:
         if name is None:
             raise Exception('Name of an attribute must not be undefined.')
@@ -38,6 +42,8 @@ class Attribute:
         return f'{self.name}: {self.type}'
 
 class Node:
+    __slots__ = ('name',)
+
     def __init__(self, name) -> None:
         if name is None:
             raise Exception('Name of a node (class) must not be undefined.')
@@ -57,6 +63,8 @@ class Node:
         return f'Node: {self.name}'
 
 class Edge:
+    __slots__ = ('source', 'destination', 'method', 'source_method', 'weight')
+
     def __init__(self, source, destination, method, source_method, weight=1) -> None:
         if not isinstance(source, Node):
             raise Exception('Departure node of an edge must be of type Node.')
@@ -79,7 +87,7 @@ class Edge:
                (other.source, other.destination)
 
     def __hash__(self):
-        return hash((self.source, self.destination, self.weight))
+        return hash((self.source, self.destination))
 
     def __str__(self):
         return f'Edge: {self.source} -> {self.destination}, Weight: {self.weight}, Method: {self.method}'
@@ -88,32 +96,84 @@ class Graph:
     def __init__(self, nodes: list[Node], edges: list[Edge]) -> None:
         self.nodes = nodes
         self.edges = edges
+        # Indexes kept in sync by add_node/add_edge, keyed by node name
+        self._node_index: dict[str, Node] = dict()
+        self._incoming_edges: dict[str, list[Edge]] = dict()
+        self._outgoing_edges: dict[str, list[Edge]] = dict()
+        # Representations derived from the graph (compact arrays, igraph, ...), dropped when the graph changes
+        self._derived_representations: dict = dict()
+        for node in nodes:
+            self._index_node(node)
+        for edge in edges:
+            self._check_edge(edge)
+            self._index_edge(edge)
+
+    def _index_node(self, node: Node) -> None:
+        if node.name in self._node_index:
+            return
+        self._node_index[node.name] = node
+        self._incoming_edges[node.name] = list()
+        self._outgoing_edges[node.name] = list()
+
+    def _check_edge(self, edge: Edge) -> None:
+        if edge.source.name not in self._node_index:
+            raise Exception(f'Graph does not have the source node {edge.source} in its nodes.')
+        if edge.destination.name not in self._node_index:
+            raise Exception(f'Graph does not have the destination node {edge.destination} in its nodes.')
+
+    def _index_edge(self, edge: Edge) -> None:
+        self._outgoing_edges[edge.source.name].append(edge)
+        self._incoming_edges[edge.destination.name].append(edge)
+
+    @staticmethod
+    def _name_of(node) -> str:
+        return node.name if isinstance(node, Node) else node
 
     def add_node(self, node: Node) -> None:
         self.nodes.append(node)
+        self._index_node(node)
+        self._derived_representations.clear()
 
     def add_edge(self, edge: Edge) -> None:
-        if edge.source not in [n.name for n in self.nodes]:
-            raise Exception(f'Graph does not have the source node {edge.departure} in its nodes.')
-        if edge.destination not in [n.name for n in self.nodes]:
-            raise Exception(f'Graph does not have the destination node {edge.destination} in its nodes.')        
+        self._check_edge(edge)
         self.edges.append(edge)
+        self._index_edge(edge)
+        self._derived_representations.clear()
+
+    def derived_representation(self, key: str, build):
+        '''
+        Returns the representation of this graph cached under key, building it with build() on first use.
+        '''
+        representation = self._derived_representations.get(key)
+        if representation is None:
+            representation = build()
+            self._derived_representations[key] = representation
+        return representation
+
+    def has_node(self, node) -> bool:
+        return self._name_of(node) in self._node_index
+
+    def incoming_edges(self, node) -> list[Edge]:
+        return self._incoming_edges.get(self._name_of(node), [])
+
+    def outgoing_edges(self, node) -> list[Edge]:
+        return self._outgoing_edges.get(self._name_of(node), [])
+
+    def in_degree(self, node) -> int:
+        return len(self.incoming_edges(node))
+
+    def out_degree(self, node) -> int:
+        return len(self.outgoing_edges(node))
 
     def count_isolated_nodes(self):
         isolated_nodes = [node for node in self.nodes if self.is_isolated(node)]
         return len(isolated_nodes)
     
     def is_isolated(self, node):
-        for edge in self.edges:
-            if edge.source == node or edge.destination == node:
-                return False
-        return True
+        return self.in_degree(node) == 0 and self.out_degree(node) == 0
 
     def average_edges(self):
-        edges_count = {node: 0 for node in self.nodes}
-        for edge in self.edges:
-            edges_count[edge.destination] += 1
-        return sum(edges_count.values()) / len(self.nodes)
+        return sum(self.all_incoming_edges_per_node()) / len(self.nodes)
 
     def median_incoming_edges_per_node(self):
         incoming_edges_counts = self.all_incoming_edges_per_node()
@@ -124,19 +184,13 @@ class Graph:
         return self.calculate_median(outgoing_edges_counts)
 
     def all_incoming_edges_per_node(self):
-        incoming_edges = {node: 0 for node in self.nodes}
-        for edge in self.edges:
-            incoming_edges[edge.destination] += 1
-        return list(incoming_edges.values())
+        return [len(edges) for edges in self._incoming_edges.values()]
 
     def all_outgoing_edges_per_node(self):
-        outgoing_edges = {node: 0 for node in self.nodes}
-        for edge in self.edges:
-            outgoing_edges[edge.source] += 1
-        return list(outgoing_edges.values())
+        return [len(edges) for edges in self._outgoing_edges.values()]
 
     def calculate_median(self, data):
-        data.sort()
+        data = sorted(data)
         n = len(data)
         if n % 2 == 1:
             return data[n // 2]
@@ -146,13 +200,10 @@ class Graph:
             return (mid1 + mid2) / 2
 
     def get_node_by_name(self, name: str) -> Node:
-        for node in self.nodes:
-            if node.name == name:
-                return node
-        logging.warning(f'Node with name {name} was not found.')
-        return None
+        node = self._node_index.get(name)
+        if node is None:
+            logging.warning(f'Node with name {name} was not found.')
+        return node
 
     def __str__(self):
         return f'Graph with {len(self.nodes)} nodes and {len(self.edges)} edges.'
-
-
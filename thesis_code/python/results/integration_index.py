@@ -0,0 +1,208 @@
+from bisect import bisect_left
+from array import array
+from results.graph import Method
+from results.compact_graph import MethodTable
+from results.cluster import ClustersInformation
+
+class IntegrationPoint:
+    '''
+    An inter-cluster edge: a call from a method of a class of one cluster to a method of a class of another cluster.
+    Its id is its position in the inter-cluster edges of the clusters report.
+    '''
+    __slots__ = ('id', 'source', 'destination', 'source_cluster', 'destination_cluster', 'link_method', 'source_method')
+
+    def __init__(self, id, source, destination, source_cluster, destination_cluster, link_method, source_method) -> None:
+        self.id: int = id
+        self.source: str = source
+        self.destination: str = destination
+        self.source_cluster: int = source_cluster
+        self.destination_cluster: int = destination_cluster
+        self.link_method: Method = link_method
+        self.source_method: Method = source_method
+
+    def __str__(self):
+        return (f'Integration point: {self.source} (cluster {self.source_cluster}) -> {self.destination} '
+                f'(cluster {self.destination_cluster}), Method: {self.link_method.declaring_class}.{self.link_method.signature}')
+
+class Postings:
+    '''
+    Ids of the integration points of every key of an index, the keys sorted:
+    the points of keys[i] are point_ids[offsets[i]:offsets[i + 1]], in the order of the inter-cluster edges.
+    '''
+    __slots__ = ('keys', 'offsets', 'point_ids')
+
+    def __init__(self, keys, offsets, point_ids) -> None:
+        self.keys: list = keys
+        self.offsets = offsets
+        self.point_ids = point_ids
+
+    @classmethod
+    def from_dict(cls, key_point_ids: dict) -> 'Postings':
+        keys = sorted(key_point_ids)
+        offsets = array('i', [0])
+        point_ids = array('i')
+        for key in keys:
+            point_ids.extend(key_point_ids[key])
+            offsets.append(len(point_ids))
+        return cls(keys, offsets, point_ids)
+
+    def find(self, key):
+        '''Returns the point ids of a key, empty if the key is not in the index.'''
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return self.point_ids[0:0]
+        return self.point_ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def prefix_range(self, prefix: str):
+        '''Returns the range of the keys starting with a prefix, which are contiguous in the sorted keys.'''
+        start = bisect_left(self.keys, prefix)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(prefix):
+            end += 1
+        return start, end
+
+    def find_prefix(self, prefix: str):
+        '''Returns the point ids of all keys starting with a prefix.'''
+        start, end = self.prefix_range(prefix)
+        return self.point_ids[self.offsets[start]:self.offsets[end]]
+
+class IntegrationPointIndex:
+    '''
+    The inter-cluster edges of a clustering, with their classes and methods, indexed for change impact queries:
+    on the classes they connect (their source and destination classes and the declaring classes of their methods),
+    on the signatures of their link and source methods, and on their (source, destination) cluster pair.
+    It is saved next to clusters.json in the binary format of results.binary_cache, so queries do not load the graph.
+    '''
+    def __init__(self, class_names, source, destination, source_cluster, destination_cluster, link_method, source_method,
+                 methods: MethodTable, by_class: Postings, by_signature: Postings, by_cluster_pair: Postings) -> None:
+        # Classes of the integration points, which source and destination reference by index
+        self.class_names: list[str] = class_names
+        self.source = source
+        self.destination = destination
+        self.source_cluster = source_cluster
+        self.destination_cluster = destination_cluster
+        self.link_method = link_method
+        self.source_method = source_method
+        self.methods = methods
+        self.by_class = by_class
+        self.by_signature = by_signature
+        self.by_cluster_pair = by_cluster_pair
+
+    @property
+    def number_of_points(self):
+        return len(self.source)
+
+    @classmethod
+    def from_clusters(cls, clusters_info: ClustersInformation) -> 'IntegrationPointIndex':
+        node_cluster_ids = {node.name: cluster.id for cluster in clusters_info.clusters for node in cluster.nodes}
+        class_ids = dict()
+        methods = MethodTable()
+        columns = [array('i') for _ in range(6)]
+        by_class, by_signature, by_cluster_pair = dict(), dict(), dict()
+        for point_id, edge in enumerate(clusters_info.inter_cluster_edges):
+            source = class_ids.setdefault(edge.source.name, len(class_ids))
+            destination = class_ids.setdefault(edge.destination.name, len(class_ids))
+            source_cluster = node_cluster_ids[edge.source.name]
+            destination_cluster = node_cluster_ids[edge.destination.name]
+            point = (source, destination, source_cluster, destination_cluster, methods.intern(edge.method), methods.intern(edge.source_method))
+            for column, value in zip(columns, point):
+                column.append(value)
+
+            for class_name in dict.fromkeys((edge.source.name, edge.destination.name,
+                                             edge.method.declaring_class, edge.source_method.declaring_class)):
+                by_class.setdefault(class_name, list()).append(point_id)
+            for signature in dict.fromkeys((edge.method.signature, edge.source_method.signature)):
+                by_signature.setdefault(signature, list()).append(point_id)
+            by_cluster_pair.setdefault((source_cluster, destination_cluster), list()).append(point_id)
+
+        return cls(list(class_ids), *columns, methods,
+                   Postings.from_dict(by_class), Postings.from_dict(by_signature), Postings.from_dict(by_cluster_pair))
+
+    def point(self, point_id: int) -> IntegrationPoint:
+        return IntegrationPoint(point_id,
+                                self.class_names[self.source[point_id]],
+                                self.class_names[self.destination[point_id]],
+                                self.source_cluster[point_id],
+                                self.destination_cluster[point_id],
+                                self.methods.get(self.link_method[point_id]),
+                                self.methods.get(self.source_method[point_id]))
+
+    def _points(self, point_ids):
+        return [self.point(point_id) for point_id in sorted(set(point_ids))]
+
+    def query_class(self, class_name: str, nested=True):
+        '''
+        Integration points touching a class: calls from or to it, or to or from its methods.
+        With nested, those of its nested classes too (and of all the classes of a package given as class_name).
+        '''
+        point_ids = list(self.by_class.find(class_name))
+        if nested:
+            point_ids.extend(self.by_class.find_prefix(class_name + '.'))
+        return self._points(point_ids)
+
+    def query_method(self, signature: str, declaring_class: str = None):
+        '''
+        Integration points whose link or source method has the given signature, e.g. plus(int),
+        and, if given, the given declaring class.
+        '''
+        point_ids = self.by_signature.find(signature)
+        if declaring_class is not None:
+            point_ids = [point_id for point_id in point_ids
+                         if any(method.signature == signature and method.declaring_class == declaring_class
+                                for method in (self.methods.get(self.link_method[point_id]), self.methods.get(self.source_method[point_id])))]
+        return self._points(point_ids)
+
+    def query_cluster_pair(self, source_cluster: int, destination_cluster: int, both_directions=False):
+        '''Integration points from one cluster to another, and back with both_directions.'''
+        point_ids = list(self.by_cluster_pair.find((source_cluster, destination_cluster)))
+        if both_directions:
+            point_ids.extend(self.by_cluster_pair.find((destination_cluster, source_cluster)))
+        return self._points(point_ids)
+
+    def classes_of_file(self, file_path: str):
+        '''
+        Classes of the index declared in a changed .java file: the longest dotted suffix of its path
+        (e.g. org.joda.time.DateTime for src/main/java/org/joda/time/DateTime.java) that is a class of the index,
+        with its nested classes. Returns an empty list for other files.
+        '''
+        if not file_path.endswith('.java'):
+            return list()
+        parts = file_path[:-len('.java')].replace('\\', '/').split('/')
+        for i in range(len(parts)):
+            class_name = '.'.join(parts[i:])
+            start, end = self.by_class.prefix_range(class_name + '.')
+            class_names = ([class_name] if len(self.by_class.find(class_name)) else list()) + self.by_class.keys[start:end]
+            if class_names:
+                return class_names
+        return list()
+
+    def query_changed_files(self, file_paths):
+        '''Integration points touching the classes declared in the given changed files.'''
+        point_ids = list()
+        for file_path in file_paths:
+            for class_name in self.classes_of_file(file_path):
+                point_ids.extend(self.by_class.find(class_name))
+        return self._points(point_ids)
+
+    def query(self, changed_files=(), classes=(), methods=(), cluster_pair=None, nested=True):
+        '''
+        Union of the integration points of the given changed files, classes (with their nested classes if nested),
+        methods (signatures like plus(int), or org.joda.time.DateTime.plus(int) to also match the declaring class)
+        and cluster pair, in both directions. The points are sorted by id.
+        '''
+        points = self.query_changed_files(changed_files)
+        for class_name in classes:
+            points.extend(self.query_class(class_name, nested))
+        for method in methods:
+            # The signature starts at the method name, the declaring class is what comes before it
+            qualified_name, parenthesis, parameters = method.partition('(')
+            declaring_class, _, name = qualified_name.rpartition('.')
+            points.extend(self.query_method(name + parenthesis + parameters, declaring_class or None))
+        if cluster_pair is not None:
+            points.extend(self.query_cluster_pair(*cluster_pair, both_directions=True))
+        points_by_id = {point.id: point for point in points}
+        return [points_by_id[point_id] for point_id in sorted(points_by_id)]
+
+    def __str__(self):
+        return (f'Integration point index: {self.number_of_points} integration points, {len(self.by_class.keys)} classes, '
+                f'{len(self.by_signature.keys)} method signatures, {len(self.by_cluster_pair.keys)} cluster pairs')
@@ -0,0 +1,136 @@
+'''
+Quality scores of partitions of a graph, on its sparse weighted adjacency matrix A and a label vector per partition.
+
+A partition into k clusters is its n x k indicator matrix S, and the k x k matrix S^T A S holds the weight of the calls
+from every cluster to every cluster, the calls inside the clusters on its diagonal: the modularity and the scores of
+every cluster follow from its diagonal and its row and column sums. Batches of partitions, e.g. the runs of a sweep,
+are scored together: the degrees of their clusters with one bincount and the weight inside them from their
+masks of intra-cluster edges, one block of edges at a time.
+'''
+import numpy as np
+from results.compact_graph import CompactGraph
+
+# Edges per block of the intra-cluster masks of a batch, which bounds their memory
+EDGE_BLOCK_SIZE = 1 << 16
+
+def labels_from_communities(communities, compact_graph: CompactGraph):
+    '''
+    Label vector of a partition given as communities of node names: the label of every node id is the index of its community.
+    Raises a ValueError when the communities do not cover exactly the nodes of the graph.
+    '''
+    labels = np.full(compact_graph.num_nodes, -1, dtype=np.int64)
+    number_of_members = 0
+    for label, community in enumerate(communities):
+        node_ids = [compact_graph.node_ids.get(name, -1) for name in community]
+        if -1 in node_ids:
+            raise ValueError(f'The partition has a class that is not in the graph: {list(community)[node_ids.index(-1)]}.')
+        labels[node_ids] = label
+        number_of_members += len(node_ids)
+    if number_of_members != compact_graph.num_nodes or (labels < 0).any():
+        raise ValueError('The partition does not cover every class of the graph exactly once.')
+    return labels
+
+def _edge_arrays(adjacency):
+    '''Sources, destinations and weights of the non-zero entries of a CSR adjacency matrix.'''
+    src = np.repeat(np.arange(adjacency.shape[0]), np.diff(adjacency.indptr))
+    return src, adjacency.indices, adjacency.data
+
+def batch_modularity(adjacency, labels: np.ndarray, resolution=1, directed=True):
+    '''
+    Modularity of every partition of a label matrix (one row of non-negative integer labels per partition).
+    Directed, as igraph and NetworkX on a directed graph: sum over the clusters of w_c / m - resolution * out_c * in_c / m^2,
+    with w_c the weight inside the cluster, out_c and in_c its weighted out and in-degrees and m the total weight.
+    Undirected, the calls taken without their direction: sum of w_c / m - resolution * ((out_c + in_c) / 2m)^2.
+    The modularity of a graph without edges is not defined (NaN).
+    '''
+    labels = np.atleast_2d(np.asarray(labels, dtype=np.int64))
+    number_of_partitions, num_nodes = labels.shape
+    src, dst, weight = _edge_arrays(adjacency)
+    m = weight.sum()
+    if m == 0 or num_nodes == 0:
+        return np.full(number_of_partitions, np.nan)
+
+    # Degrees of the clusters of all partitions at once, the labels of every partition offset past those of the previous ones
+    number_of_labels = labels.max(axis=1) + 1
+    offsets = np.concatenate(([0], np.cumsum(number_of_labels)[:-1]))
+    keys = (labels + offsets[:, None]).ravel()
+    cluster_out = np.bincount(keys, weights=np.tile(np.bincount(src, weights=weight, minlength=num_nodes), number_of_partitions),
+                              minlength=number_of_labels.sum())
+    cluster_in = np.bincount(keys, weights=np.tile(np.bincount(dst, weights=weight, minlength=num_nodes), number_of_partitions),
+                             minlength=number_of_labels.sum())
+    cluster_partitions = np.repeat(np.arange(number_of_partitions), number_of_labels)
+    if directed:
+        expected = np.bincount(cluster_partitions, weights=cluster_out * cluster_in, minlength=number_of_partitions) / m**2
+    else:
+        expected = np.bincount(cluster_partitions, weights=(cluster_out + cluster_in)**2, minlength=number_of_partitions) / (2 * m)**2
+
+    # One row of labels per node, so the labels of the endpoints of an edge are gathered in one contiguous read
+    node_labels = np.ascontiguousarray(labels.T)
+    intra_weight = np.zeros(number_of_partitions)
+    for start in range(0, len(weight), EDGE_BLOCK_SIZE):
+        end = min(start + EDGE_BLOCK_SIZE, len(weight))
+        intra_weight += (node_labels[src[start:end]] == node_labels[dst[start:end]]).T.astype(np.float64) @ weight[start:end]
+    return intra_weight / m - resolution * expected
+
+def modularity(adjacency, labels: np.ndarray, resolution=1, directed=True):
+    '''Modularity of one partition given as a label vector, see batch_modularity.'''
+    return float(batch_modularity(adjacency, labels, resolution, directed)[0])
+
+class PartitionQuality:
+    '''
+    Quality of one partition of a graph, from its coupling matrix S^T A S. Next to the directed and undirected modularity,
+    for every cluster (in the order of its label):
+    - cohesion: weight of the calls inside the cluster;
+    - coupling: weight of the calls from and to the other clusters;
+    - conductance: coupling over the smaller of the volumes (sum of the degrees) of the cluster and of the rest of the graph;
+    - inter-cluster edge density: pairs of classes calling each other across the boundary of the cluster
+      (one pair per direction) over all the pairs across it.
+    The inter-cluster edge density of the partition is that of the pairs of classes of different clusters.
+    '''
+    def __init__(self, adjacency, labels: np.ndarray, resolution=1) -> None:
+        import scipy.sparse as sp
+        num_nodes = adjacency.shape[0]
+        self.cluster_labels, cluster_index = np.unique(np.asarray(labels), return_inverse=True)
+        number_of_clusters = len(self.cluster_labels)
+        indicator = sp.csr_matrix((np.ones(num_nodes), (np.arange(num_nodes), cluster_index.ravel())), shape=(num_nodes, number_of_clusters))
+        coupling_matrix = (indicator.T @ adjacency @ indicator).tocsr()
+        pairs = adjacency.copy()
+        pairs.data = np.ones_like(pairs.data)
+        pair_matrix = (indicator.T @ pairs @ indicator).tocsr()
+
+        self.sizes = np.bincount(cluster_index.ravel(), minlength=number_of_clusters)
+        self.cohesion = coupling_matrix.diagonal()
+        cluster_out = np.asarray(coupling_matrix.sum(axis=1)).ravel()
+        cluster_in = np.asarray(coupling_matrix.sum(axis=0)).ravel()
+        self.coupling = cluster_out + cluster_in - 2 * self.cohesion
+        m = adjacency.data.sum()
+        volume = cluster_out + cluster_in
+        smaller_volume = np.minimum(volume, 2 * m - volume)
+        self.conductance = np.divide(self.coupling, smaller_volume, out=np.zeros(number_of_clusters), where=smaller_volume > 0)
+
+        intra_pairs = pair_matrix.diagonal()
+        crossing_pairs = np.asarray(pair_matrix.sum(axis=1)).ravel() + np.asarray(pair_matrix.sum(axis=0)).ravel() - 2 * intra_pairs
+        possible_pairs = 2 * self.sizes * (num_nodes - self.sizes)
+        self.inter_cluster_edge_density = np.divide(crossing_pairs, possible_pairs, out=np.zeros(number_of_clusters), where=possible_pairs > 0)
+        possible_inter_cluster_pairs = num_nodes**2 - np.dot(self.sizes, self.sizes)
+        self.total_inter_cluster_edge_density: float = ((pairs.nnz - intra_pairs.sum()) / possible_inter_cluster_pairs
+                                                        if possible_inter_cluster_pairs else 0.0)
+
+        self.modularity: float = None
+        self.undirected_modularity: float = None
+        if m > 0:
+            self.modularity = float(self.cohesion.sum() / m - resolution * np.dot(cluster_out, cluster_in) / m**2)
+            self.undirected_modularity = float(self.cohesion.sum() / m - resolution * np.dot(volume, volume) / (2 * m)**2)
+
+    def to_dict(self):
+        return {
+            'modularity': self.modularity,
+            'undirected_modularity': self.undirected_modularity,
+            'mean_conductance': self.conductance.mean().item() if len(self.conductance) else None,
+            'inter_cluster_edge_density': self.total_inter_cluster_edge_density,
+            'clusters': [{'id': label, 'number_of_nodes': size, 'cohesion': cohesion, 'coupling': coupling,
+                          'conductance': conductance, 'inter_cluster_edge_density': density}
+                         for label, size, cohesion, coupling, conductance, density in
+                         zip(self.cluster_labels.tolist(), self.sizes.tolist(), self.cohesion.tolist(), self.coupling.tolist(),
+                             self.conductance.tolist(), self.inter_cluster_edge_density.tolist())],
+        }
@@ -1,6 +1,7 @@
 import json
-from results.cluster import Cluster, ClustersInformation
+from results.cluster import Cluster, ClustersInformation, ClustersDelta, ClusterTree
 from results.graph import Graph, Edge, Node, Method
+from results.integration_index import IntegrationPoint
 
 def serialize_method(method: Method):
     if method is None:
@@ -33,6 +34,17 @@ def serialize_edge(edge: Edge):
     return edge_data
 
 
+def serialize_integration_point(point: IntegrationPoint):
+    return {
+        'id': point.id,
+        'source': point.source,
+        'destination': point.destination,
+        'source_cluster': point.source_cluster,
+        'destination_cluster': point.destination_cluster,
+        'link_method': serialize_method(point.link_method),
+        'source_method': serialize_method(point.source_method),
+    }
+
 def serialize_graph(graph: Graph):
     '''Serialize the entire Graph object into a structured dictionary.'''
     graph_data = {
@@ -56,3 +68,185 @@ def serialize_clusters_information(clusters_info: ClustersInformation):
         'inter_cluster_edges': [serialize_edge(edge) for edge in clusters_info.inter_cluster_edges]
     }
     return json.dumps(clusters_data, indent=4)
+
+def serialize_clusters_delta(clusters_delta: ClustersDelta, previous_graph_hash: str, graph_hash: str):
+    '''Serialize the ClustersDelta between the clusters of two versions of the graph into a structured dictionary.'''
+    delta_data = {
+        'previous_graph_hash': previous_graph_hash,
+        'graph_hash': graph_hash,
+        'added_nodes': clusters_delta.added_nodes,
+        'removed_nodes': clusters_delta.removed_nodes,
+        'changed_clusters': [serialize_cluster(cluster) for cluster in clusters_delta.changed_clusters],
+        'removed_cluster_ids': clusters_delta.removed_cluster_ids,
+        'added_inter_cluster_edges': [serialize_edge(edge) for edge in clusters_delta.added_inter_cluster_edges],
+        'removed_inter_cluster_edges': [serialize_edge(edge) for edge in clusters_delta.removed_inter_cluster_edges]
+    }
+    return json.dumps(delta_data, indent=4)
+
+def serialize_cluster_tree(cluster_tree: ClusterTree):
+    '''
+    Serialize a ClusterTree into a structured dictionary: the clusters of every level with their parent cluster,
+    the nodes of the clusters of level 1 and the child clusters of the others, and for every edge of the graph
+    the first level at which it is an intra-cluster edge.
+    '''
+    import numpy as np
+    levels = list()
+    for level in range(1, cluster_tree.number_of_levels + 1):
+        membership = cluster_tree.memberships[level - 1]
+        parents = cluster_tree.parents(level)
+        members = [list() for _ in range(cluster_tree.number_of_clusters(level))]
+        sizes = np.bincount(membership, minlength=len(members) + 1)[1:].tolist()
+        if level == 1:
+            for node_name, cluster_id in zip(cluster_tree.node_names, membership.tolist()):
+                members[cluster_id - 1].append(node_name)
+        else:
+            for child_id, cluster_id in enumerate(cluster_tree.parents(level - 1).tolist(), start=1):
+                members[cluster_id - 1].append(child_id)
+        levels.append({
+            'level': level,
+            'number_of_clusters': len(members),
+            'modularity': cluster_tree.modularities[level - 1],
+            'number_of_inter_cluster_edges': len(cluster_tree.inter_cluster_edge_ids(level)),
+            'clusters': [{'id': cluster_id,
+                          'parent': int(parents[cluster_id - 1]) if parents is not None else None,
+                          'number_of_nodes': size,
+                          'nodes' if level == 1 else 'children': cluster_members}
+                         for cluster_id, (cluster_members, size) in enumerate(zip(members, sizes), start=1)]
+        })
+    tree_data = {
+        'algorithm': cluster_tree.algorithm,
+        'number_of_levels': cluster_tree.number_of_levels,
+        'levels': levels,
+        'edge_merge_levels': cluster_tree.edge_merge_levels.tolist()
+    }
+    return json.dumps(tree_data, indent=4)
+
+def _method_key(method: Method):
+    return (method.name, tuple((param['type'], param['name']) for param in method.parameters),
+            method.return_type, method.declaring_class, method.signature)
+
+class _ReportWriter:
+    '''
+    Writes a report to a file piece by piece, with the layout of json.dumps(..., indent=indent), or compact
+    without whitespace when indent is None. In method table mode, methods are written once in a top-level
+    "methods" list and edges reference them by their index in that list.
+    '''
+    def __init__(self, file, indent=4, method_table=False) -> None:
+        self.file = file
+        self.indent = indent
+        self.separators = (',', ': ') if indent is not None else (',', ':')
+        self.method_ids: dict[tuple, int] = dict() if method_table else None
+        self.methods: list[Method] = list()
+        # Serialized methods, keyed on the id of the Method object (kept alive in the cache) and the level
+        self._method_cache: dict[tuple, tuple] = dict()
+
+    def _newline(self, level):
+        return '' if self.indent is None else '\n' + ' ' * (self.indent * level)
+
+    def dumps(self, value, level):
+        text = json.dumps(value, indent=self.indent, separators=self.separators)
+        if self.indent and level:
+            text = text.replace('\n', self._newline(level))
+        return text
+
+    def write_value(self, value, level):
+        self.file.write(self.dumps(value, level))
+
+    def write_array(self, items, level, write_item):
+        self.file.write('[')
+        empty = True
+        for item in items:
+            self.file.write(('' if empty else ',') + self._newline(level + 1))
+            write_item(item, level + 1)
+            empty = False
+        self.file.write(']' if empty else self._newline(level) + ']')
+
+    def write_object(self, fields, level):
+        '''Writes an object from (key, write_value) pairs, where write_value(level) writes the value of the key.'''
+        self.file.write('{')
+        for position, (key, write_field) in enumerate(fields):
+            self.file.write((',' if position else '') + self._newline(level + 1) + json.dumps(key) + self.separators[1])
+            write_field(level + 1)
+        self.file.write((self._newline(level) if fields else '') + '}')
+
+    def add_methods(self, edges):
+        '''Adds the methods of the edges to the method table.'''
+        for edge in edges:
+            for method in (edge.method, edge.source_method):
+                if method is None:
+                    continue
+                key = _method_key(method)
+                if key not in self.method_ids:
+                    self.method_ids[key] = len(self.methods)
+                    self.methods.append(method)
+
+    def _method_text(self, method, level):
+        '''Serialized method, or its index in the method table, as it is written at the given level.'''
+        cached = self._method_cache.get((id(method), level))
+        if cached is None:
+            if self.method_ids is None:
+                text = self.dumps(serialize_method(method), level)
+            else:
+                text = str(self.method_ids[_method_key(method)])
+            cached = (method, text)
+            self._method_cache[(id(method), level)] = cached
+        return cached[1]
+
+    def write_edge(self, edge: Edge, level):
+        newline = self._newline(level + 1)
+        item_separator, key_separator = self.separators
+        parts = [newline + '"source"' + key_separator + json.dumps(edge.source.name),
+                 newline + '"destination"' + key_separator + json.dumps(edge.destination.name)]
+        if edge.method is not None:
+            parts.append(newline + '"link_method"' + key_separator + self._method_text(edge.method, level + 1))
+        if edge.source_method is not None:
+            parts.append(newline + '"source_method"' + key_separator + self._method_text(edge.source_method, level + 1))
+        self.file.write('{' + item_separator.join(parts) + self._newline(level) + '}')
+
+    def write_edges(self, edges, level):
+        self.write_array(edges, level, self.write_edge)
+
+    def write_nodes(self, nodes, level):
+        self.write_array(nodes, level, lambda node, node_level: self.write_value(serialize_node(node), node_level))
+
+    def write_methods(self, level):
+        self.write_array(self.methods, level, lambda method, method_level: self.write_value(serialize_method(method), method_level))
+
+    def write_cluster(self, cluster: Cluster, level):
+        self.write_object([
+            ('id', lambda field_level: self.write_value(cluster.id, field_level)),
+            ('nodes', lambda field_level: self.write_nodes(cluster.nodes, field_level)),
+            ('intra_cluster_edges', lambda field_level: self.write_edges(cluster.intra_cluster_edges, field_level)),
+        ], level)
+
+def write_graph(graph: Graph, file, indent=4, method_table=False):
+    '''
+    Stream the Graph object to a file as JSON, with the same content as serialize_graph.
+    indent=None writes compact JSON. With method_table, the methods are written once in a "methods" list
+    and the link_method and source_method of the edges are indexes in that list.
+    '''
+    writer = _ReportWriter(file, indent, method_table)
+    fields = list()
+    if method_table:
+        writer.add_methods(graph.edges)
+        fields.append(('methods', writer.write_methods))
+    fields.append(('nodes', lambda level: writer.write_nodes(graph.nodes, level)))
+    fields.append(('edges', lambda level: writer.write_edges(graph.edges, level)))
+    writer.write_object(fields, 0)
+
+def write_clusters_information(clusters_info: ClustersInformation, file, indent=4, method_table=False):
+    '''
+    Stream the ClustersInformation object to a file as JSON, with the same content as serialize_clusters_information.
+    indent=None writes compact JSON. With method_table, the methods are written once in a "methods" list
+    and the link_method and source_method of the edges are indexes in that list.
+    '''
+    writer = _ReportWriter(file, indent, method_table)
+    fields = list()
+    if method_table:
+        for cluster in clusters_info.clusters:
+            writer.add_methods(cluster.intra_cluster_edges)
+        writer.add_methods(clusters_info.inter_cluster_edges)
+        fields.append(('methods', writer.write_methods))
+    fields.append(('clusters', lambda level: writer.write_array(clusters_info.clusters, level, writer.write_cluster)))
+    fields.append(('inter_cluster_edges', lambda level: writer.write_edges(clusters_info.inter_cluster_edges, level)))
+    writer.write_object(fields, 0)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are imported from thesis_code/python, as when its scripts are run
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
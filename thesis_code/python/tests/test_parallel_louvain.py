@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from results.compact_graph import CompactGraph
+from pipeline_tools.cluster_analysis import parallel_louvain
+from pipeline_tools.cluster_analysis.parallel_louvain import parallel_louvain_membership, _chunks, _LevelGraph
+
+def planted_partition_graph(num_nodes=4000, num_communities=40, num_edges=24000, intra_probability=0.8, seed=0):
+    '''Compact graph of communities of consecutive nodes, most edges drawn inside a community.'''
+    rng = np.random.default_rng(seed)
+    community_size = num_nodes // num_communities
+    src = rng.integers(num_nodes, size=num_edges)
+    intra = rng.random(num_edges) < intra_probability
+    dst = np.where(intra, src // community_size * community_size + rng.integers(community_size, size=num_edges),
+                   rng.integers(num_nodes, size=num_edges))
+    compact_graph = CompactGraph()
+    for node in range(num_nodes):
+        compact_graph.add_node(f'org.example.Class{node}')
+    method_id = compact_graph.methods.intern_fields('call', (), 'void', 'org.example.Class0', 'call()')
+    for source, destination in zip(src.tolist(), dst.tolist()):
+        compact_graph.add_edge(source, destination, method_id, method_id)
+    return compact_graph
+
+@pytest.fixture(scope='module')
+def compact_graph():
+    return planted_partition_graph()
+
+def level_graph(compact_graph):
+    collapsed_edges = compact_graph.collapsed_edges()
+    return _LevelGraph(compact_graph.num_nodes, collapsed_edges.src.astype(np.int64), collapsed_edges.dst.astype(np.int64),
+                       collapsed_edges.weight)
+
+def test_chunks_cover_the_nodes_and_follow_the_workers(compact_graph):
+    graph = level_graph(compact_graph)
+    for workers in (1, 2, 8):
+        chunks = _chunks(graph, workers)
+        assert chunks[0][0] == 0 and chunks[-1][1] == graph.num_nodes
+        assert all(last == next_first for (_, last), (next_first, _) in zip(chunks, chunks[1:]))
+        assert len(chunks) == min(workers * parallel_louvain.CHUNKS_PER_WORKER, graph.num_nodes // parallel_louvain.MIN_CHUNK_SIZE)
+
+def test_seeded_partition_does_not_depend_on_the_workers(compact_graph, monkeypatch):
+    # Small chunks, so that every number of workers splits the levels differently
+    monkeypatch.setattr(parallel_louvain, 'MIN_CHUNK_SIZE', 64)
+    reference = parallel_louvain_membership(compact_graph, seed=7, workers=1)
+    for workers in (2, 3, 8):
+        assert parallel_louvain_membership(compact_graph, seed=7, workers=workers) == reference
+
+def test_planted_communities_are_found(compact_graph):
+    membership = np.array(parallel_louvain_membership(compact_graph, seed=7, workers=2))
+    planted = np.arange(compact_graph.num_nodes) // 100
+    # Most nodes are in the community of most of the nodes of their planted community
+    majority = np.array([np.bincount(membership[planted == community]).argmax() for community in range(40)])
+    assert (membership == majority[planted]).mean() > 0.9